@@ -9,8 +9,59 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.utils.module_loading import import_string
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'contries_info.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+class AsyncAPIHandler(ASGIHandler):
+    """
+    Handler of the native async JSON API, running COUNTRIES_ASYNC_API_MIDDLEWARE only.
+
+    Django runs every sync-only middleware hook in a single shared thread
+    under ASGI, which serializes requests; the async API does not need
+    sessions, CSRF, messages or auth, so its stack is kept async-capable.
+    """
+
+    def load_middleware(self, is_async=False):
+        """Like ``BaseHandler.load_middleware``, from COUNTRIES_ASYNC_API_MIDDLEWARE, async-capable only"""
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+
+        get_response = self._get_response_async if is_async else self._get_response
+        handler = convert_exception_to_response(get_response)
+        for middleware_path in reversed(settings.COUNTRIES_ASYNC_API_MIDDLEWARE):
+            middleware = import_string(middleware_path)
+            if not getattr(middleware, 'async_capable', False):
+                raise ImproperlyConfigured(
+                    f'{middleware_path} is not async-capable, it cannot be in COUNTRIES_ASYNC_API_MIDDLEWARE'
+                )
+            instance = middleware(handler)
+            if hasattr(instance, 'process_view'):
+                self._view_middleware.insert(0, self.adapt_method_mode(is_async, instance.process_view))
+            if hasattr(instance, 'process_template_response'):
+                self._template_response_middleware.append(
+                    self.adapt_method_mode(is_async, instance.process_template_response)
+                )
+            if hasattr(instance, 'process_exception'):
+                self._exception_middleware.append(self.adapt_method_mode(False, instance.process_exception))
+            handler = convert_exception_to_response(instance)
+        self._middleware_chain = handler
+
+
+async_api_application = AsyncAPIHandler()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'].startswith('/async/api/'):
+        await async_api_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'countries.middleware.DatasetCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'contries_info.urls'
@@ -61,6 +63,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'contries_info.wsgi.application'
+ASGI_APPLICATION = 'contries_info.asgi.application'
 
 
 # Database
@@ -73,6 +76,84 @@ DATABASES = {
     }
 }
 
+# Database profile, from the environment: 'development' keeps the SQLite
+# defaults, 'production' tunes it for many concurrent readers next to ingests
+COUNTRIES_DB_PROFILE = os.environ.get('COUNTRIES_DB_PROFILE', 'development')
+# PRAGMAs run on every new SQLite connection (countries.db.apply_pragmas)
+COUNTRIES_SQLITE_PRAGMAS = {}
+
+if COUNTRIES_DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        # Seconds a writer waits for a lock before 'database is locked'
+        'OPTIONS': {'timeout': 20},
+        # Keep connections open between requests, checked before reuse
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    })
+    COUNTRIES_SQLITE_PRAGMAS = {
+        # Readers no longer block on (or block) the writer; persists in the file
+        'journal_mode': 'wal',
+        # Durable across crashes in WAL mode, fsync only at checkpoints
+        'synchronous': 'normal',
+        # 64 MiB page cache and 256 MiB of memory-mapped reads per connection
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'memory',
+    }
+elif COUNTRIES_DB_PROFILE != 'development':
+    raise ValueError(f'Unknown COUNTRIES_DB_PROFILE {COUNTRIES_DB_PROFILE!r}')
+
+# Read replica, from the environment: path of the read-only copy written by
+# publish_snapshot. Reads of the countries app are served from it, writes
+# and fetch_countries go to 'default'
+COUNTRIES_READ_REPLICA = os.environ.get('COUNTRIES_READ_REPLICA')
+# PRAGMAs added on replica connections, whatever the profile
+COUNTRIES_REPLICA_PRAGMAS = {
+    'cache_size': -65536,
+    'mmap_size': 268435456,
+}
+
+if COUNTRIES_READ_REPLICA:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        # Immutable: no locks or change checks, a new file is published instead
+        'NAME': Path(os.path.abspath(COUNTRIES_READ_REPLICA)).as_uri() + '?mode=ro&immutable=1',
+        # Kept open until a new replica is published
+        'CONN_MAX_AGE': None,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['countries.routers.ReadReplicaRouter']
+
+# Caches: a per-process LRU (countries.cache.TieredCache) in front of the
+# 'shared' cache of all processes. That is Redis when COUNTRIES_CACHE_URL is
+# set in the environment (redis://host:6379/0, needs the redis package), else
+# files under .cache/ as a stand-in shared by the processes of one host
+COUNTRIES_CACHE_URL = os.environ.get('COUNTRIES_CACHE_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'countries.cache.TieredCache',
+        'LOCATION': 'countries',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'SHARED': 'shared',
+            # Entries and seconds an entry is kept by the per-process LRU
+            'MAX_ENTRIES': 500,
+            'LOCAL_TIMEOUT': 60,
+            # Seconds other processes wait for the one building a missing entry
+            'LOCK_TIMEOUT': 10,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': COUNTRIES_CACHE_URL,
+    } if COUNTRIES_CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -104,6 +185,34 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Countries API: serve reads from an in-process snapshot, rebuilt once the
+# dataset version changes (after writes/ingests)
+COUNTRIES_SNAPSHOT = True
+# Build country JSON from values() rows (orjson when installed) instead of
+# CountrySerializer + JSONRenderer; the output is identical
+COUNTRIES_FAST_JSON = True
+# Seconds a process trusts its cached dataset version before re-reading it
+COUNTRIES_VERSION_TTL = 5
+# HTTP caching of the paths below: ETag/Last-Modified from the dataset version,
+# Cache-Control max-age and stale-while-revalidate in seconds
+COUNTRIES_CACHED_PATHS = ('/api/countries/', '/web/', '/async/')
+COUNTRIES_CACHE_MAX_AGE = 60
+COUNTRIES_CACHE_STALE_WHILE_REVALIDATE = 300
+# Middleware of the native async JSON API under /async/api/ (ASGI only), keep
+# it async-capable: sync-only middleware is run in one shared thread
+COUNTRIES_ASYNC_API_MIDDLEWARE = ['countries.middleware.DatasetCacheMiddleware']
+# Default output of the export_static command
+COUNTRIES_STATIC_EXPORT_ROOT = BASE_DIR / 'static_export'
+# Cache-Control max-age of /api/countries/autocomplete/ responses
+COUNTRIES_AUTOCOMPLETE_MAX_AGE = 300
+# Most codes accepted by one /api/countries/batch/ lookup
+COUNTRIES_BATCH_MAX_CODES = 1000
+# Countries read and encoded per chunk by /api/countries/export/
+COUNTRIES_EXPORT_CHUNK_SIZE = 100
+# Seconds the web pages (per user) and their country fragments (shared) stay
+# cached; keyed by the dataset version, so ingests retire them. 0 disables
+COUNTRIES_PAGE_CACHE_TIMEOUT = 300
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
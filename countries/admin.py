@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Country, NativeName, Currency, Language, Translation, Demonym, IDD, CapitalInfo
+from .models import Country, NativeName, Currency, Language, Translation, Demonym, IDD, CapitalInfo, SourceState, DatasetVersion
 
 class CurrencyInline(admin.TabularInline):
     model = Currency
@@ -20,4 +20,6 @@ admin.site.register(NativeName)
 admin.site.register(Translation)
 admin.site.register(Demonym)
 admin.site.register(IDD)
-admin.site.register(CapitalInfo)
\ No newline at end of file
+admin.site.register(CapitalInfo)
+admin.site.register(SourceState)
+admin.site.register(DatasetVersion)
@@ -0,0 +1,135 @@
+"""
+Native async read path, mounted under ``/async/`` for ASGI deployments.
+
+The views answer from the preloaded snapshot and only leave the event loop
+when it has to be rebuilt (or, for the web pages, to load the user), so a
+single ASGI process can keep thousands of idle keep-alive clients without
+a thread each. Responses are byte-identical to the JSON of the sync API,
+localized names included; pagination, field selection and the browsable
+API stay on the sync path.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+
+from .locales import content_language, request_locale
+from .search import get_search_index
+from .snapshot import aget_snapshot
+from .views import detail_page_context, list_page_context
+
+
+def require_get(view):
+    """``require_GET`` for async views (Django only wraps them from 5.0 on); HEAD is allowed too"""
+    @functools.wraps(view)
+    async def inner(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        return await view(request, *args, **kwargs)
+    return inner
+
+
+def json_response(snapshot, body, locale=None):
+    response = HttpResponse(body, content_type='application/json')
+    response['X-Snapshot-Generation'] = str(snapshot.generation)
+    patch_vary_headers(response, ('Accept-Language',))
+    if locale is not None:
+        response['Content-Language'] = content_language(locale[1])
+    return response
+
+
+def render_countries(request, snapshot, codes):
+    """JSON list of ``codes`` in the language asked for, and the ``(LocaleNames, language)`` used"""
+    locale = request_locale(request, snapshot)
+    if locale is None:
+        return snapshot.render(codes), None
+    return locale[0].render(snapshot, locale[1], codes), locale
+
+
+def error_response(data, status):
+    # Compact like the DRF renderer
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+def not_found():
+    return error_response({'detail': 'Not found.'}, status=404)
+
+
+@require_get
+async def country_list_api(request):
+    snapshot = await aget_snapshot()
+    locale = request_locale(request, snapshot)
+    if locale is None:
+        return json_response(snapshot, snapshot.list_json)
+    return json_response(snapshot, locale[0].render(snapshot, locale[1], snapshot.order), locale)
+
+
+@require_get
+async def country_retrieve_api(request, cca2):
+    snapshot = await aget_snapshot()
+    if cca2 not in snapshot.json:
+        return not_found()
+    locale = request_locale(request, snapshot)
+    rendered = snapshot.json if locale is None else locale[0].json(snapshot, locale[1])
+    return json_response(snapshot, rendered[cca2], locale)
+
+
+@require_get
+async def regional_api(request, cca2):
+    snapshot = await aget_snapshot()
+    if cca2 not in snapshot.data:
+        return not_found()
+    return json_response(snapshot, *render_countries(request, snapshot, snapshot.regional(cca2)))
+
+
+@require_get
+async def by_language_api(request):
+    language_code = request.GET.get('language')
+    if not language_code:
+        return error_response({"error": "Language code parameter is required"}, status=400)
+    snapshot = await aget_snapshot()
+    return json_response(snapshot, *render_countries(request, snapshot, snapshot.by_language.get(language_code, ())))
+
+
+@require_get
+async def search_api(request):
+    query = request.GET.get('q')
+    if not query:
+        return error_response({"error": "Search query parameter 'q' is required"}, status=400)
+    snapshot = await aget_snapshot()
+    return json_response(snapshot, *render_countries(request, snapshot, get_search_index(snapshot).search(query)))
+
+
+async def logged_in_user(request):
+    """The user of a session, or None; the session and user lookups are the only queries of the pages"""
+    user = await sync_to_async(get_user)(request)
+    return user if user.is_authenticated else None
+
+
+def render_page(request, user, template_name, context):
+    return HttpResponse(render_to_string(template_name, {**context, 'user': user}, request=request))
+
+
+async def country_list(request):
+    user = await logged_in_user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+    snapshot = await aget_snapshot()
+    query = request.GET.get('q', '').strip()
+    context = list_page_context(snapshot, query, request_locale(request, snapshot))
+    return render_page(request, user, 'countries/country_list.html', context)
+
+
+async def country_detail(request, cca2):
+    user = await logged_in_user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+    snapshot = await aget_snapshot()
+    if cca2 not in snapshot.data:
+        raise Http404
+    context = detail_page_context(snapshot, cca2, request_locale(request, snapshot))
+    return render_page(request, user, 'countries/country_detail.html', context)
@@ -0,0 +1,203 @@
+"""
+Two-tier cache: a per-process LRU in front of a cache shared by all processes.
+
+``TieredCache`` is a Django cache backend (see ``CACHES``). Reads try the
+process's own LRU (one per ``LOCATION``, shared by its threads), bounded by
+``MAX_ENTRIES`` and ``LOCAL_TIMEOUT``, then the ``SHARED`` cache alias (Redis
+in production, files or local memory as a stand-in), copying shared hits
+into the LRU. Writes go to both tiers.
+``get_or_set`` builds a missing entry once: threads of a process wait on a
+per-key lock and other processes on a lock entry in the shared cache, so a
+dataset version flip does not make every worker render the same page.
+
+Keys of data derived from the dataset embed its version (``dataset_key``),
+so an ingest moves every process to new keys instead of deleting old ones;
+a deletion only reaches the LRUs of other processes after ``LOCAL_TIMEOUT``.
+"""
+import os
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .versioning import current_version
+
+_MISSING = object()
+
+# Per-key build locks, striped so their number stays fixed
+_FLIGHT_LOCKS = 64
+# Seconds between checks of a process waiting for another one's build
+_POLL_INTERVAL = 0.05
+
+
+class _LocalTier:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.flights = [threading.Lock() for _ in range(_FLIGHT_LOCKS)]
+        self.stats = Counter()
+
+
+# LOCATION -> _LocalTier; Django creates a backend instance per thread
+_tiers = {}
+
+
+def dataset_key(*parts, version=None):
+    """``countries:<dataset version>:<parts>``, a new key space after every ingest"""
+    if version is None:
+        version = current_version()[0]
+    return ':'.join(['countries', str(version), *map(str, parts)])
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self._lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        tier = _tiers.setdefault(location, _LocalTier())
+        self._local, self._lock, self._flights, self._stats = tier.entries, tier.lock, tier.flights, tier.stats
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def stats(self):
+        """Counters of this process: local_hits, shared_hits, misses, evictions, builds, waits"""
+        with self._lock:
+            return {**self._stats, 'entries': len(self._local)}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, pickled = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+            self._stats['local_hits'] += 1
+        return pickle.loads(pickled)
+
+    def _local_set(self, key, value, timeout):
+        expires_at = self.get_backend_timeout(timeout)
+        local_expires_at = time.time() + self._local_timeout
+        if expires_at is None or expires_at > local_expires_at:
+            expires_at = local_expires_at
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[key] = (expires_at, pickled)
+            self._local.move_to_end(key)
+            while len(self._local) > self._max_entries:
+                self._local.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _local_delete(self, key):
+        with self._lock:
+            return self._local.pop(key, None) is not None
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count('misses')
+            return default
+        self._count('shared_hits')
+        self._local_set(local_key, value, self.default_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        self.shared.set(key, value, timeout, version=version)
+        if timeout == 0:
+            self._local_delete(local_key)
+        else:
+            self._local_set(local_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if not self.shared.add(key, value, timeout, version=version):
+            return False
+        self._local_set(self.make_and_validate_key(key, version=version), value, timeout)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        deleted = self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version) or deleted
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """Like ``BaseCache.get_or_set``, building a missing value once across threads and processes"""
+        value = self.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            return value
+        local_key = self.make_and_validate_key(key, version=version)
+        flight = self._flights[hash(local_key) % _FLIGHT_LOCKS]
+        lock_key = f'{key}:building'
+        with flight:
+            # Built by another thread while this one waited
+            value = self._local_get(local_key)
+            if value is not _MISSING:
+                return value
+            if self.shared.add(lock_key, os.getpid(), self._lock_timeout, version=version):
+                try:
+                    return self._build(key, default, timeout, version)
+                finally:
+                    self.shared.delete(lock_key, version=version)
+        # Another process is building it; wait without the stripe so other keys are not held up
+        value = self._wait(key, lock_key, version)
+        if value is not _MISSING:
+            return value
+        with flight:
+            value = self._local_get(local_key)
+            if value is not _MISSING:
+                return value
+            return self._build(key, default, timeout, version)
+
+    def _build(self, key, default, timeout, version):
+        value = default() if callable(default) else default
+        self._count('builds')
+        self.set(key, value, timeout, version=version)
+        return value
+
+    def _wait(self, key, lock_key, version):
+        """The value another process is building, or _MISSING once it gives up or LOCK_TIMEOUT passes"""
+        deadline = time.monotonic() + self._lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(_POLL_INTERVAL)
+            value = self.shared.get(key, _MISSING, version=version)
+            if value is not _MISSING:
+                self._count('waits')
+                self._local_set(self.make_and_validate_key(key, version=version), value, self.default_timeout)
+                return value
+            if not self.shared.has_key(lock_key, version=version):
+                break
+        return _MISSING
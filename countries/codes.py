@@ -0,0 +1,45 @@
+"""
+Resolution of mixed country codes (cca2, cca3, ccn3 or cioc) to cca2.
+"""
+from django.db.models import Q
+
+from .models import Country
+from .snapshot import per_generation
+
+# Lowest precedence first: a cca3 wins over another country's identical cioc
+CODE_FIELDS = ('cioc', 'cca3', 'ccn3', 'cca2')
+
+
+def code_key(code):
+    """Canonical form of a code as typed: upper case, numeric codes zero-padded to 3 digits"""
+    code = code.strip().upper()
+    return code.zfill(3) if code.isdigit() else code
+
+
+class CodeIndex:
+    """Every code of a set of countries, mapped to their cca2"""
+
+    def __init__(self, rows, generation=None):
+        self.generation = generation
+        rows = list(rows)
+        self.codes = {}
+        for field in CODE_FIELDS:
+            for row in rows:
+                if row[field]:
+                    self.codes[code_key(row[field])] = row['cca2']
+
+    def resolve(self, codes):
+        """The cca2 of each code, None for unknown codes, in the order given"""
+        return [self.codes.get(code_key(code)) for code in codes]
+
+
+get_code_index = per_generation(lambda snapshot: CodeIndex(snapshot.data.values(), snapshot.generation))
+
+
+def query_code_index(codes):
+    """A ``CodeIndex`` of just the countries matching ``codes``, from one indexed query"""
+    keys = {code_key(code) for code in codes}
+    condition = Q()
+    for field in CODE_FIELDS:
+        condition |= Q(**{f'{field}__in': keys})
+    return CodeIndex(Country.objects.filter(condition).values('cca2', *CODE_FIELDS[:-1]))
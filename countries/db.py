@@ -0,0 +1,31 @@
+"""
+SQLite connection tuning, see the ``COUNTRIES_DB_PROFILE`` settings.
+"""
+from django.conf import settings
+
+from .routers import REPLICA
+
+# Journal and durability settings, meaningless on the read-only, immutable replica
+WRITE_PRAGMAS = ('journal_mode', 'synchronous', 'journal_size_limit', 'wal_autocheckpoint', 'auto_vacuum')
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """Run ``COUNTRIES_SQLITE_PRAGMAS`` (plus ``COUNTRIES_REPLICA_PRAGMAS`` on the replica) on new connections"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(getattr(settings, 'COUNTRIES_SQLITE_PRAGMAS', {}))
+    if connection.alias == REPLICA:
+        pragmas = {name: value for name, value in pragmas.items() if name not in WRITE_PRAGMAS}
+        pragmas.update(getattr(settings, 'COUNTRIES_REPLICA_PRAGMAS', {}))
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            # Names and values come from settings, PRAGMA takes no parameters
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def pragma(connection, name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA {name}')
+        return cursor.fetchone()[0]
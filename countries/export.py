@@ -0,0 +1,165 @@
+"""
+Streaming bulk export of all countries as NDJSON, CSV or an Arrow IPC stream.
+
+Countries are produced in chunks of ``COUNTRIES_EXPORT_CHUNK_SIZE``, from the
+snapshot when it is enabled, else by iterating the table and loading the
+related rows of one chunk at a time, and each chunk is encoded and sent
+before the next is read. NDJSON lines carry the country as the detail
+endpoint returns it; CSV and Arrow rows are flat, with the codes of the
+currencies and languages joined by ``;`` and one column per translation
+and demonym language.
+"""
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.db import models
+
+try:
+    import pyarrow
+except ImportError:  # optional, only needed for format=arrow
+    pyarrow = None
+
+from . import fastjson
+from .models import Country, Demonym, Translation
+from .serializers import CountrySerializer, country_field_names
+
+# format -> (content type, file extension)
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+LIST_SEPARATOR = ';'
+
+
+def chunk_size():
+    return getattr(settings, 'COUNTRIES_EXPORT_CHUNK_SIZE', 100)
+
+
+def iter_chunks(snapshot=None):
+    """Lists of country dicts, shaped like the API output, in cca2 order"""
+    size = chunk_size()
+    if snapshot is not None:
+        codes = sorted(snapshot.order)
+        for start in range(0, len(codes), size):
+            yield [snapshot.data[code] for code in codes[start:start + size]]
+        return
+
+    codes = []
+    for code in Country.objects.order_by('cca2').values_list('cca2', flat=True).iterator(chunk_size=size):
+        codes.append(code)
+        if len(codes) == size:
+            yield fastjson.country_rows(Country.objects.filter(cca2__in=codes).order_by('cca2'))
+            codes = []
+    if codes:
+        yield fastjson.country_rows(Country.objects.filter(cca2__in=codes).order_by('cca2'))
+
+
+class FlatLayout:
+    """Columns of the flat (CSV and Arrow) export and how to fill them from a country dict"""
+
+    def __init__(self, snapshot=None):
+        self.scalars = [name for name in country_field_names() if name not in CountrySerializer.nested_fields]
+        if snapshot is not None:
+            countries = snapshot.data.values()
+            translations = {item['language_code'] for country in countries for item in country['translations']}
+            demonyms = {item['language_code'] for country in countries for item in country['demonyms']}
+        else:
+            translations = set(Translation.objects.values_list('language_code', flat=True).distinct())
+            demonyms = set(Demonym.objects.values_list('language_code', flat=True).distinct())
+        self.translations = sorted(translations)
+        self.demonyms = sorted(demonyms)
+        self.columns = (
+            self.scalars + ['currencies', 'languages']
+            + [f'translation_{code}' for code in self.translations]
+            + [column for code in self.demonyms for column in (f'demonym_{code}_m', f'demonym_{code}_f')]
+        )
+
+    def row(self, country):
+        values = [country[name] for name in self.scalars]
+        values.append(LIST_SEPARATOR.join(item['code'] for item in country['currencies']))
+        values.append(LIST_SEPARATOR.join(item['code'] for item in country['languages']))
+        translations = {item['language_code']: item['common'] for item in country['translations']}
+        values.extend(translations.get(code) for code in self.translations)
+        demonyms = {item['language_code']: item for item in country['demonyms']}
+        for code in self.demonyms:
+            demonym = demonyms.get(code, {})
+            values.extend((demonym.get('masculine'), demonym.get('feminine')))
+        return values
+
+    def arrow_schema(self):
+        fields = {field.name: field for field in Country._meta.concrete_fields}
+        types = []
+        for column in self.columns:
+            field = fields.get(column)
+            if isinstance(field, models.BooleanField):
+                types.append(pyarrow.bool_())
+            elif isinstance(field, models.IntegerField):
+                types.append(pyarrow.int64())
+            elif isinstance(field, models.FloatField):
+                types.append(pyarrow.float64())
+            else:
+                types.append(pyarrow.string())
+        return pyarrow.schema(list(zip(self.columns, types)))
+
+
+def csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+    return value
+
+
+def arrow_cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+    return value
+
+
+def stream_ndjson(snapshot=None):
+    for chunk in iter_chunks(snapshot):
+        if snapshot is not None:
+            yield b''.join(snapshot.json[country['cca2']] + b'\n' for country in chunk)
+        else:
+            yield b''.join(fastjson.dumps(country) + b'\n' for country in chunk)
+
+
+def stream_csv(snapshot=None):
+    layout = FlatLayout(snapshot)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(layout.columns)
+    for chunk in iter_chunks(snapshot):
+        for country in chunk:
+            writer.writerow([csv_cell(value) for value in layout.row(country)])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def stream_arrow(snapshot=None):
+    layout = FlatLayout(snapshot)
+    schema = layout.arrow_schema()
+    sink = io.BytesIO()
+    writer = pyarrow.ipc.new_stream(sink, schema)
+    for chunk in iter_chunks(snapshot):
+        rows = [layout.row(country) for country in chunk]
+        columns = [
+            pyarrow.array([arrow_cell(row[i]) for row in rows], type=field.type)
+            for i, field in enumerate(schema)
+        ]
+        writer.write_batch(pyarrow.record_batch(columns, schema=schema))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    writer.close()
+    yield sink.getvalue()
+
+
+STREAMS = {'ndjson': stream_ndjson, 'csv': stream_csv, 'arrow': stream_arrow}
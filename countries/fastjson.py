@@ -0,0 +1,91 @@
+"""
+Serializer-free rendering of countries, enabled with ``COUNTRIES_FAST_JSON``.
+
+``country_rows()`` assembles the same dicts as ``CountrySerializer`` from
+``values()`` rows (one query per model, no field objects) and ``dumps()``
+encodes them with orjson when it is installed. The output matches
+``JSONRenderer().render(CountrySerializer(...).data)`` byte for byte,
+which ``tests.FastJsonTests`` checks.
+"""
+import json
+
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+from .serializers import CountrySerializer, country_field_names
+
+
+def is_enabled():
+    return getattr(settings, 'COUNTRIES_FAST_JSON', False)
+
+
+def _escape_separators(encoded):
+    # Like JSONRenderer, keep the output a strict JavaScript subset
+    return encoded.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def dumps(data):
+    """Compact UTF-8 JSON, as rendered by DRF's JSONRenderer with the default settings"""
+    if orjson is not None:
+        return _escape_separators(orjson.dumps(data))
+    encoded = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+    return _escape_separators(encoded)
+
+
+_nested = None
+
+
+def nested_relations():
+    """``(name, model, output fields)`` of each nested relation, fields in serializer order"""
+    global _nested
+    if _nested is None:
+        serializer = CountrySerializer()
+        _nested = tuple(
+            (name, serializer.fields[name].child.Meta.model, tuple(serializer.fields[name].child.fields))
+            for name in CountrySerializer.nested_fields
+        )
+    return _nested
+
+
+def country_rows(queryset, fields=None, locale=None):
+    """
+    Countries of ``queryset`` as the dicts ``CountrySerializer(fields=fields)`` would produce.
+
+    Related rows are listed in primary key order, the order the prefetching
+    serializer path returns them in. ``locale`` is a ``(LocaleNames, language)``
+    pair to localize the names with.
+    """
+    names = country_field_names()
+    if fields is not None:
+        names = [name for name in names if name in fields]
+    nested = [relation for relation in nested_relations() if relation[0] in names]
+    columns = [name for name in names if name not in CountrySerializer.nested_fields]
+
+    countries = list(queryset.prefetch_related(None).values('cca2', *columns))
+    if not countries:
+        return []
+    codes = [country['cca2'] for country in countries]
+
+    related = {}
+    for name, model, output in nested:
+        values = [field if field != 'country' else 'country_id' for field in output]
+        rows = related[name] = {}
+        for row in model.objects.filter(country_id__in=codes).order_by('pk').values_list(*values):
+            item = dict(zip(output, row))
+            rows.setdefault(item['country'], []).append(item)
+
+    results = []
+    for country in countries:
+        cca2 = country['cca2']
+        row = {
+            name: related[name].get(cca2, []) if name in related else country[name]
+            for name in names
+        }
+        if locale is not None:
+            row = locale[0].localize(row, locale[1], cca2)
+        results.append(row)
+    return results
@@ -0,0 +1,85 @@
+"""
+Land-border graph of the snapshot countries, built from the ``Border`` rows.
+
+Breadth-first searches from every country are run once per snapshot
+generation, so neighbor, k-hop, route and component queries are plain
+dict lookups at request time.
+"""
+from collections import deque
+
+from .models import Border
+from .snapshot import per_generation
+
+
+class BorderGraph:
+    """Undirected adjacency graph of the countries sharing a land border"""
+
+    def __init__(self, snapshot):
+        self.generation = snapshot.generation
+        self.order = snapshot.order
+        self.names = {code: snapshot.data[code]['common_name'] for code in snapshot.order}
+        self.cca3 = {code: snapshot.data[code]['cca3'] for code in snapshot.order}
+        self.by_cca3 = by_cca3 = {cca3: code for code, cca3 in self.cca3.items()}
+
+        adjacency = {code: set() for code in snapshot.order}
+        # Loaded once per snapshot generation, like the searches below
+        for code, cca3 in Border.objects.values_list('country_id', 'neighbour_cca3'):
+            neighbor = by_cca3.get(cca3)
+            if code in adjacency and neighbor is not None and neighbor != code:
+                adjacency[code].add(neighbor)
+                adjacency[neighbor].add(code)
+        self.adjacency = {code: tuple(sorted(adjacency[code])) for code in snapshot.order}
+
+        # source -> {reachable country: (hops, previous country on a shortest path)}
+        self.paths = {code: self._bfs(code) for code in snapshot.order}
+
+        components, seen = [], set()
+        for code in snapshot.order:
+            if code not in seen:
+                members = tuple(c for c in snapshot.order if c in self.paths[code])
+                seen.update(members)
+                components.append(members)
+        # Continental blocks first, single-country islands last
+        self.components = sorted(components, key=len, reverse=True)
+        self.component_of = {
+            member: index for index, members in enumerate(self.components) for member in members
+        }
+
+    def _bfs(self, source):
+        reached = {source: (0, None)}
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            hops = reached[current][0] + 1
+            for neighbor in self.adjacency[current]:
+                if neighbor not in reached:
+                    reached[neighbor] = (hops, current)
+                    queue.append(neighbor)
+        return reached
+
+    def resolve(self, code):
+        """Map a cca2 or cca3 code (any case) to cca2, or None"""
+        code = (code or '').strip().upper()
+        if code in self.adjacency:
+            return code
+        return self.by_cca3.get(code)
+
+    def within(self, code, depth=1):
+        """Countries reachable in 1..depth border crossings, as ``(cca2, hops)`` nearest first"""
+        reached = self.paths[code]
+        found = [(other, hops) for other, (hops, _) in reached.items() if 0 < hops <= depth]
+        return sorted(found, key=lambda item: (item[1], self.names[item[0]]))
+
+    def route(self, source, target):
+        """Shortest land route as a tuple of cca2 codes, or None when there is none"""
+        reached = self.paths[target]
+        if source not in reached:
+            return None
+        # Walk the BFS tree rooted at the target back from the source
+        path = [source]
+        while path[-1] != target:
+            path.append(reached[path[-1]][1])
+        return tuple(path)
+
+
+get_border_graph = per_generation(BorderGraph)
@@ -0,0 +1,224 @@
+"""
+Bulk, diff-based ingest used by ``fetch_countries``.
+
+The existing rows are loaded once, incoming countries are diffed against
+them in memory and the resulting inserts, updates and deletes are applied
+with ``bulk_create``/``bulk_update`` inside a single transaction, or one
+transaction per ``flush()`` when the caller writes in batches.
+Countries whose ``content_hash`` matches the stored one are skipped
+without diffing their related rows. The payload is taken to be the full
+dataset: stored countries it does not mention are deleted along with their
+related rows, unless ``prune`` is off.
+"""
+from django.db import transaction
+
+from .models import (
+    Country, NativeName, Currency, Language,
+    Translation, Demonym, IDD, CapitalInfo,
+    Border, TopLevelDomain, CallingCode
+)
+
+# (key in the normalized rows, model, natural key field or None for one-to-one)
+CHILD_MODELS = (
+    ('native_names', NativeName, 'language_code'),
+    ('currencies', Currency, 'code'),
+    ('languages', Language, 'code'),
+    ('translations', Translation, 'language_code'),
+    ('demonyms', Demonym, 'language_code'),
+    ('idd', IDD, None),
+    ('capital_info', CapitalInfo, None),
+    ('borders', Border, 'neighbour_cca3'),
+    ('tlds', TopLevelDomain, 'tld'),
+    ('calling_codes', CallingCode, 'code'),
+)
+
+COUNTRY_FIELDS = [
+    field.name for field in Country._meta.concrete_fields if not field.primary_key
+]
+
+
+def _child_fields(model, key_field):
+    excluded = {'id', 'country', key_field}
+    return [f.name for f in model._meta.concrete_fields if f.name not in excluded]
+
+
+class BulkIngest:
+    """Collect normalized countries with ``add()`` and write them with ``apply()``"""
+
+    def __init__(self, batch_size=500, force=False, prune=True):
+        self.batch_size = batch_size
+        self.force = force
+        self.prune = prune
+        self.stats = {}
+        self.skipped = set()
+        # Every country of the payload, written or skipped
+        self.seen = set()
+        # model -> {cca2: fields} for Country, {cca2: {key: (pk, fields)}} for children
+        self._existing = {}
+        self._target = {}
+        self._load()
+
+    def _load(self):
+        self._existing[Country] = {}
+        self._target[Country] = {}
+        self._reset_stats(Country)
+        for _, model, _ in CHILD_MODELS:
+            self._existing[model] = {}
+            self._target[model] = {}
+            self._reset_stats(model)
+        self._read(Country.objects.all(), {model: model.objects.all() for _, model, _ in CHILD_MODELS})
+
+    def _reload(self, codes):
+        """Re-read the rows of ``codes`` after writing them, so later copies diff against them"""
+        codes = sorted(codes)
+        for start in range(0, len(codes), self.batch_size):
+            batch = codes[start:start + self.batch_size]
+            for _, model, _ in CHILD_MODELS:
+                for cca2 in batch:
+                    self._existing[model].pop(cca2, None)
+            self._read(
+                Country.objects.filter(cca2__in=batch),
+                {model: model.objects.filter(country__in=batch) for _, model, _ in CHILD_MODELS},
+            )
+
+    def _read(self, countries, children):
+        for row in countries.values('cca2', *COUNTRY_FIELDS):
+            self._existing[Country][row.pop('cca2')] = row
+        for _, model, key_field in CHILD_MODELS:
+            fields = _child_fields(model, key_field)
+            values = ['id', 'country_id'] + ([key_field] if key_field else []) + fields
+            existing = self._existing[model]
+            for row in children[model].values(*values):
+                key = row.pop(key_field) if key_field else None
+                pk = row.pop('id')
+                existing.setdefault(row.pop('country_id'), {})[key] = (pk, row)
+
+    def _reset_stats(self, model):
+        self.stats[model.__name__] = {
+            'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0,
+        }
+
+    def add(self, rows):
+        """Queue one country as returned by ``normalize_country``; later copies win"""
+        country = dict(rows['country'])
+        cca2 = country.pop('cca2')
+        self.seen.add(cca2)
+
+        current = self._existing[Country].get(cca2)
+        unchanged = current is not None and current['content_hash'] == country['content_hash']
+        if unchanged and not self.force:
+            # Same payload as stored: skip the whole country, dropping any earlier copy
+            for model in self._target:
+                self._target[model].pop(cca2, None)
+            self.skipped.add(cca2)
+            return
+        self.skipped.discard(cca2)
+        self._target[Country][cca2] = country
+
+        for name, model, key_field in CHILD_MODELS:
+            incoming = rows[name]
+            if key_field is None:
+                incoming = {} if incoming is None else {None: incoming}
+            self._target[model][cca2] = incoming
+
+    @property
+    def changes(self):
+        """Rows inserted, updated or deleted so far"""
+        return sum(
+            counts['inserted'] + counts['updated'] + counts['deleted'] for counts in self.stats.values()
+        )
+
+    def flush(self):
+        """
+        Write the changes queued so far in one transaction and return whether
+        any row changed; countries can be added again after it.
+        """
+        changes = self.changes
+        with transaction.atomic():
+            self._write()
+        return self.changes > changes
+
+    def apply(self):
+        """Write the remaining changes and prune in one transaction and return per-model counts"""
+        with transaction.atomic():
+            if self.prune and self.seen:
+                self._delete_missing()
+            self._write()
+        return self.stats
+
+    def _write(self):
+        self._apply_countries()
+        for _, model, key_field in CHILD_MODELS:
+            self._apply_children(model, key_field)
+        written = set(self._target[Country])
+        for model in self._target:
+            self._target[model] = {}
+        self.skipped.clear()
+        if written:
+            self._reload(written)
+
+    def _delete_missing(self):
+        """Delete the stored countries absent from the payload, cascading to their related rows"""
+        missing = sorted(set(self._existing[Country]) - self.seen)
+        names = {model._meta.label: model.__name__ for model in self._target}
+        for start in range(0, len(missing), self.batch_size):
+            _, deleted = Country.objects.filter(cca2__in=missing[start:start + self.batch_size]).delete()
+            for label, count in deleted.items():
+                if label in names:
+                    self.stats[names[label]]['deleted'] += count
+
+    def _apply_countries(self):
+        existing = self._existing[Country]
+        stats = self.stats['Country']
+        stats['unchanged'] += len(self.skipped)
+        to_create, to_update, changed = [], [], set()
+
+        for cca2, fields in self._target[Country].items():
+            current = existing.get(cca2)
+            if current is None:
+                to_create.append(Country(cca2=cca2, **fields))
+                continue
+            diff = [name for name, value in fields.items() if current.get(name) != value]
+            if diff:
+                changed.update(diff)
+                to_update.append(Country(cca2=cca2, **fields))
+            else:
+                stats['unchanged'] += 1
+
+        Country.objects.bulk_create(to_create, batch_size=self.batch_size)
+        if to_update:
+            Country.objects.bulk_update(to_update, sorted(changed), batch_size=self.batch_size)
+        stats['inserted'] += len(to_create)
+        stats['updated'] += len(to_update)
+
+    def _apply_children(self, model, key_field):
+        existing = self._existing[model]
+        stats = self.stats[model.__name__]
+        to_create, to_update, to_delete, changed = [], [], [], set()
+
+        for cca2, incoming in self._target[model].items():
+            current = existing.get(cca2, {})
+            for key, (pk, fields) in current.items():
+                if key not in incoming:
+                    to_delete.append(pk)
+            for key, fields in incoming.items():
+                natural_key = {key_field: key} if key_field else {}
+                if key not in current:
+                    to_create.append(model(country_id=cca2, **natural_key, **fields))
+                    continue
+                pk, current_fields = current[key]
+                diff = [name for name, value in fields.items() if current_fields.get(name) != value]
+                if diff:
+                    changed.update(diff)
+                    to_update.append(model(pk=pk, country_id=cca2, **natural_key, **fields))
+                else:
+                    stats['unchanged'] += 1
+
+        for start in range(0, len(to_delete), self.batch_size):
+            model.objects.filter(pk__in=to_delete[start:start + self.batch_size]).delete()
+        model.objects.bulk_create(to_create, batch_size=self.batch_size)
+        if to_update:
+            model.objects.bulk_update(to_update, sorted(changed), batch_size=self.batch_size)
+        stats['inserted'] += len(to_create)
+        stats['updated'] += len(to_update)
+        stats['deleted'] += len(to_delete)
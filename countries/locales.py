@@ -0,0 +1,150 @@
+"""
+Country names localized for ``?lang=`` or ``Accept-Language``.
+
+``LocaleNames`` maps every language of the translations and native names
+to ``cca2 -> (common, official)``, translations first. It is built from the
+snapshot once per generation (or, with the snapshot off, from two queries
+once per dataset version), so localizing a response costs no query.
+Localized JSON of each country is rendered once per language on first use.
+"""
+import threading
+
+from django.utils.translation.trans_real import parse_accept_lang_header
+
+from . import fastjson
+from .models import NativeName, Translation
+from .snapshot import per_generation
+from .versioning import current_version
+
+# The names stored on Country
+DEFAULT_LANGUAGE = 'eng'
+
+# ISO 639-1 tags of the translation languages -> the 639-3 codes they are stored under
+LANGUAGE_TAGS = {
+    'ar': 'ara', 'br': 'bre', 'cs': 'ces', 'cy': 'cym', 'de': 'deu', 'en': 'eng',
+    'es': 'spa', 'et': 'est', 'fa': 'per', 'fi': 'fin', 'fr': 'fra', 'hr': 'hrv',
+    'hu': 'hun', 'id': 'ind', 'it': 'ita', 'ja': 'jpn', 'ko': 'kor', 'nl': 'nld',
+    'pl': 'pol', 'pt': 'por', 'ru': 'rus', 'sk': 'slk', 'sr': 'srp', 'sv': 'swe',
+    'tr': 'tur', 'ur': 'urd', 'zh': 'zho',
+}
+_TAGS_BY_CODE = {code: tag for tag, code in LANGUAGE_TAGS.items()}
+
+
+def language_code(tag):
+    """639-3 code of a language tag ('fr', 'fr-CA', 'fra'), None when unknown"""
+    primary = tag.strip().lower().split('-')[0]
+    if len(primary) == 3 and primary.isalpha():
+        return primary
+    return LANGUAGE_TAGS.get(primary)
+
+
+def content_language(code):
+    """Tag for the Content-Language header"""
+    return _TAGS_BY_CODE.get(code, code)
+
+
+class LocaleNames:
+    def __init__(self, generation, countries, native_names):
+        self.generation = generation
+        names = {}
+        for cca2, rows in native_names.items():
+            for language_code, common, official in rows:
+                names.setdefault(language_code, {})[cca2] = (common, official)
+        for cca2, language_code, common, official in countries:
+            names.setdefault(language_code, {})[cca2] = (common, official)
+        self.names = names
+        self.languages = frozenset(names) | {DEFAULT_LANGUAGE}
+        self._json = {}
+        self._lock = threading.Lock()
+
+    def requested(self, request):
+        """The language asked for with ?lang= or Accept-Language, None for the stored names"""
+        lang = request.GET.get('lang')
+        if lang:
+            tags = [lang]
+        else:
+            tags = [tag for tag, _ in parse_accept_lang_header(request.headers.get('Accept-Language', ''))]
+        for tag in tags:
+            code = language_code(tag)
+            if code in self.languages:
+                return None if code == DEFAULT_LANGUAGE else code
+        return None
+
+    def lookup(self, cca2, language):
+        """``(common, official)`` of a country in ``language``, None if it has no such name"""
+        return self.names.get(language, {}).get(cca2)
+
+    def localize(self, item, language, cca2=None):
+        """Copy of a country dict with its names in ``language`` (unchanged when there is none)"""
+        names = self.lookup(item['cca2'] if cca2 is None else cca2, language)
+        if names is None:
+            return item
+        item = dict(item)
+        if 'common_name' in item:
+            item['common_name'] = names[0]
+        if 'official_name' in item:
+            item['official_name'] = names[1]
+        return item
+
+    def json(self, snapshot, language):
+        """``cca2 -> JSON`` of the snapshot's countries in ``language``, rendered on first use"""
+        rendered = self._json.get(language)
+        if rendered is None:
+            with self._lock:
+                rendered = self._json.get(language)
+                if rendered is None:
+                    rendered = {
+                        cca2: snapshot.json[cca2] if self.lookup(cca2, language) is None
+                        else fastjson.dumps(self.localize(item, language))
+                        for cca2, item in snapshot.data.items()
+                    }
+                    self._json[language] = rendered
+        return rendered
+
+    def render(self, snapshot, language, codes):
+        """Like ``snapshot.render(codes)``, in ``language``"""
+        rendered = self.json(snapshot, language)
+        return b'[' + b','.join(rendered[code] for code in codes) + b']'
+
+
+get_locale_names = per_generation(lambda snapshot: LocaleNames(
+    snapshot.generation,
+    (
+        (cca2, item['language_code'], item['common'], item['official'])
+        for cca2, country in snapshot.data.items() for item in country['translations']
+    ),
+    snapshot.native_names,
+))
+
+_lock = threading.Lock()
+_queried = None
+
+
+def request_locale(request, snapshot=None):
+    """``(LocaleNames, language)`` asked for by the request, None for the stored names"""
+    if not request.GET.get('lang') and 'Accept-Language' not in request.headers:
+        return None
+    names = get_locale_names(snapshot) if snapshot is not None else query_locale_names()
+    language = names.requested(request)
+    return (names, language) if language else None
+
+
+def query_locale_names():
+    """``LocaleNames`` for the database read path, reloaded once the dataset version changes"""
+    global _queried
+    version = current_version()[0]
+    names = _queried
+    if names is not None and names.generation == version:
+        return names
+    with _lock:
+        if _queried is None or _queried.generation != version:
+            native_names = {}
+            for cca2, *row in NativeName.objects.values_list('country_id', 'language_code', 'common', 'official'):
+                native_names.setdefault(cca2, []).append(row)
+            # The dataset version stands in for the snapshot generation here
+            _queried = LocaleNames(
+                version,
+                Translation.objects.values_list('country_id', 'language_code', 'common', 'official'),
+                native_names,
+            )
+        return _queried
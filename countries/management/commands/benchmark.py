@@ -0,0 +1,324 @@
+import asyncio
+import io
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils.module_loading import import_string
+
+from countries.cache import TieredCache
+from countries.db import pragma
+from countries.models import Country, Language
+from countries.normalize import normalize_name
+
+# The hot read endpoints; the asgi scenario requests their /async twins
+READ_PATHS = (
+    '/api/countries/',
+    '/api/countries/DE/',
+    '/api/countries/DE/regional/',
+    '/api/countries/by_language/?language=spa',
+    '/api/countries/search/?q=united',
+)
+
+# The web pages of the pages and uncached scenarios, requested as a logged-in user
+PAGE_PATHS = (
+    '/web/',
+    '/web/?q=united',
+    '/web/countries/DE/',
+)
+
+# Only run when asked for: they log in a "benchmark" user, which writes a session
+PAGE_SCENARIOS = ('pages', 'uncached')
+
+
+def plan_queries():
+    """The hot filters of the database read path, as the views build them"""
+    countries = Country.objects.using('default')
+    return (
+        ('list', countries.all()),
+        ('regional', countries.filter(region='Europe').exclude(cca2='DE')),
+        ('subregion', countries.filter(subregion='Western Europe')),
+        ('continent', countries.filter(continent='Europe')),
+        ('by_language', countries.filter(languages__code='spa')),
+        # The database search of the API and the web list: a substring match, always a scan
+        ('name search', countries.filter(search_name__contains=normalize_name('united'))),
+        ('batch codes', countries.filter(
+            Q(cca2__in=['DE']) | Q(cca3__in=['FRA']) | Q(ccn3__in=['840']) | Q(cioc__in=['GER'])
+        )),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the read paths in-process through the project WSGI and ASGI applications'
+
+    scenarios = ('wsgi', 'asgi', 'ingest') + PAGE_SCENARIOS
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', choices=self.scenarios,
+            help='Scenario to run, repeatable (default: all but the page scenarios)',
+        )
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per scenario')
+        parser.add_argument(
+            '--concurrency', type=int, default=200,
+            help='Threads (wsgi) or tasks (asgi) issuing requests at the same time',
+        )
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Path to request, repeatable (default: the hot read endpoints; '
+                 'the page scenarios always request the web pages)',
+        )
+        parser.add_argument(
+            '--host', default=(settings.ALLOWED_HOSTS or ['localhost'])[0].lstrip('.') or 'localhost',
+            help='Host header sent, must be allowed by ALLOWED_HOSTS',
+        )
+        parser.add_argument(
+            '--ingest-source',
+            help='Payload the ingest scenario re-ingests (fetch_countries --bulk --force) '
+                 'in a loop; the scenario only runs with it',
+        )
+        parser.add_argument(
+            '--plans', action='store_true',
+            help='Print the query plans and timings of the hot filters with and without '
+                 'the model indexes instead of running the scenarios',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        if options['plans']:
+            return self.show_plans(options['requests'])
+        self.host = options['host']
+        self.ingest_source = options['ingest_source']
+        self.cookie = ''
+        paths = options['paths'] or READ_PATHS
+        if connection.vendor == 'sqlite':
+            self.stdout.write(
+                f"Database profile {getattr(settings, 'COUNTRIES_DB_PROFILE', 'development')}, "
+                f"journal_mode {pragma(connection, 'journal_mode')}, "
+                f"synchronous {pragma(connection, 'synchronous')}, "
+                f"CONN_MAX_AGE {connection.settings_dict['CONN_MAX_AGE']}"
+            )
+        self.stdout.write(
+            f"{'scenario':<10} {'requests':>8} {'clients':>7} {'seconds':>8} "
+            f"{'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}"
+        )
+        scenarios = options['scenario'] or [
+            scenario for scenario in self.scenarios
+            if scenario not in PAGE_SCENARIOS and (scenario != 'ingest' or self.ingest_source)
+        ]
+        if 'ingest' in scenarios and not self.ingest_source:
+            raise CommandError('The ingest scenario needs --ingest-source')
+        for scenario in scenarios:
+            run = getattr(self, f'run_{scenario}')
+            self.errors = []
+            cache = caches['default']
+            if isinstance(cache, TieredCache):
+                cache.reset_stats()
+            started = time.perf_counter()
+            latencies = run(paths, options['requests'], options['concurrency'])
+            self.report(scenario, latencies, options['concurrency'], time.perf_counter() - started)
+            if isinstance(cache, TieredCache) and cache.stats().keys() - {'entries'}:
+                counters = ', '.join(f'{name} {count}' for name, count in sorted(cache.stats().items()))
+                self.stdout.write(f'  cache {counters}')
+        for error in self.errors[:5]:
+            self.stdout.write(self.style.WARNING(error))
+
+    def schedule(self, paths, requests):
+        return [paths[i % len(paths)] for i in range(requests)]
+
+    def check_status(self, status, path, warm_up=False):
+        if status == 200:
+            return
+        if warm_up:
+            raise CommandError(f'{path} answered {status}')
+        # Counted, not fatal: the ingest scenario measures how often reads fail
+        self.errors.append(f'{path} answered {status}')
+
+    def run_wsgi(self, paths, requests, concurrency):
+        """One thread per concurrent client, as a threaded WSGI server would run them"""
+        application = import_string(settings.WSGI_APPLICATION)
+
+        def fetch(path, warm_up=False):
+            path_info, _, query = path.partition('?')
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path_info, 'QUERY_STRING': query,
+                'SERVER_NAME': self.host, 'SERVER_PORT': '80', 'HTTP_HOST': self.host,
+                'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http',
+                'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+            }
+            if self.cookie:
+                environ['HTTP_COOKIE'] = self.cookie
+            statuses = []
+            started = time.perf_counter()
+            result = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            try:
+                b''.join(result)
+            finally:
+                result.close()
+            elapsed = time.perf_counter() - started
+            self.check_status(int(statuses[0].split()[0]), path, warm_up)
+            return elapsed
+
+        # Warm up the snapshot and the derived indexes outside the measurement
+        for path in paths:
+            fetch(path, warm_up=True)
+        with ThreadPoolExecutor(concurrency) as pool:
+            return list(pool.map(fetch, self.schedule(paths, requests)))
+
+    def run_asgi(self, paths, requests, concurrency):
+        """Concurrent clients as tasks of one event loop, as a single uvicorn worker runs them"""
+        application = import_string(settings.ASGI_APPLICATION)
+        paths = [f'/async{path}' for path in paths]
+
+        async def fetch(path, warm_up=False):
+            path_info, _, query = path.partition('?')
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': path_info, 'raw_path': path_info.encode(),
+                'query_string': query.encode(), 'root_path': '',
+                'headers': [(b'host', self.host.encode())],
+                'client': ('127.0.0.1', 0), 'server': (self.host, 80),
+            }
+            body_sent = False
+            messages = []
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Keep-alive client: never disconnects while the response is produced
+                await asyncio.Future()
+
+            async def send(message):
+                messages.append(message)
+
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            elapsed = time.perf_counter() - started
+            self.check_status(messages[0]['status'], path, warm_up)
+            return elapsed
+
+        async def worker(queue, latencies):
+            while queue:
+                latencies.append(await fetch(queue.pop()))
+
+        async def main():
+            for path in paths:
+                await fetch(path, warm_up=True)
+            queue, latencies = self.schedule(paths, requests), []
+            await asyncio.gather(*(worker(queue, latencies) for _ in range(concurrency)))
+            return latencies
+
+        return asyncio.run(main())
+
+    def run_ingest(self, paths, requests, concurrency):
+        """
+        The wsgi scenario reading from the database (snapshot off) while
+        another process re-ingests the dataset back to back.
+        """
+        command = [
+            sys.executable, sys.argv[0], 'fetch_countries',
+            '--source', self.ingest_source, '--bulk', '--force',
+            '--settings', settings.SETTINGS_MODULE,
+        ]
+        stopped = threading.Event()
+        ingests = []
+
+        def ingest_loop():
+            while not stopped.is_set():
+                started = time.perf_counter()
+                finished = subprocess.run(command, capture_output=True, text=True)
+                if finished.returncode or 'Successfully' not in finished.stdout:
+                    self.errors.append(f'ingest failed: {(finished.stdout + finished.stderr).strip()[-200:]}')
+                else:
+                    ingests.append(time.perf_counter() - started)
+
+        with override_settings(COUNTRIES_SNAPSHOT=False):
+            writer = threading.Thread(target=ingest_loop)
+            writer.start()
+            try:
+                return self.run_wsgi(paths, requests, concurrency)
+            finally:
+                stopped.set()
+                writer.join()
+                self.stdout.write(
+                    f"{len(ingests)} ingests ran alongside, "
+                    f"{statistics.fmean(ingests) if ingests else 0:.2f}s each"
+                )
+
+    def run_pages(self, paths, requests, concurrency):
+        """The wsgi scenario on the web pages, with the page and fragment caches"""
+        user, _ = User.objects.get_or_create(username='benchmark')
+        client = Client()
+        client.force_login(user)
+        self.cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        try:
+            return self.run_wsgi(PAGE_PATHS, requests, concurrency)
+        finally:
+            self.cookie = ''
+
+    def run_uncached(self, paths, requests, concurrency):
+        """The pages scenario rendering every hit (COUNTRIES_PAGE_CACHE_TIMEOUT = 0)"""
+        with override_settings(COUNTRIES_PAGE_CACHE_TIMEOUT=0):
+            return self.run_pages(paths, requests, concurrency)
+
+    def show_plans(self, runs):
+        """EXPLAIN QUERY PLAN and the mean time of each query, then the same with the indexes dropped"""
+        connection = transaction.get_connection('default')
+        if connection.vendor != 'sqlite':
+            raise CommandError('--plans reads SQLite query plans')
+        indexes = [index.name for model in (Country, Language) for index in model._meta.indexes]
+        with_indexes = self.measure_plans(connection, runs, 'indexed')
+        with transaction.atomic(using='default'):
+            with connection.cursor() as cursor:
+                for name in indexes:
+                    cursor.execute(f'DROP INDEX "{name}"')
+            without_indexes = self.measure_plans(connection, runs, 'unindexed')
+            # DDL is transactional in SQLite, the indexes come back
+            transaction.set_rollback(True, using='default')
+
+        self.stdout.write(f'Mean of {runs} runs per query, indexes: {", ".join(indexes)}')
+        for label, (indexed, plan) in with_indexes.items():
+            unindexed, old_plan = without_indexes[label]
+            self.stdout.write(f'{label}')
+            self.stdout.write(f'  without indexes {unindexed * 1000:>8.3f} ms  {old_plan}')
+            self.stdout.write(f'  with indexes    {indexed * 1000:>8.3f} ms  {plan}')
+
+    def measure_plans(self, connection, runs, tag):
+        results = {}
+        with connection.cursor() as cursor:
+            for label, queryset in plan_queries():
+                sql, params = queryset.query.sql_with_params()
+                # A distinct statement per pass: cached EXPLAIN statements are
+                # not re-prepared after the schema changes
+                sql = f'/* {tag} */ {sql}'
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = '; '.join(row[3] for row in cursor.fetchall())
+                started = time.perf_counter()
+                for _ in range(runs):
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                results[label] = ((time.perf_counter() - started) / runs, plan)
+        return results
+
+    def report(self, scenario, latencies, concurrency, seconds):
+        latencies = sorted(latencies)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f"{scenario:<10} {len(latencies):>8} {concurrency:>7} {seconds:>8.2f} "
+            f"{len(latencies) / seconds:>9.0f} {statistics.median(latencies) * 1000:>8.2f} {p99 * 1000:>8.2f} "
+            f"{len(self.errors):>6}"
+        )
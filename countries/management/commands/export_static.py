@@ -0,0 +1,127 @@
+import gzip
+import os
+import shutil
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+
+try:
+    import brotli
+except ImportError:  # optional, only the .gz variants are written without it
+    brotli = None
+
+from countries import snapshot as country_snapshot
+from countries.views import detail_page_context, list_page_context
+
+
+class Command(BaseCommand):
+    help = 'Prerender the country API and web pages into a static, precompressed directory tree'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=getattr(settings, 'COUNTRIES_STATIC_EXPORT_ROOT', None),
+            help='Export root; releases are built under <output>/releases and <output>/current points at the latest',
+        )
+        parser.add_argument(
+            '--keep', type=int, default=3,
+            help='Number of releases kept on disk, including the new one',
+        )
+        parser.add_argument(
+            '--no-html', action='store_true',
+            help='Only export the API responses',
+        )
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('Pass --output or set COUNTRIES_STATIC_EXPORT_ROOT')
+        root = Path(options['output'])
+        started = time.perf_counter()
+
+        snapshot = country_snapshot.get_snapshot()
+        # The version the exported files carry, whatever ingest lands meanwhile
+        version = snapshot.version
+        # Built next to the live release, then published with an atomic symlink swap
+        release = root / 'releases' / f'{version}-{time.strftime("%Y%m%d%H%M%S")}'
+        if release.exists():
+            raise CommandError(f'{release} already exists')
+        release.mkdir(parents=True)
+        self.sizes = {'files': 0, 'raw': 0, 'gzip': 0, 'brotli': 0}
+
+        try:
+            self.export_api(release, snapshot)
+            if not options['no_html']:
+                self.export_html(release, snapshot)
+        except Exception:
+            shutil.rmtree(release, ignore_errors=True)
+            raise
+
+        self.publish(root, release)
+        self.prune(root, release, options['keep'])
+
+        self.stdout.write(
+            f"Exported {self.sizes['files']} files ({self.sizes['raw']} bytes, "
+            f"gzip {self.sizes['gzip']}, brotli {self.sizes['brotli'] if brotli else 'not installed'}) "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        self.stdout.write(self.style.SUCCESS(f'Published dataset version {version} at {root / "current"}'))
+
+    def export_api(self, release, snapshot):
+        """Same bytes as the JSON API responses, laid out by URL path"""
+        api = release / 'api' / 'countries'
+        self.write(api / 'index.json', snapshot.list_json)
+        for cca2 in snapshot.order:
+            self.write(api / cca2 / 'index.json', snapshot.json[cca2])
+            self.write(api / cca2 / 'regional' / 'index.json', snapshot.render(snapshot.regional(cca2)))
+        # by_language/?language=<code> is served from by_language/<code>.json
+        for code, codes in snapshot.by_language.items():
+            self.write(api / 'by_language' / f'{code}.json', snapshot.render(codes))
+
+    def export_html(self, release, snapshot):
+        """The web pages as an anonymous visitor sees them"""
+        web = release / 'web'
+        page = render_to_string('countries/country_list.html', list_page_context(snapshot))
+        self.write(web / 'index.html', page.encode('utf-8'))
+        for cca2 in snapshot.order:
+            page = render_to_string('countries/country_detail.html', detail_page_context(snapshot, cca2))
+            self.write(web / 'countries' / cca2 / 'index.html', page.encode('utf-8'))
+
+    def write(self, path, content):
+        """Write ``content`` plus .gz (and .br) variants when they are smaller"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        self.sizes['files'] += 1
+        self.sizes['raw'] += len(content)
+
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) < len(content):
+            path.with_name(path.name + '.gz').write_bytes(compressed)
+            self.sizes['gzip'] += len(compressed)
+        if brotli is not None:
+            compressed = brotli.compress(content)
+            if len(compressed) < len(content):
+                path.with_name(path.name + '.br').write_bytes(compressed)
+                self.sizes['brotli'] += len(compressed)
+
+    def publish(self, root, release):
+        current = root / 'current'
+        if current.exists() and not current.is_symlink():
+            raise CommandError(f'{current} exists and is not a symlink')
+        temporary = root / f'.current-{os.getpid()}'
+        if temporary.is_symlink():
+            temporary.unlink()
+        temporary.symlink_to(release.relative_to(root), target_is_directory=True)
+        # rename() over the old link is atomic, readers see either release in full
+        os.replace(temporary, current)
+
+    def prune(self, root, release, keep):
+        releases = sorted(
+            (path for path in (root / 'releases').iterdir() if path.is_dir()),
+            key=lambda path: path.stat().st_mtime,
+        )
+        for old in releases[:-max(keep, 1)]:
+            if old != release:
+                shutil.rmtree(old, ignore_errors=True)
+                self.stdout.write(f'Removed old release {old.name}')
@@ -1,158 +1,109 @@
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
+from django.db import transaction
 import requests
-from countries.models import (
-    Country, NativeName, Currency, Language,
-    Translation, Demonym, IDD, CapitalInfo
+from countries.ingest import BulkIngest
+from countries.pipeline import IngestPipeline
+from countries.routers import use_primary
+from countries.signals import dataset_changed
+from countries.sources import (
+    DEFAULT_SOURCE, NotModified, SourceError, iter_countries, open_source
 )
+from countries.models import SourceState
 
 class Command(BaseCommand):
     help = 'Fetch country data from restcountries.com and store in database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', default=DEFAULT_SOURCE,
+            help='URL or local file (plain, gzip or zstd) holding a JSON array of countries',
+        )
+        parser.add_argument(
+            '--bulk', action='store_true',
+            help='Write all changes in one transaction instead of one per batch of countries',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Rows per bulk_create/bulk_update/delete statement',
+        )
+        parser.add_argument(
+            '--keep-missing', action='store_true',
+            help='Keep stored countries that are missing from the payload',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Ignore the stored ETag/Last-Modified and content hashes and rewrite every country',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=0,
+            help='Processes used to normalize the payload (0 or 1 runs it inline)',
+        )
+        parser.add_argument(
+            '--publish', action='store_true',
+            help='Run publish_snapshot when the ingest changed the data',
+        )
+
+    def execute(self, *args, **options):
+        # Diff against and write to the primary, also where reads go to a replica
+        with use_primary():
+            return super().execute(*args, **options)
     
     def handle(self, *args, **options):
-        url = 'https://restcountries.com/v3.1/all'
+        source = options['source']
+        force = options['force']
+        state = SourceState.objects.filter(source=source).first()
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-            
-            self.stdout.write(f"Fetched {len(data)} countries")
+            with open_source(
+                source,
+                etag=None if force or state is None else state.etag,
+                last_modified=None if force or state is None else state.last_modified,
+            ) as (stream, validators):
+                ingest = BulkIngest(
+                    batch_size=options['batch_size'], force=force, prune=not options['keep_missing']
+                )
+                # Without --bulk every batch of countries is committed on its own
+                pipeline = IngestPipeline(
+                    ingest.add, workers=options['workers'],
+                    flush=None if options['bulk'] else lambda: self.write(ingest, ingest.flush),
+                )
+                count = pipeline.run(iter_countries(stream))
             
-            for country_data in data:
-                self.process_country(country_data)
+            self.stdout.write(f"Fetched {count} countries")
+            stats = pipeline.timed('write', self.write, ingest, ingest.apply)
+            self.report(stats)
+            self.report_timings(pipeline.timings)
             
+            SourceState.objects.update_or_create(source=source, defaults=validators)
+            if ingest.changes and options['publish']:
+                call_command('publish_snapshot', stdout=self.stdout)
             self.stdout.write(self.style.SUCCESS('Successfully fetched and stored country data'))
+        except NotModified:
+            self.stdout.write(self.style.SUCCESS('Source not modified since the last fetch, nothing to do'))
         except requests.exceptions.RequestException as e:
             self.stdout.write(self.style.ERROR(f'Error fetching data: {e}'))
+        except (OSError, ValueError, SourceError) as e:
+            self.stdout.write(self.style.ERROR(f'Error reading data: {e}'))
+
+    def write(self, ingest, func):
+        """Run ``ingest.flush``/``ingest.apply``, bumping the dataset version in the same transaction"""
+        # A run failing later still leaves the batches it committed under a new version
+        changes = ingest.changes
+        with transaction.atomic():
+            result = func()
+            if ingest.changes > changes:
+                dataset_changed.send(sender=self.__class__)
+        return result
+
+    def report(self, stats):
+        self.stdout.write(f"{'model':<15} {'inserted':>9} {'updated':>9} {'deleted':>9} {'unchanged':>10}")
+        for model_name, counts in stats.items():
+            self.stdout.write(
+                f"{model_name:<15} {counts['inserted']:>9} {counts['updated']:>9} "
+                f"{counts['deleted']:>9} {counts['unchanged']:>10}"
+            )
     
-    def process_country(self, country_data):
-        # Handle array fields by converting to comma-separated strings
-        def to_csv(array_data):
-            return ",".join(array_data) if array_data else None
-        
-        # Get basic data
-        name_data = country_data.get('name', {})
-        capital_data = country_data.get('capital', [])
-        capital = capital_data[0] if capital_data else None
-        
-        # Create or update country
-        country, created = Country.objects.update_or_create(
-            cca2=country_data.get('cca2'),
-            defaults={
-                'common_name': name_data.get('common', ''),
-                'official_name': name_data.get('official', ''),
-                'cca3': country_data.get('cca3'),
-                'ccn3': country_data.get('ccn3'),
-                'cioc': country_data.get('cioc'),
-                'fifa': country_data.get('fifa'),
-                'independent': country_data.get('independent', False),
-                'un_member': country_data.get('unMember', False),
-                'status': country_data.get('status', ''),
-                'region': country_data.get('region', ''),
-                'subregion': country_data.get('subregion'),
-                'continent': country_data.get('continents', [''])[0],
-                'lat': country_data.get('latlng', [None])[0],
-                'lng': country_data.get('latlng', [None, None])[1],
-                'landlocked': country_data.get('landlocked', False),
-                'area': country_data.get('area'),
-                'capital': capital,
-                'capital_lat': country_data.get('capitalInfo', {}).get('latlng', [None])[0],
-                'capital_lng': country_data.get('capitalInfo', {}).get('latlng', [None, None])[1],
-                'timezone': country_data.get('timezones', [''])[0],
-                'population': country_data.get('population', 0),
-                'gini': country_data.get('gini'),
-                'flag_emoji': country_data.get('flag', ''),
-                'flag_png': country_data.get('flags', {}).get('png', ''),
-                'flag_svg': country_data.get('flags', {}).get('svg', ''),
-                'flag_alt': country_data.get('flags', {}).get('alt'),
-                'coat_of_arms_png': country_data.get('coatOfArms', {}).get('png'),
-                'coat_of_arms_svg': country_data.get('coatOfArms', {}).get('svg'),
-                'car_signs': to_csv(country_data.get('car', {}).get('signs', [])),
-                'car_side': country_data.get('car', {}).get('side', 'right'),
-                'tld': to_csv(country_data.get('tld', [])),
-                'postal_code_format': country_data.get('postalCode', {}).get('format'),
-                'postal_code_regex': country_data.get('postalCode', {}).get('regex'),
-                'google_maps': country_data.get('maps', {}).get('googleMaps'),
-                'openstreet_maps': country_data.get('maps', {}).get('openStreetMaps'),
-                'borders': to_csv(country_data.get('borders', [])),
-                'alt_spellings': to_csv(country_data.get('altSpellings', [])),
-            }
+    def report_timings(self, timings):
+        self.stdout.write(
+            'Stage timings: ' + ', '.join(f'{stage} {seconds:.3f}s' for stage, seconds in timings.items())
         )
-        
-        # Process native names
-        native_names = name_data.get('nativeName', {})
-        for lang_code, names in native_names.items():
-            NativeName.objects.update_or_create(
-                country=country,
-                language_code=lang_code,
-                defaults={
-                    'official': names.get('official', ''),
-                    'common': names.get('common', ''),
-                }
-            )
-        
-        # Process currencies
-        currencies = country_data.get('currencies', {})
-        for code, currency_data in currencies.items():
-            Currency.objects.update_or_create(
-                country=country,
-                code=code,
-                defaults={
-                    'name': currency_data.get('name', ''),
-                    'symbol': currency_data.get('symbol'),
-                }
-            )
-        
-        # Process languages
-        languages = country_data.get('languages', {})
-        for code, name in languages.items():
-            Language.objects.update_or_create(
-                country=country,
-                code=code,
-                defaults={'name': name}
-            )
-        
-        # Process translations
-        translations = country_data.get('translations', {})
-        for lang_code, translation_data in translations.items():
-            Translation.objects.update_or_create(
-                country=country,
-                language_code=lang_code,
-                defaults={
-                    'official': translation_data.get('official', ''),
-                    'common': translation_data.get('common', ''),
-                }
-            )
-        
-        # Process demonyms
-        demonyms = country_data.get('demonyms', {})
-        for lang_code, demonym_data in demonyms.items():
-            Demonym.objects.update_or_create(
-                country=country,
-                language_code=lang_code,
-                defaults={
-                    'masculine': demonym_data.get('m'),
-                    'feminine': demonym_data.get('f'),
-                }
-            )
-        
-        # Process IDD information
-        idd_data = country_data.get('idd', {})
-        if idd_data:
-            IDD.objects.update_or_create(
-                country=country,
-                defaults={
-                    'root': idd_data.get('root', ''),
-                    'suffixes': to_csv(idd_data.get('suffixes', [])),
-                }
-            )
-        
-        # Process capital info
-        capital_info = country_data.get('capitalInfo', {})
-        if capital_info.get('latlng'):
-            CapitalInfo.objects.update_or_create(
-                country=country,
-                defaults={
-                    'lat': capital_info.get('latlng', [None])[0],
-                    'lng': capital_info.get('latlng', [None, None])[1],
-                }
-            )
\ No newline at end of file
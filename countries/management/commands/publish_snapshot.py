@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Publish a compacted, read-only copy of the database for COUNTRIES_READ_REPLICA'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=getattr(settings, 'COUNTRIES_READ_REPLICA', None),
+            help='Replica file to replace (default: COUNTRIES_READ_REPLICA)',
+        )
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('Pass --output or set COUNTRIES_READ_REPLICA')
+        connection = connections['default']
+        if connection.vendor != 'sqlite':
+            raise CommandError('publish_snapshot needs a SQLite default database')
+        output = Path(options['output'])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        # Written next to the live file, then renamed over it: readers keep
+        # the file they have open and reconnect to the new one
+        temporary = output.with_name(f'.{output.name}-{os.getpid()}')
+        temporary.unlink(missing_ok=True)
+        started = time.perf_counter()
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM INTO %s', [str(temporary)])
+            version = self.verify(temporary)
+            with open(temporary, 'rb+') as published:
+                os.fsync(published.fileno())
+            os.replace(temporary, output)
+        except Exception:
+            temporary.unlink(missing_ok=True)
+            raise
+
+        self.stdout.write(
+            f'Wrote {output.stat().st_size} bytes in {time.perf_counter() - started:.2f}s'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Published dataset version {version} at {output}'))
+
+    def verify(self, path):
+        """Check the copy opens the way the replicas open it; returns its dataset version"""
+        database = sqlite3.connect(f'{path.resolve().as_uri()}?mode=ro&immutable=1', uri=True)
+        try:
+            result = database.execute('PRAGMA quick_check').fetchone()[0]
+            if result != 'ok':
+                raise CommandError(f'Snapshot failed the integrity check: {result}')
+            row = database.execute('SELECT version FROM countries_datasetversion WHERE id = 1').fetchone()
+        finally:
+            database.close()
+        return row[0] if row else 0
@@ -0,0 +1,100 @@
+"""
+HTTP validators and Cache-Control for the country API and web pages.
+"""
+import hashlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .versioning import cached_version, current_version
+
+
+class DatasetCacheMiddleware:
+    """
+    Answer conditional GETs on ``COUNTRIES_CACHED_PATHS`` from the dataset version.
+
+    The strong ETag combines the dataset version with the full path and the
+    ``Accept`` and ``Accept-Language`` headers (plus the session for clients that have one), so a
+    matching ``If-None-Match`` gets a 304 before the view, and with it the
+    database and the serializer, is reached. Successful responses get the
+    ETag, ``Last-Modified`` and ``Cache-Control`` unless the view set its own.
+    Works in sync and async stacks.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_cached(request):
+            return self.get_response(request)
+        etag, last_modified = self.validators(request, current_version())
+        response = self.not_modified(request, etag, last_modified)
+        if response is None:
+            response = self.add_validators(request, self.get_response(request), etag, last_modified)
+        return response
+
+    async def __acall__(self, request):
+        if not self.is_cached(request):
+            return await self.get_response(request)
+        version = cached_version() or await sync_to_async(current_version)()
+        etag, last_modified = self.validators(request, version)
+        response = self.not_modified(request, etag, last_modified)
+        if response is None:
+            response = self.add_validators(request, await self.get_response(request), etag, last_modified)
+        return response
+
+    def is_cached(self, request):
+        paths = getattr(settings, 'COUNTRIES_CACHED_PATHS', ('/api/countries/', '/web/', '/async/'))
+        return request.method in ('GET', 'HEAD') and request.path.startswith(tuple(paths))
+
+    def session(self, request):
+        return request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+
+    def validators(self, request, version):
+        version, changed_at = version
+        key = [
+            request.get_full_path(), request.META.get('HTTP_ACCEPT', ''),
+            request.META.get('HTTP_ACCEPT_LANGUAGE', ''),
+        ]
+        session = self.session(request)
+        if session:
+            # Pages show who is logged in; the session key changes on login and logout
+            key.append(session)
+        digest = hashlib.sha1('\n'.join(key).encode('utf-8')).hexdigest()[:20]
+        return f'"{version}-{digest}"', int(changed_at.timestamp()) if changed_at else None
+
+    def not_modified(self, request, etag, last_modified):
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            response['ETag'] = etag
+            self.patch_caching(request, response)
+        return response
+
+    def add_validators(self, request, response, etag, last_modified):
+        if response.status_code != 200 or response.has_header('ETag'):
+            return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        self.patch_caching(request, response)
+        return response
+
+    def patch_caching(self, request, response):
+        if not response.has_header('Cache-Control'):
+            directives = {
+                'private' if self.session(request) else 'public': True,
+                'max_age': getattr(settings, 'COUNTRIES_CACHE_MAX_AGE', 60),
+            }
+            stale = getattr(settings, 'COUNTRIES_CACHE_STALE_WHILE_REVALIDATE', 300)
+            if stale:
+                directives['stale_while_revalidate'] = stale
+            patch_cache_control(response, **directives)
+        patch_vary_headers(response, ('Accept', 'Accept-Language', 'Cookie'))
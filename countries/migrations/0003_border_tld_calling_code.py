@@ -0,0 +1,48 @@
+# Generated by Django 4.2 on 2026-10-18 11:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0002_content_hash_source_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopLevelDomain',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tld', models.CharField(db_index=True, max_length=20)),
+                ('country', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='top_level_domains', to='countries.country')),
+            ],
+            options={
+                'unique_together': {('country', 'tld')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CallingCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('root', models.CharField(db_index=True, max_length=5)),
+                ('code', models.CharField(db_index=True, max_length=10)),
+                ('country', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calling_codes', to='countries.country')),
+            ],
+            options={
+                'unique_together': {('country', 'code')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Border',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('neighbour_cca3', models.CharField(db_index=True, max_length=3)),
+                ('country', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='border_edges', to='countries.country')),
+            ],
+            options={
+                'unique_together': {('country', 'neighbour_cca3')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-18 11:36
+
+from django.db import migrations
+
+
+def split_csv(value):
+    return value.split(',') if value else []
+
+
+def populate(apps, schema_editor):
+    Country = apps.get_model('countries', 'Country')
+    IDD = apps.get_model('countries', 'IDD')
+    Border = apps.get_model('countries', 'Border')
+    TopLevelDomain = apps.get_model('countries', 'TopLevelDomain')
+    CallingCode = apps.get_model('countries', 'CallingCode')
+
+    borders, tlds, calling_codes = [], [], []
+    for cca2, border_csv, tld_csv in Country.objects.values_list('cca2', 'borders', 'tld'):
+        borders += [Border(country_id=cca2, neighbour_cca3=cca3) for cca3 in set(split_csv(border_csv))]
+        tlds += [TopLevelDomain(country_id=cca2, tld=tld) for tld in set(split_csv(tld_csv))]
+    for cca2, root, suffix_csv in IDD.objects.values_list('country_id', 'root', 'suffixes'):
+        if root:
+            codes = {root + suffix for suffix in split_csv(suffix_csv) or ['']}
+            calling_codes += [CallingCode(country_id=cca2, root=root, code=code) for code in codes]
+
+    Border.objects.bulk_create(borders, batch_size=500)
+    TopLevelDomain.objects.bulk_create(tlds, batch_size=500)
+    CallingCode.objects.bulk_create(calling_codes, batch_size=500)
+
+
+def unpopulate(apps, schema_editor):
+    for name in ('Border', 'TopLevelDomain', 'CallingCode'):
+        apps.get_model('countries', name).objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0003_border_tld_calling_code'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, unpopulate),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2 on 2026-10-18 12:03
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+_non_word = re.compile(r'[\W_]+')
+
+
+def normalize_name(text):
+    # Copy of countries.normalize.normalize_name as of this migration
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _non_word.sub(' ', stripped).strip()
+
+
+def populate_search_name(apps, schema_editor):
+    Country = apps.get_model('countries', 'Country')
+    countries = list(Country.objects.only('cca2', 'common_name'))
+    for country in countries:
+        country.search_name = normalize_name(country.common_name)
+    Country.objects.bulk_update(countries, ['search_name'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0005_dataset_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='country',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(populate_search_name, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['common_name'], name='country_common_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['region', 'common_name'], name='country_region_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['subregion', 'common_name'], name='country_subregion_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['continent', 'common_name'], name='country_continent_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='language',
+            index=models.Index(fields=['code', 'country'], name='language_code_country_idx'),
+        ),
+    ]
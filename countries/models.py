@@ -1,5 +1,14 @@
 from django.db import models
 from django.db.models import JSONField
+from django.utils import timezone
+
+from .normalize import normalize_name
+
+class CountryQuerySet(models.QuerySet):
+    def with_related(self):
+        """Prefetch every relation CountrySerializer nests, avoiding N+1 queries"""
+        return self.prefetch_related('currencies', 'languages', 'translations', 'demonyms')
+
 
 class Country(models.Model):
     # Basic Identification
@@ -10,6 +19,8 @@ class Country(models.Model):
     # Names
     common_name = models.CharField(max_length=100)
     official_name = models.CharField(max_length=200)
+    # common_name casefolded without accents or punctuation, for indexed lookups
+    search_name = models.CharField(max_length=100, blank=True, default='', editable=False)
     
     # Status
     independent = models.BooleanField(default=False)
@@ -77,13 +88,33 @@ class Country(models.Model):
     # Alternative spellings (comma-separated values)
     alt_spellings = models.CharField(max_length=500, null=True, blank=True)
     
+    # Hash of the normalized source payload, used to skip unchanged countries on refresh
+    content_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
+    
+    objects = CountryQuerySet.as_manager()
+    
     class Meta:
         verbose_name_plural = "countries"
         ordering = ['common_name']
+        indexes = [
+            # Default ordering, and the filters that come with it
+            models.Index(fields=['common_name'], name='country_common_name_idx'),
+            models.Index(fields=['region', 'common_name'], name='country_region_name_idx'),
+            models.Index(fields=['subregion', 'common_name'], name='country_subregion_name_idx'),
+            models.Index(fields=['continent', 'common_name'], name='country_continent_name_idx'),
+            # Code lookups of the batch endpoint, next to the cca2/cca3 unique indexes
+            models.Index(fields=['ccn3'], name='country_ccn3_idx'),
+            models.Index(fields=['cioc'], name='country_cioc_idx'),
+        ]
     
     def __str__(self):
         return f"{self.common_name} ({self.cca2})"
     
+    def save(self, *args, **kwargs):
+        # Ingests set it from normalize_country, admin and API writes land here
+        self.search_name = normalize_name(self.common_name)
+        super().save(*args, **kwargs)
+    
     # Helper methods to handle comma-separated fields
     def get_car_signs(self):
         return self.car_signs.split(',') if self.car_signs else []
@@ -133,6 +164,10 @@ class Language(models.Model):
     
     class Meta:
         unique_together = ('country', 'code')
+        indexes = [
+            # by_language looks countries up by language code
+            models.Index(fields=['code', 'country'], name='language_code_country_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.code})"
@@ -180,6 +215,43 @@ class IDD(models.Model):
         return self.suffixes.split(',') if self.suffixes else []
 
 
+class Border(models.Model):
+    """Land border edge, derived from ``Country.borders`` for indexed reverse lookups"""
+    country = models.ForeignKey(Country, related_name='border_edges', on_delete=models.CASCADE)
+    neighbour_cca3 = models.CharField(max_length=3, db_index=True)
+    
+    class Meta:
+        unique_together = ('country', 'neighbour_cca3')
+    
+    def __str__(self):
+        return f"{self.country_id} borders {self.neighbour_cca3}"
+
+
+class TopLevelDomain(models.Model):
+    """One row per entry of ``Country.tld``"""
+    country = models.ForeignKey(Country, related_name='top_level_domains', on_delete=models.CASCADE)
+    tld = models.CharField(max_length=20, db_index=True)
+    
+    class Meta:
+        unique_together = ('country', 'tld')
+    
+    def __str__(self):
+        return f"{self.tld} ({self.country_id})"
+
+
+class CallingCode(models.Model):
+    """Full dialing code (IDD root + suffix), e.g. code +49 under root +4"""
+    country = models.ForeignKey(Country, related_name='calling_codes', on_delete=models.CASCADE)
+    root = models.CharField(max_length=5, db_index=True)
+    code = models.CharField(max_length=10, db_index=True)
+    
+    class Meta:
+        unique_together = ('country', 'code')
+    
+    def __str__(self):
+        return f"{self.code} ({self.country_id})"
+
+
 class CapitalInfo(models.Model):
     country = models.OneToOneField(Country, related_name='capital_info', on_delete=models.CASCADE)
     lat = models.FloatField(null=True, blank=True)
@@ -189,4 +261,24 @@ class CapitalInfo(models.Model):
         verbose_name_plural = "capital info"
     
     def __str__(self):
-        return f"Capital info for {self.country.cca2}"
\ No newline at end of file
+        return f"Capital info for {self.country.cca2}"
+
+
+class SourceState(models.Model):
+    """HTTP validators of the last successfully ingested payload per source"""
+    source = models.CharField(max_length=500, unique=True)
+    etag = models.CharField(max_length=200, null=True, blank=True)
+    last_modified = models.CharField(max_length=100, null=True, blank=True)
+    fetched_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return self.source
+
+
+class DatasetVersion(models.Model):
+    """Single row counting the changes to the country data, the base of the HTTP validators"""
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Dataset version {self.version}"
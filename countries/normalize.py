@@ -0,0 +1,178 @@
+"""
+Pure helpers that flatten a restcountries.com payload into per-model rows.
+
+Nothing in here touches the ORM so the functions can be reused by every
+ingest path of ``fetch_countries``.
+"""
+import hashlib
+import json
+import re
+import time
+import unicodedata
+
+# Derived from other columns, left out of the content hash
+DERIVED_FIELDS = ('content_hash', 'search_name')
+
+_non_word = re.compile(r'[\W_]+')
+
+
+def normalize_name(text):
+    """Casefold, strip accents and collapse punctuation so 'Côte d'Ivoire' == 'cote d ivoire'"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _non_word.sub(' ', stripped).strip()
+
+
+def to_csv(array_data):
+    """Join array fields into the comma-separated form stored on the models"""
+    return ",".join(array_data) if array_data else None
+
+
+def normalize_country(country_data):
+    """
+    Flatten one country object into a dict of row values.
+
+    ``country`` holds the ``Country`` fields (including ``cca2`` and the
+    ``content_hash`` of all the rows), the child keys map the natural key
+    of each related row (language code, currency code...) to its field
+    values, and ``idd``/``capital_info`` are a single dict or ``None``.
+    """
+    name_data = country_data.get('name', {})
+    capital_data = country_data.get('capital', [])
+    capital = capital_data[0] if capital_data else None
+
+    country = {
+        'cca2': country_data.get('cca2'),
+        'common_name': name_data.get('common', ''),
+        'search_name': normalize_name(name_data.get('common', '')),
+        'official_name': name_data.get('official', ''),
+        'cca3': country_data.get('cca3'),
+        'ccn3': country_data.get('ccn3'),
+        'cioc': country_data.get('cioc'),
+        'fifa': country_data.get('fifa'),
+        'independent': country_data.get('independent', False),
+        'un_member': country_data.get('unMember', False),
+        'status': country_data.get('status', ''),
+        'region': country_data.get('region', ''),
+        'subregion': country_data.get('subregion'),
+        'continent': country_data.get('continents', [''])[0],
+        'lat': country_data.get('latlng', [None])[0],
+        'lng': country_data.get('latlng', [None, None])[1],
+        'landlocked': country_data.get('landlocked', False),
+        'area': country_data.get('area'),
+        'capital': capital,
+        'capital_lat': country_data.get('capitalInfo', {}).get('latlng', [None])[0],
+        'capital_lng': country_data.get('capitalInfo', {}).get('latlng', [None, None])[1],
+        'timezone': country_data.get('timezones', [''])[0],
+        'population': country_data.get('population', 0),
+        'gini': country_data.get('gini'),
+        'flag_emoji': country_data.get('flag', ''),
+        'flag_png': country_data.get('flags', {}).get('png', ''),
+        'flag_svg': country_data.get('flags', {}).get('svg', ''),
+        'flag_alt': country_data.get('flags', {}).get('alt'),
+        'coat_of_arms_png': country_data.get('coatOfArms', {}).get('png'),
+        'coat_of_arms_svg': country_data.get('coatOfArms', {}).get('svg'),
+        'car_signs': to_csv(country_data.get('car', {}).get('signs', [])),
+        'car_side': country_data.get('car', {}).get('side', 'right'),
+        'tld': to_csv(country_data.get('tld', [])),
+        'postal_code_format': country_data.get('postalCode', {}).get('format'),
+        'postal_code_regex': country_data.get('postalCode', {}).get('regex'),
+        'google_maps': country_data.get('maps', {}).get('googleMaps'),
+        'openstreet_maps': country_data.get('maps', {}).get('openStreetMaps'),
+        'borders': to_csv(country_data.get('borders', [])),
+        'alt_spellings': to_csv(country_data.get('altSpellings', [])),
+    }
+
+    native_names = {
+        lang_code: {
+            'official': names.get('official', ''),
+            'common': names.get('common', ''),
+        }
+        for lang_code, names in name_data.get('nativeName', {}).items()
+    }
+
+    currencies = {
+        code: {
+            'name': currency_data.get('name', ''),
+            'symbol': currency_data.get('symbol'),
+        }
+        for code, currency_data in country_data.get('currencies', {}).items()
+    }
+
+    languages = {
+        code: {'name': name}
+        for code, name in country_data.get('languages', {}).items()
+    }
+
+    translations = {
+        lang_code: {
+            'official': translation_data.get('official', ''),
+            'common': translation_data.get('common', ''),
+        }
+        for lang_code, translation_data in country_data.get('translations', {}).items()
+    }
+
+    demonyms = {
+        lang_code: {
+            'masculine': demonym_data.get('m'),
+            'feminine': demonym_data.get('f'),
+        }
+        for lang_code, demonym_data in country_data.get('demonyms', {}).items()
+    }
+
+    idd_data = country_data.get('idd', {})
+    idd = None
+    if idd_data:
+        idd = {
+            'root': idd_data.get('root', ''),
+            'suffixes': to_csv(idd_data.get('suffixes', [])),
+        }
+
+    # Indexed copies of the comma-separated columns
+    borders = {cca3: {} for cca3 in country_data.get('borders', [])}
+    tlds = {tld: {} for tld in country_data.get('tld', [])}
+    calling_codes = {}
+    if idd_data.get('root'):
+        root = idd_data['root']
+        for suffix in idd_data.get('suffixes') or ['']:
+            calling_codes[root + suffix] = {'root': root}
+
+    capital_info_data = country_data.get('capitalInfo', {})
+    capital_info = None
+    if capital_info_data.get('latlng'):
+        capital_info = {
+            'lat': capital_info_data.get('latlng', [None])[0],
+            'lng': capital_info_data.get('latlng', [None, None])[1],
+        }
+
+    rows = {
+        'country': country,
+        'native_names': native_names,
+        'currencies': currencies,
+        'languages': languages,
+        'translations': translations,
+        'demonyms': demonyms,
+        'idd': idd,
+        'capital_info': capital_info,
+        'borders': borders,
+        'tlds': tlds,
+        'calling_codes': calling_codes,
+    }
+    country['content_hash'] = content_hash(rows)
+    return rows
+
+
+def content_hash(rows):
+    """Stable SHA-256 of normalized rows, ignoring the stored hash and derived columns"""
+    country = {k: v for k, v in rows['country'].items() if k not in DERIVED_FIELDS}
+    payload = json.dumps(
+        dict(rows, country=country), sort_keys=True, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def normalize_batch(batch):
+    """Normalize a list of countries; returns ``(rows, seconds)`` for pool workers"""
+    started = time.perf_counter()
+    rows = [normalize_country(country_data) for country_data in batch]
+    return rows, time.perf_counter() - started
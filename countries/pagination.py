@@ -0,0 +1,7 @@
+from rest_framework.pagination import LimitOffsetPagination
+
+
+class CountryPagination(LimitOffsetPagination):
+    """Opt-in limit/offset pagination: responses stay a plain list unless ``limit`` is given"""
+    default_limit = None
+    max_limit = 500
@@ -0,0 +1,83 @@
+"""
+Staged ingest pipeline used by ``fetch_countries``.
+
+parse -> transform -> write: the parse stage pulls country objects off the
+source stream, the transform stage normalizes them in batches (optionally
+on a process pool) and a single writer stage hands the rows to the DB
+layer, so only one process ever writes to the database. An optional
+``flush`` runs after each batch, e.g. to commit it.
+"""
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .normalize import normalize_batch
+
+
+class IngestPipeline:
+    """Run ``countries`` through the stages and record per-stage timings"""
+
+    def __init__(self, write, workers=0, batch_size=50, flush=None):
+        self.write = write
+        self.flush = flush
+        self.workers = workers
+        self.batch_size = batch_size
+        self.count = 0
+        self.timings = {'parse': 0.0, 'transform': 0.0, 'write': 0.0, 'total': 0.0}
+
+    def _batches(self, countries):
+        iterator = iter(countries)
+        while True:
+            started = time.perf_counter()
+            batch = []
+            for country_data in iterator:
+                batch.append(country_data)
+                if len(batch) == self.batch_size:
+                    break
+            self.timings['parse'] += time.perf_counter() - started
+            if not batch:
+                return
+            yield batch
+
+    def _write(self, result):
+        rows, seconds = result
+        self.timings['transform'] += seconds
+        started = time.perf_counter()
+        for country_rows in rows:
+            self.write(country_rows)
+        if self.flush is not None:
+            self.flush()
+        self.count += len(rows)
+        self.timings['write'] += time.perf_counter() - started
+
+    def run(self, countries):
+        started = time.perf_counter()
+        if self.workers > 1:
+            self._run_pool(countries)
+        else:
+            for batch in self._batches(countries):
+                self._write(normalize_batch(batch))
+        self.timings['total'] += time.perf_counter() - started
+        return self.count
+
+    def _run_pool(self, countries):
+        # Bound the batches in flight so memory stays flat on large sources
+        max_pending = self.workers * 2
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for batch in self._batches(countries):
+                pending.append(executor.submit(normalize_batch, batch))
+                if len(pending) >= max_pending:
+                    self._write(pending.popleft().result())
+            while pending:
+                self._write(pending.popleft().result())
+
+    def timed(self, stage, func, *args, **kwargs):
+        """Run ``func`` and add its duration to ``stage``, e.g. the final flush"""
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.timings[stage] += elapsed
+            self.timings['total'] += elapsed
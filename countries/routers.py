@@ -0,0 +1,90 @@
+"""
+Read replica routing, enabled by ``COUNTRIES_READ_REPLICA``.
+
+The replica is a read-only copy of the database written by the
+``publish_snapshot`` command and opened ``mode=ro&immutable=1``, so SQLite
+skips locking and change detection and can serve it from the page cache and
+mmap. Reads of the countries app go to it, everything else (auth, sessions,
+every write and the reads inside a write transaction) to ``default``, as do
+all reads until a replica has been published.
+A newly published file is picked up by each worker thread at its next
+request, without a restart.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+REPLICA = 'replica'
+
+_local = threading.local()
+_published = None
+
+
+@contextmanager
+def use_primary():
+    """Read the countries app from ``default`` in this thread, e.g. while diffing an ingest"""
+    previous = getattr(_local, 'primary', False)
+    _local.primary = True
+    try:
+        yield
+    finally:
+        _local.primary = previous
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'countries':
+            return None
+        if getattr(_local, 'primary', False) or connections['default'].in_atomic_block:
+            return 'default'
+        # Nothing published yet, e.g. on a new node before the first publish_snapshot
+        if _published is None and replica_file() is None:
+            return 'default'
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+def replica_file():
+    """``(device, inode, mtime)`` of the published replica, None when there is none"""
+    path = getattr(settings, 'COUNTRIES_READ_REPLICA', None)
+    if not path or REPLICA not in settings.DATABASES:
+        return None
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns
+
+
+def remember_replica_file(sender, connection, **kwargs):
+    """connection_created: note which file a replica connection has open"""
+    if connection.alias == REPLICA:
+        connection.replica_file = replica_file()
+
+
+def reconnect_replica(**kwargs):
+    """request_started: move this thread to a newly published replica"""
+    global _published
+    published = replica_file()
+    if published is None:
+        return
+    connection = connections[REPLICA]
+    if connection.connection is not None and getattr(connection, 'replica_file', published) != published:
+        connection.close()
+    if published != _published:
+        from .versioning import forget
+        _published = published
+        # The new file carries its own dataset version, read it now
+        forget()
@@ -0,0 +1,236 @@
+"""
+In-memory name search over the country snapshot.
+
+Every name variant (common, official, alternative spellings, translations
+and native names) is normalized (casefolded, accents and punctuation
+stripped) and indexed four ways: a sorted term list for prefix matches, a
+sorted list of word tails for word-prefix matches, a trigram index for
+substring and typo-tolerant matches and, for queries too short for
+trigrams, the countries with a name containing each one- and two-character
+string. ``Autocomplete`` is a separate,
+leaner prefix structure that also covers the country codes. Both are
+rebuilt whenever the snapshot generation changes, i.e. after every ingest.
+"""
+import json
+from bisect import bisect_left
+from collections import Counter
+
+from .normalize import normalize_name as normalize
+from .snapshot import per_generation
+
+# Weight of each kind of name
+CODE, COMMON, OFFICIAL, ALTERNATIVE, TRANSLATED = 1.1, 1.0, 0.9, 0.8, 0.7
+
+CODE_FIELDS = ('cca2', 'cca3', 'ccn3', 'cioc', 'fifa')
+
+# Score of each kind of match, multiplied by the name weight
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING, FUZZY = 1.0, 0.9, 0.8, 0.6, 0.5
+
+FUZZY_THRESHOLD = 0.3
+
+def trigrams(term):
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def name_variants(item, native_names=()):
+    """Yield ``(name, weight)`` for every name of a serialized country"""
+    yield item['common_name'], COMMON
+    yield item['official_name'], OFFICIAL
+    for spelling in (item['alt_spellings'] or '').split(','):
+        yield spelling, ALTERNATIVE
+    for translation in item['translations']:
+        yield translation['common'], TRANSLATED
+        yield translation['official'], TRANSLATED
+    for _, common, official in native_names:
+        yield common, TRANSLATED
+        yield official, TRANSLATED
+
+
+class SearchIndex:
+    """Ranked prefix, substring and fuzzy name search for one snapshot generation"""
+
+    def __init__(self, snapshot):
+        self.generation = snapshot.generation
+        self.rank = {code: position for position, code in enumerate(snapshot.order)}
+
+        postings = {}
+        for code in snapshot.order:
+            for name, weight in name_variants(snapshot.data[code], snapshot.native_names.get(code, ())):
+                term = normalize(name)
+                if not term:
+                    continue
+                best = postings.setdefault(term, {})
+                if weight > best.get(code, 0):
+                    best[code] = weight
+
+        self.terms = sorted(postings)
+        self.postings = [tuple(postings[term].items()) for term in self.terms]
+
+        self.word_tails = sorted(
+            (term[position + 1:], term_id)
+            for term_id, term in enumerate(self.terms)
+            for position, ch in enumerate(term) if ch == ' '
+        )
+
+        self.trigram_counts = []
+        trigram_index = {}
+        for term_id, term in enumerate(self.terms):
+            grams = trigrams(term)
+            self.trigram_counts.append(len(grams))
+            for gram in grams:
+                trigram_index.setdefault(gram, []).append(term_id)
+        self.trigram_index = {gram: tuple(ids) for gram, ids in trigram_index.items()}
+
+        # chars -> {code: weight of its best name containing them}
+        short_postings = {}
+        for term_id, term in enumerate(self.terms):
+            substrings = {term[start:start + length] for length in (1, 2) for start in range(len(term) - length + 1)}
+            for chars in substrings:
+                best = short_postings.setdefault(chars, {})
+                for code, weight in self.postings[term_id]:
+                    if weight > best.get(code, 0):
+                        best[code] = weight
+        self.short_postings = {chars: tuple(best.items()) for chars, best in short_postings.items()}
+        # Ranked results of short queries, filled on first use (at most one per key of short_postings)
+        self.short_results = {}
+
+    def _hit(self, scores, term_id, score):
+        for code, weight in self.postings[term_id]:
+            weighted = score * weight
+            if weighted > scores.get(code, 0):
+                scores[code] = weighted
+
+    def search(self, query, limit=None):
+        """Return cca2 codes ranked by relevance"""
+        query = normalize(query)
+        if not query:
+            return ()
+        if len(query) < 3:
+            if query not in self.short_postings:
+                return ()
+            ranked = self.short_results.get(query)
+            if ranked is None:
+                ranked = self.short_results[query] = self._rank(query)
+            return ranked[:limit] if limit else ranked
+        return self._rank(query, limit)
+
+    def _rank(self, query, limit=None):
+        scores = {}
+
+        # Exact and prefix matches on whole names
+        position = bisect_left(self.terms, query)
+        while position < len(self.terms) and self.terms[position].startswith(query):
+            self._hit(scores, position, EXACT if self.terms[position] == query else PREFIX)
+            position += 1
+
+        # Prefix matches on any later word of a name
+        position = bisect_left(self.word_tails, (query,))
+        while position < len(self.word_tails) and self.word_tails[position][0].startswith(query):
+            self._hit(scores, self.word_tails[position][1], WORD_PREFIX)
+            position += 1
+
+        if len(query) < 3:
+            # Too short for trigrams: the precomputed countries with a name containing it
+            for code, weight in self.short_postings.get(query, ()):
+                weighted = SUBSTRING * weight
+                if weighted > scores.get(code, 0):
+                    scores[code] = weighted
+        else:
+            grams = trigrams(query)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.trigram_index.get(gram, ()))
+            for term_id, count in shared.items():
+                if query in self.terms[term_id]:
+                    self._hit(scores, term_id, SUBSTRING)
+                    continue
+                similarity = count / (len(grams) + self.trigram_counts[term_id] - count)
+                if similarity >= FUZZY_THRESHOLD:
+                    self._hit(scores, term_id, FUZZY * similarity)
+
+        ranked = sorted(scores, key=lambda code: (-scores[code], self.rank[code]))
+        return tuple(ranked[:limit] if limit else ranked)
+
+
+class Autocomplete:
+    """
+    Top-N completions over names and codes for one snapshot generation.
+
+    Results for short prefixes (the bulk of keystrokes) are precomputed;
+    longer prefixes are answered by a bisect over the sorted terms.
+    Completions are kept as pre-encoded JSON objects.
+    """
+    PRECOMPUTED_PREFIX = 3
+    MAX_RESULTS = 20
+
+    def __init__(self, snapshot):
+        self.generation = snapshot.generation
+        weights = {}
+        for code in snapshot.order:
+            item = snapshot.data[code]
+            variants = [(item[field], CODE) for field in CODE_FIELDS if item[field]]
+            variants += name_variants(item, snapshot.native_names.get(code, ()))
+            for name, weight in variants:
+                term = normalize(name)
+                if term and weight > weights.get((term, code), 0):
+                    weights[(term, code)] = weight
+
+        self.entries = sorted((term, code, weight) for (term, code), weight in weights.items())
+        self.terms = [term for term, _, _ in self.entries]
+        # Rank by name kind, then by population so "united" offers the US first
+        self.rank = {
+            code: position for position, code in enumerate(
+                sorted(snapshot.order, key=lambda code: -(snapshot.data[code]['population'] or 0))
+            )
+        }
+        self.json = {
+            code: json.dumps({
+                'cca2': code,
+                'name': snapshot.data[code]['common_name'],
+                'flag_emoji': snapshot.data[code]['flag_emoji'],
+            }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            for code in snapshot.order
+        }
+
+        best = {}
+        for term, code, weight in self.entries:
+            for length in range(1, min(len(term), self.PRECOMPUTED_PREFIX) + 1):
+                scores = best.setdefault(term[:length], {})
+                prefix_weight = self._weight(weight, len(term) == length)
+                if prefix_weight > scores.get(code, 0):
+                    scores[code] = prefix_weight
+        self.precomputed = {prefix: self._ranked(scores) for prefix, scores in best.items()}
+
+    @staticmethod
+    def _weight(weight, exact):
+        # A code only outranks names when it is typed in full
+        return ALTERNATIVE if weight == CODE and not exact else weight
+
+    def _ranked(self, scores):
+        ranked = sorted(scores, key=lambda code: (-scores[code], self.rank[code]))
+        return tuple(ranked[:self.MAX_RESULTS])
+
+    def complete(self, query, limit=10):
+        """Return up to ``limit`` cca2 codes completing ``query``"""
+        prefix = normalize(query)
+        if not prefix:
+            return ()
+        if len(prefix) <= self.PRECOMPUTED_PREFIX:
+            return self.precomputed.get(prefix, ())[:limit]
+        scores = {}
+        position = bisect_left(self.terms, prefix)
+        while position < len(self.terms) and self.terms[position].startswith(prefix):
+            term, code, weight = self.entries[position]
+            weight = self._weight(weight, term == prefix)
+            if weight > scores.get(code, 0):
+                scores[code] = weight
+            position += 1
+        return self._ranked(scores)[:limit]
+
+    def render(self, codes):
+        return b'[' + b','.join(self.json[code] for code in codes) + b']'
+
+
+get_search_index = per_generation(SearchIndex)
+get_autocomplete = per_generation(Autocomplete)
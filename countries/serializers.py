@@ -27,7 +27,65 @@ class CountrySerializer(serializers.ModelSerializer):
     translations = TranslationSerializer(many=True, read_only=True)
     demonyms = DemonymSerializer(many=True, read_only=True)
     
+    nested_fields = ('currencies', 'languages', 'translations', 'demonyms')
+    
     class Meta:
         model = Country
-        fields = '__all__'
-        depth = 1
\ No newline at end of file
+        exclude = ('content_hash', 'search_name')
+        depth = 1
+    
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # (LocaleNames, language) set by the views for ?lang= / Accept-Language
+        locale = self.context.get('locale')
+        if locale is not None:
+            data = locale[0].localize(data, locale[1], instance.cca2)
+        return data
+
+
+_field_names = None
+
+
+def country_field_names():
+    """All CountrySerializer field names, in output order"""
+    global _field_names
+    if _field_names is None:
+        _field_names = tuple(CountrySerializer().fields)
+    return _field_names
+
+
+def _param_list(query_params, name):
+    value = query_params.get(name)
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+
+def select_fields(query_params):
+    """
+    Resolve ``fields``, ``exclude`` and ``expand`` into the field names to render.
+
+    Returns ``None`` when none of them is given (full representation).
+    Otherwise nested relations are only included when listed in ``fields``
+    or ``expand``.
+    """
+    fields = _param_list(query_params, 'fields')
+    exclude = _param_list(query_params, 'exclude')
+    expand = _param_list(query_params, 'expand')
+    if not (fields or exclude or expand):
+        return None
+
+    available = country_field_names()
+    unknown = sorted(set(fields + exclude) - set(available))
+    unknown += sorted(set(expand) - set(CountrySerializer.nested_fields))
+    if unknown:
+        raise serializers.ValidationError({'fields': [f'Unknown field: {name}' for name in unknown]})
+
+    wanted = set(fields) if fields else set(available) - set(CountrySerializer.nested_fields)
+    wanted |= set(expand)
+    wanted -= set(exclude)
+    return tuple(name for name in available if name in wanted)
\ No newline at end of file
@@ -0,0 +1,62 @@
+import weakref
+
+from django.db import transaction
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal
+
+# Sent by fetch_countries once an ingest has written its changes
+dataset_changed = Signal()
+
+
+def _publish():
+    from . import snapshot, versioning
+    versioning.forget()
+    snapshot.invalidate()
+
+
+class _PendingBump:
+    """on_commit callback of a transaction whose dataset version is already bumped"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __call__(self):
+        self.connection.countries_pending_bump = None
+        _publish()
+
+
+def _record_change(sender=None, **kwargs):
+    """Bump the dataset version with the change and drop cached copies once it commits"""
+    from .versioning import bump
+    connection = transaction.get_connection()
+    # One bump per transaction. The flag is a weak reference to the callback:
+    # the callback clears it on commit, and a rollback (of the transaction
+    # or of the savepoint the bump was made in) discards the callback, which
+    # clears the reference with it
+    pending = getattr(connection, 'countries_pending_bump', None)
+    if pending is not None and pending() is not None:
+        return
+    bump()
+    callback = _PendingBump(connection)
+    if connection.in_atomic_block:
+        connection.countries_pending_bump = weakref.ref(callback)
+    transaction.on_commit(callback)
+
+
+def connect_signals():
+    from .models import (
+        Country, NativeName, Currency, Language,
+        Translation, Demonym, IDD, CapitalInfo
+    )
+    for model in (Country, NativeName, Currency, Language, Translation, Demonym, IDD, CapitalInfo):
+        post_save.connect(_record_change, sender=model, dispatch_uid=f'dataset-save-{model.__name__}')
+        post_delete.connect(_record_change, sender=model, dispatch_uid=f'dataset-delete-{model.__name__}')
+    dataset_changed.connect(_record_change, dispatch_uid='dataset-changed')
+
+    from .db import apply_pragmas
+    from .routers import reconnect_replica, remember_replica_file
+    connection_created.connect(apply_pragmas, dispatch_uid='countries-sqlite-pragmas')
+    connection_created.connect(remember_replica_file, dispatch_uid='countries-replica-file')
+    request_started.connect(reconnect_replica, dispatch_uid='countries-replica-reconnect')
@@ -0,0 +1,153 @@
+"""
+In-process, immutable snapshot of every country, already serialized.
+
+The API read endpoints are served from the snapshot instead of querying
+and re-serializing on every request. Saving a country or one of its
+related rows, or a ``fetch_countries`` run, invalidates it and the next
+request rebuilds it and swaps it in atomically. Other processes rebuild
+theirs once they see the new dataset version. ``generation`` counts the
+rebuilds of this process.
+"""
+import threading
+import time
+from types import MappingProxyType
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from . import fastjson
+from .models import Country, NativeName
+from .serializers import CountrySerializer
+from .versioning import cached_version, current_version
+
+
+class CountrySnapshot:
+    """Serialized countries plus the lookups the viewset actions need"""
+
+    def __init__(self, generation, data, native_names=None, version=None):
+        render = fastjson.dumps if fastjson.is_enabled() else JSONRenderer().render
+        self.generation = generation
+        self.version = version
+        self.built_at = time.time()
+        self.order = tuple(item['cca2'] for item in data)
+        self.data = MappingProxyType({item['cca2']: item for item in data})
+        self.json = MappingProxyType({item['cca2']: render(item) for item in data})
+        self.list_json = self.render(self.order)
+        # cca2 -> ((language_code, common, official), ...), not part of the API output
+        self.native_names = MappingProxyType({
+            code: tuple(names) for code, names in (native_names or {}).items()
+        })
+
+        by_region, by_language = {}, {}
+        for item in data:
+            by_region.setdefault(item['region'], []).append(item['cca2'])
+            for language in item['languages']:
+                by_language.setdefault(language['code'], []).append(item['cca2'])
+        self.by_region = MappingProxyType({k: tuple(v) for k, v in by_region.items()})
+        self.by_language = MappingProxyType({k: tuple(v) for k, v in by_language.items()})
+
+    def render(self, codes):
+        """JSON array of the given countries, byte-identical to the rendered serializer output"""
+        return b'[' + b','.join(self.json[code] for code in codes) + b']'
+
+    def ordered(self, codes):
+        """Keep the codes that exist, in list order"""
+        codes = set(codes)
+        return tuple(code for code in self.order if code in codes)
+
+    def regional(self, cca2):
+        region = self.data[cca2]['region']
+        return tuple(code for code in self.by_region.get(region, ()) if code != cca2)
+
+
+def build_snapshot(generation):
+    # Read first so a change committed during the build triggers another one
+    version = current_version()[0]
+    if fastjson.is_enabled():
+        data = fastjson.country_rows(Country.objects.all())
+    else:
+        data = CountrySerializer(Country.objects.with_related(), many=True).data
+    native_names = {}
+    for cca2, language_code, common, official in NativeName.objects.values_list(
+        'country_id', 'language_code', 'common', 'official'
+    ):
+        native_names.setdefault(cca2, []).append((language_code, common, official))
+    return CountrySnapshot(generation, data, native_names, version=version)
+
+
+_lock = threading.Lock()
+_snapshot = None
+_stale = True
+_generation = 0
+
+
+def is_enabled():
+    return getattr(settings, 'COUNTRIES_SNAPSHOT', True)
+
+
+def _outdated(snapshot):
+    return snapshot.version != current_version()[0]
+
+
+def get_snapshot():
+    """Return the current snapshot, rebuilding it first if it was invalidated"""
+    global _snapshot, _stale, _generation
+    snapshot = _snapshot
+    if snapshot is not None and not _stale and not _outdated(snapshot):
+        return snapshot
+    with _lock:
+        if _snapshot is None or _stale or _outdated(_snapshot):
+            # Cleared before building so an invalidation during the build is kept
+            _stale = False
+            try:
+                snapshot = build_snapshot(_generation + 1)
+            except Exception:
+                _stale = True
+                raise
+            _generation = snapshot.generation
+            _snapshot = snapshot
+        return _snapshot
+
+
+def peek():
+    """The current snapshot if it is known to be fresh without a database query, else None"""
+    snapshot, version = _snapshot, cached_version()
+    if snapshot is None or _stale or version is None or snapshot.version != version[0]:
+        return None
+    return snapshot
+
+
+async def aget_snapshot():
+    """Async ``get_snapshot()``: only leaves the event loop when it has to query"""
+    snapshot = peek()
+    if snapshot is None:
+        snapshot = await sync_to_async(get_snapshot)()
+    return snapshot
+
+
+def invalidate():
+    global _stale
+    _stale = True
+
+
+def per_generation(cls):
+    """
+    Return a getter caching ``cls(snapshot)`` until the snapshot generation changes.
+
+    Used for the derived indexes so they are rebuilt once after each ingest.
+    """
+    lock = threading.Lock()
+    current = None
+
+    def get(snapshot):
+        nonlocal current
+        instance = current
+        if instance is not None and instance.generation == snapshot.generation:
+            return instance
+        with lock:
+            if current is None or current.generation != snapshot.generation:
+                current = cls(snapshot)
+            return current
+
+    return get
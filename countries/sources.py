@@ -0,0 +1,260 @@
+"""
+Payload sources for ``fetch_countries``.
+
+A source is either an http(s) URL or a local file (plain, gzip or zstd).
+``iter_countries`` parses the stream incrementally so only one country
+object is held in memory at a time, and each character is scanned once.
+"""
+import codecs
+import gzip
+import io
+import json
+import os
+import re
+from contextlib import contextmanager
+from email.utils import formatdate
+from urllib.parse import urlparse
+
+import requests
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for .zst dumps
+    zstandard = None
+
+DEFAULT_SOURCE = 'https://restcountries.com/v3.1/all'
+CHUNK_SIZE = 64 * 1024
+# Longest country object accepted, in characters; real ones are a few KB
+MAX_OBJECT_SIZE = 4 * 1024 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# What can open, close or hide a brace: inside an object, and inside one of its strings
+_OBJECT_TOKENS = re.compile(r'[{}"]')
+_STRING_TOKENS = re.compile(r'["\\]')
+
+
+class SourceError(Exception):
+    pass
+
+
+class NotModified(Exception):
+    """The source still matches the validators of the previous ingest"""
+
+
+def is_url(source):
+    return urlparse(source).scheme in ('http', 'https')
+
+
+class _PeekedStream(io.RawIOBase):
+    """Replay the bytes read to sniff the compression format"""
+
+    def __init__(self, raw, head):
+        self._raw = raw
+        self._head = head
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._head:
+            size = min(len(buffer), len(self._head))
+            buffer[:size] = self._head[:size]
+            self._head = self._head[size:]
+            return size
+        data = self._raw.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+@contextmanager
+def _decompressed(raw):
+    magic = raw.read(4)
+    stream = io.BufferedReader(_PeekedStream(raw, magic), CHUNK_SIZE)
+    if magic.startswith(GZIP_MAGIC):
+        with gzip.GzipFile(fileobj=stream) as decompressed:
+            yield decompressed
+    elif magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise SourceError('Reading zstd sources requires the "zstandard" package')
+        with zstandard.ZstdDecompressor().stream_reader(stream) as decompressed:
+            yield decompressed
+    else:
+        yield stream
+
+
+def _local_path(source):
+    return source[len('file://'):] if source.startswith('file://') else source
+
+
+@contextmanager
+def open_source(source, etag=None, last_modified=None, timeout=30):
+    """
+    Yield ``(stream, validators)`` for ``source``.
+
+    ``stream`` is binary and already decompressed, ``validators`` holds the
+    ``etag``/``last_modified`` to remember for the next conditional fetch.
+    Raises ``NotModified`` when the given validators still match.
+    """
+    if is_url(source):
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        response = requests.get(source, headers=headers, stream=True, timeout=timeout)
+        try:
+            if response.status_code == 304:
+                raise NotModified(source)
+            response.raise_for_status()
+            response.raw.decode_content = True
+            validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            with _decompressed(response.raw) as stream:
+                yield stream, validators
+        finally:
+            response.close()
+        return
+
+    path = _local_path(source)
+    stat = os.stat(path)
+    # Local files get the same validators a static file server would send
+    validators = {
+        'etag': f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+        'last_modified': formatdate(stat.st_mtime, usegmt=True),
+    }
+    if etag and etag == validators['etag']:
+        raise NotModified(source)
+    with open(path, 'rb') as raw, _decompressed(raw) as stream:
+        yield stream, validators
+
+
+def _skip_separators(buf, pos, depth):
+    while pos < len(buf):
+        ch = buf[pos]
+        if ch.isspace() or (depth and ch == ','):
+            pos += 1
+        else:
+            break
+    return pos
+
+
+def _scan_object(buf, scan, braces, in_string):
+    """
+    Advance over an object from ``scan`` up to its closing brace.
+
+    Returns ``(end, scan, braces, in_string)``: ``end`` is None when the
+    buffer ends first, and the rest is the state to resume from once more
+    data has arrived, so every character is scanned once.
+    """
+    while True:
+        if in_string:
+            match = _STRING_TOKENS.search(buf, scan)
+            if match is None:
+                return None, len(buf), braces, True
+            if match.group() == '\\':
+                if match.end() == len(buf):
+                    # Resume at the backslash, its escaped character is in the next chunk
+                    return None, match.start(), braces, True
+                scan = match.end() + 1
+                continue
+            scan, in_string = match.end(), False
+            continue
+        match = _OBJECT_TOKENS.search(buf, scan)
+        if match is None:
+            return None, len(buf), braces, False
+        scan = match.end()
+        token = match.group()
+        if token == '"':
+            in_string = True
+        elif token == '{':
+            braces += 1
+        else:
+            braces -= 1
+            if not braces:
+                return scan, scan, 0, False
+
+
+def iter_countries(stream, chunk_size=CHUNK_SIZE, max_object_size=MAX_OBJECT_SIZE):
+    """
+    Yield the country objects of a JSON stream one at a time.
+
+    Accepts a top-level array, several concatenated or nested arrays
+    (dumps bundling many snapshots) and newline-delimited objects.
+    Raises ``SourceError`` on a malformed object, or once an object is
+    still unterminated after ``max_object_size`` characters.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buf, pos, depth, eof = '', 0, 0, False
+    # Characters dropped from the front of buf, for error offsets
+    offset = 0
+    # Scan state of the object starting at pos, None between objects
+    scan, braces, in_string = None, 0, False
+
+    def read_more():
+        nonlocal buf, pos, eof, offset, scan
+        if scan is not None:
+            scan -= pos
+        offset += pos
+        buf, pos = buf[pos:], 0
+        chunk = stream.read(chunk_size)
+        if chunk:
+            buf += text.decode(chunk)
+        else:
+            buf += text.decode(b'', final=True)
+            eof = True
+
+    while True:
+        if scan is None:
+            pos = _skip_separators(buf, pos, depth)
+            if pos == len(buf):
+                if eof:
+                    break
+                read_more()
+                continue
+
+            ch = buf[pos]
+            if ch == '[':
+                depth += 1
+                pos += 1
+                continue
+            if ch == ']' and depth:
+                depth -= 1
+                pos += 1
+                continue
+            if ch != '{':
+                raise SourceError(f'Expected a country object at character {offset + pos}, got {ch!r}')
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Truncated by the buffer edge or malformed: scan for its end, then decode once
+                scan, braces, in_string = pos, 0, False
+            else:
+                yield obj
+                continue
+
+        end, scan, braces, in_string = _scan_object(buf, scan, braces, in_string)
+        if end is None:
+            if eof:
+                raise SourceError(f'Unterminated country object at character {offset + pos}')
+            if len(buf) - pos > max_object_size:
+                raise SourceError(
+                    f'Country object at character {offset + pos} is still unterminated after '
+                    f'{max_object_size} characters, the source is probably malformed'
+                )
+            read_more()
+            continue
+
+        try:
+            obj, _ = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            raise SourceError(f'Malformed country object at character {offset + e.pos}: {e.msg}') from e
+        scan, pos = None, end
+        yield obj
+
+    if depth:
+        raise SourceError('Unterminated JSON array in source')
@@ -0,0 +1,183 @@
+"""
+Spatial index over country and capital coordinates.
+
+Points are stored as unit vectors on the sphere in a k-d tree: the chord
+length between two unit vectors grows monotonically with the great-circle
+distance, so nearest and radius queries on the tree are exact for
+haversine distances. Batches of distances (the pairwise matrix) are
+vectorized with numpy when it is installed.
+"""
+import heapq
+import math
+
+try:
+    import numpy
+except ImportError:  # optional, only speeds up the distance matrix
+    numpy = None
+
+from .snapshot import per_generation
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Which coordinates to index: the country centroid or its capital
+POINTS = {
+    'country': ('lat', 'lng'),
+    'capital': ('capital_lat', 'capital_lng'),
+}
+
+
+def to_unit_vector(lat, lng):
+    lat, lng = math.radians(lat), math.radians(lng)
+    return (math.cos(lat) * math.cos(lng), math.cos(lat) * math.sin(lng), math.sin(lat))
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def chord_for_km(distance_km):
+    """Straight-line distance between unit vectors ``distance_km`` apart on the surface"""
+    angle = min(distance_km / EARTH_RADIUS_KM, math.pi)
+    return 2 * math.sin(angle / 2)
+
+
+def distance_matrix(lats, lngs):
+    """Pairwise haversine distances in km as a list of rows"""
+    if numpy is not None:
+        lat = numpy.radians(numpy.asarray(lats, dtype=float))
+        lng = numpy.radians(numpy.asarray(lngs, dtype=float))
+        dlat = lat[:, None] - lat[None, :]
+        dlng = lng[:, None] - lng[None, :]
+        a = numpy.sin(dlat / 2) ** 2 + numpy.cos(lat)[:, None] * numpy.cos(lat)[None, :] * numpy.sin(dlng / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.clip(a, 0, 1)))).tolist()
+    return [
+        [haversine_km(lat1, lng1, lat2, lng2) for lat2, lng2 in zip(lats, lngs)]
+        for lat1, lng1 in zip(lats, lngs)
+    ]
+
+
+class KDTree:
+    """Minimal 3-d tree over unit vectors; nodes are ``(index, axis, left, right)``"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.root = self._build(list(range(len(vectors))), 0)
+
+    def _build(self, indexes, depth):
+        if not indexes:
+            return None
+        axis = depth % 3
+        indexes.sort(key=lambda i: self.vectors[i][axis])
+        middle = len(indexes) // 2
+        return (
+            indexes[middle], axis,
+            self._build(indexes[:middle], depth + 1),
+            self._build(indexes[middle + 1:], depth + 1),
+        )
+
+    def _distance(self, index, point):
+        return math.dist(self.vectors[index], point)
+
+    def nearest(self, point, k):
+        """Indexes of the ``k`` vectors closest to ``point``, closest first"""
+        heap = []  # max-heap of (-distance, index)
+
+        def visit(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            distance = self._distance(index, point)
+            if len(heap) < k:
+                heapq.heappush(heap, (-distance, index))
+            elif distance < -heap[0][0]:
+                heapq.heapreplace(heap, (-distance, index))
+            delta = point[axis] - self.vectors[index][axis]
+            near, far = (left, right) if delta < 0 else (right, left)
+            visit(near)
+            if len(heap) < k or abs(delta) < -heap[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return [index for _, index in sorted(heap, key=lambda item: -item[0])]
+
+    def within(self, point, radius):
+        """Indexes of the vectors at most ``radius`` away from ``point``"""
+        found = []
+
+        def visit(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            if self._distance(index, point) <= radius:
+                found.append(index)
+            delta = point[axis] - self.vectors[index][axis]
+            if delta <= radius:
+                visit(left)
+            if delta >= -radius:
+                visit(right)
+
+        visit(self.root)
+        return found
+
+
+class SpatialIndex:
+    """Country and capital k-d trees for one snapshot generation"""
+
+    def __init__(self, snapshot):
+        self.generation = snapshot.generation
+        self.names = {code: snapshot.data[code]['common_name'] for code in snapshot.order}
+        self.points = {}
+        for kind, (lat_field, lng_field) in POINTS.items():
+            located = [
+                (code, snapshot.data[code][lat_field], snapshot.data[code][lng_field])
+                for code in snapshot.order
+                if snapshot.data[code][lat_field] is not None and snapshot.data[code][lng_field] is not None
+            ]
+            codes = tuple(code for code, _, _ in located)
+            lats = tuple(lat for _, lat, _ in located)
+            lngs = tuple(lng for _, _, lng in located)
+            tree = KDTree([to_unit_vector(lat, lng) for _, lat, lng in located])
+            self.points[kind] = (codes, lats, lngs, tree)
+        self._matrices = {}
+
+    def _results(self, kind, indexes, lat, lng):
+        codes, lats, lngs, _ = self.points[kind]
+        results = [(codes[i], haversine_km(lat, lng, lats[i], lngs[i])) for i in indexes]
+        return sorted(results, key=lambda item: item[1])
+
+    def coordinates(self, kind, code):
+        codes, lats, lngs, _ = self.points[kind]
+        try:
+            i = codes.index(code)
+        except ValueError:
+            return None
+        return lats[i], lngs[i]
+
+    def nearest(self, lat, lng, k=5, kind='country'):
+        """``(cca2, km)`` of the ``k`` nearest points, closest first"""
+        tree = self.points[kind][3]
+        return self._results(kind, tree.nearest(to_unit_vector(lat, lng), k), lat, lng)
+
+    def within(self, lat, lng, radius_km, kind='country'):
+        """``(cca2, km)`` of every point within ``radius_km``, closest first"""
+        tree = self.points[kind][3]
+        return self._results(kind, tree.within(to_unit_vector(lat, lng), chord_for_km(radius_km)), lat, lng)
+
+    def matrix(self, kind='capital', codes=None):
+        """``(codes, rows)`` of pairwise distances in km; the full matrix is cached per generation"""
+        all_codes, lats, lngs, _ = self.points[kind]
+        if codes is None:
+            if kind not in self._matrices:
+                self._matrices[kind] = (all_codes, distance_matrix(lats, lngs))
+            return self._matrices[kind]
+        positions = {code: i for i, code in enumerate(all_codes)}
+        selected = [code for code in codes if code in positions]
+        return tuple(selected), distance_matrix(
+            [lats[positions[code]] for code in selected],
+            [lngs[positions[code]] for code in selected],
+        )
+
+
+get_spatial_index = per_generation(SpatialIndex)
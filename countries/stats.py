@@ -0,0 +1,112 @@
+"""
+Columnar statistics over the numeric country fields.
+
+The numeric fields of the snapshot are copied once per generation into
+typed ``array('d')`` columns (missing values are NaN) and the countries
+are pre-grouped by region, subregion and continent, so an aggregate is a
+pass over a few contiguous columns instead of a scan of the serialized
+countries. ``gini`` (``{year: value}``) is unpacked into a plain column
+holding the most recent value.
+"""
+import math
+import statistics
+from array import array
+
+from .snapshot import per_generation
+
+COLUMNS = ('population', 'area', 'density', 'gini')
+
+GROUP_BY = ('region', 'subregion', 'continent')
+
+AGGREGATES = {
+    'count': len,
+    'sum': math.fsum,
+    'mean': statistics.fmean,
+    'median': statistics.median,
+    'min': min,
+    'max': max,
+}
+
+DEFAULT_METRICS = 'population.sum'
+
+
+def latest_gini(gini):
+    """``(year, value)`` of the most recent Gini index, or ``(None, None)``; non-year keys are skipped"""
+    years = [key for key in gini or () if str(key).isdecimal()]
+    if not years:
+        return None, None
+    year = max(years, key=int)
+    return int(year), float(gini[year])
+
+
+def parse_metrics(text):
+    """Parse ``population.sum,area.mean`` into ``(('population', 'sum'), ...)``"""
+    metrics = []
+    for metric in (text or DEFAULT_METRICS).split(','):
+        column, _, function = metric.strip().partition('.')
+        if column not in COLUMNS or function not in AGGREGATES:
+            raise ValueError(
+                f"Unknown metric '{metric.strip()}', expected <column>.<aggregate> with column in "
+                f"{', '.join(COLUMNS)} and aggregate in {', '.join(AGGREGATES)}"
+            )
+        if (column, function) not in metrics:
+            metrics.append((column, function))
+    return tuple(metrics)
+
+
+def _number(value):
+    return int(value) if value.is_integer() else round(value, 4)
+
+
+class CountryStats:
+    """Typed columns and group positions for one snapshot generation"""
+
+    def __init__(self, snapshot):
+        self.generation = snapshot.generation
+        self.codes = snapshot.order
+        items = [snapshot.data[code] for code in snapshot.order]
+        nan = math.nan
+
+        population = array('d', (float(item['population'] or 0) for item in items))
+        area = array('d', (nan if item['area'] is None else float(item['area']) for item in items))
+        gini = [latest_gini(item['gini'])[1] for item in items]
+        self.columns = {
+            'population': population,
+            'area': area,
+            'density': array('d', (
+                p / a if a > 0 else nan for p, a in zip(population, area)
+            )),
+            'gini': array('d', (nan if value is None else value for value in gini)),
+        }
+
+        # field -> {value: positions of its countries}, in name order
+        self.groups = {}
+        for field in GROUP_BY:
+            positions = {}
+            for position, item in enumerate(items):
+                positions.setdefault(item[field], array('I')).append(position)
+            self.groups[field] = dict(
+                sorted(positions.items(), key=lambda entry: (entry[0] is None, entry[0] or ''))
+            )
+
+    def aggregate(self, metrics, group_by=None):
+        """One row per group with ``count`` and every ``<column>.<aggregate>`` in ``metrics``"""
+        if group_by is None:
+            groups = {None: range(len(self.codes))}
+        else:
+            groups = self.groups[group_by]
+        rows = []
+        for key, positions in groups.items():
+            row = {group_by: key} if group_by else {}
+            row['count'] = len(positions)
+            for column, function in metrics:
+                values = self.columns[column]
+                present = [value for value in map(values.__getitem__, positions) if not math.isnan(value)]
+                row[f'{column}.{function}'] = (
+                    _number(float(AGGREGATES[function](present))) if present else None
+                )
+            rows.append(row)
+        return rows
+
+
+get_country_stats = per_generation(CountryStats)
@@ -1,3 +1,1426 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from . import fastjson, routers, snapshot, versioning
+from .cache import _FLIGHT_LOCKS, dataset_key
+from .db import apply_pragmas
+from .ingest import BulkIngest
+from .models import Border, Country, Currency, Language, NativeName, SourceState, Translation, Demonym
+from .normalize import normalize_country
+from .pipeline import IngestPipeline
+from .search import Autocomplete, get_search_index
+from .serializers import CountrySerializer
+from .sources import SourceError, iter_countries, open_source
+from .stats import latest_gini, parse_metrics
+
+
+def tiered_caches(location, **options):
+    """CACHES with a TieredCache in front of local memory, the stand-in for the shared cache"""
+    return {
+        'default': {
+            'BACKEND': 'countries.cache.TieredCache',
+            'LOCATION': location,
+            'OPTIONS': {'SHARED': 'shared', **options},
+        },
+        'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': location},
+    }
+
+
+def make_country(cca2, cca3, name, region, language_code):
+    country = Country.objects.create(
+        cca2=cca2, cca3=cca3, common_name=name, official_name=f'Republic of {name}',
+        status='officially-assigned', region=region, continent=region,
+        timezone='UTC+01:00', population=1000, flag_emoji='', flag_png='https://flags/x.png',
+        flag_svg='https://flags/x.svg', alt_spellings=f'{cca2},{name}',
+    )
+    Currency.objects.create(country=country, code='EUR', name='Euro', symbol='€')
+    Language.objects.create(country=country, code=language_code, name=language_code)
+    for lang in ('fra', 'spa', 'jpn'):
+        Translation.objects.create(country=country, language_code=lang, official=name, common=name)
+    Demonym.objects.create(country=country, language_code='eng', masculine=name, feminine=name)
+    return country
+
+
+def raw_country(cca2, cca3, name, borders=(), **extra):
+    """A country object as served by restcountries.com"""
+    return {
+        'name': {'common': name, 'official': f'Republic of {name}',
+                 'nativeName': {'eng': {'common': name, 'official': f'Republic of {name}'}}},
+        'cca2': cca2, 'cca3': cca3, 'status': 'officially-assigned', 'region': 'Europe',
+        'continents': ['Europe'], 'latlng': [50.0, 10.0], 'timezones': ['UTC+01:00'], 'population': 1000,
+        'currencies': {'EUR': {'name': 'Euro', 'symbol': '€'}}, 'languages': {'eng': 'English'},
+        'translations': {'fra': {'common': name, 'official': name}},
+        'demonyms': {'eng': {'m': name, 'f': name}}, 'idd': {'root': '+4', 'suffixes': ['9']},
+        'capitalInfo': {'latlng': [52.5, 13.4]}, 'tld': [f'.{cca2.lower()}'], 'borders': list(borders),
+        'flags': {'png': 'https://flags/x.png', 'svg': 'https://flags/x.svg'}, 'flag': '',
+        **extra,
+    }
+
+
+def bulk_ingest(countries, **kwargs):
+    ingest = BulkIngest(**kwargs)
+    for country_data in countries:
+        ingest.add(normalize_country(country_data))
+    return ingest.apply()
+
+
+class BulkIngestTests(TestCase):
+    def setUp(self):
+        self.countries = [
+            raw_country('DE', 'DEU', 'Germany', borders=['FRA']),
+            raw_country('FR', 'FRA', 'France', borders=['DEU']),
+            raw_country('JP', 'JPN', 'Japan'),
+        ]
+
+    def test_second_run_applies_only_the_diff(self):
+        stats = bulk_ingest(self.countries)
+        self.assertEqual(stats['Country'], {'inserted': 3, 'updated': 0, 'deleted': 0, 'unchanged': 0})
+        self.assertEqual(stats['Border'], {'inserted': 2, 'updated': 0, 'deleted': 0, 'unchanged': 0})
+
+        germany, france, _ = self.countries
+        germany['population'] = 2000
+        germany['translations']['fra']['common'] = 'Allemagne'
+        germany['borders'] = []
+        stats = bulk_ingest([germany, france, raw_country('IT', 'ITA', 'Italy')])
+
+        self.assertEqual(stats['Country'], {'inserted': 1, 'updated': 1, 'deleted': 1, 'unchanged': 1})
+        self.assertEqual(stats['Translation'], {'inserted': 1, 'updated': 1, 'deleted': 1, 'unchanged': 0})
+        self.assertEqual(stats['Border'], {'inserted': 0, 'updated': 0, 'deleted': 1, 'unchanged': 0})
+        self.assertEqual(stats['Currency'], {'inserted': 1, 'updated': 0, 'deleted': 1, 'unchanged': 1})
+        self.assertEqual(sorted(Country.objects.values_list('cca2', flat=True)), ['DE', 'FR', 'IT'])
+        self.assertEqual(Country.objects.get(cca2='DE').population, 2000)
+        self.assertEqual(Translation.objects.get(country='DE').common, 'Allemagne')
+        self.assertFalse(Border.objects.filter(country='DE').exists())
+
+    def test_unchanged_run(self):
+        bulk_ingest(self.countries)
+        stats = bulk_ingest(self.countries)
+        self.assertEqual(stats['Country'], {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 3})
+        for model_name, counts in stats.items():
+            self.assertEqual(counts['inserted'] + counts['updated'] + counts['deleted'], 0, model_name)
+
+    def test_force_and_keep_missing(self):
+        bulk_ingest(self.countries)
+        stats = bulk_ingest(self.countries[:1], force=True, prune=False)
+        self.assertEqual(stats['Country'], {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 1})
+        self.assertEqual(stats['Translation'], {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 1})
+        self.assertEqual(Country.objects.count(), 3)
+
+
+class SourceTests(SimpleTestCase):
+    countries = [raw_country('DE', 'DEU', 'Germany'), raw_country('CI', 'CIV', "Côte d'Ivoire"), {'cca2': '}{"\\'}]
+
+    def parse(self, data, chunk_sizes=(1, 7, 4096), **kwargs):
+        results = [list(iter_countries(io.BytesIO(data), chunk_size=size, **kwargs)) for size in chunk_sizes]
+        for result in results[1:]:
+            self.assertEqual(result, results[0])
+        return results[0]
+
+    def test_array(self):
+        data = json.dumps(self.countries, ensure_ascii=False, indent=2).encode('utf-8')
+        self.assertEqual(self.parse(data), self.countries)
+        # Dumps bundling several snapshots
+        self.assertEqual(self.parse(b'[' + data + b',[]]\n' + data), self.countries * 2)
+
+    def test_ndjson(self):
+        data = b'\n'.join(json.dumps(country, ensure_ascii=False).encode('utf-8') for country in self.countries)
+        self.assertEqual(self.parse(data + b'\n'), self.countries)
+
+    def test_gzip_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'countries.json.gz'
+            path.write_bytes(gzip.compress(json.dumps(self.countries).encode('utf-8')))
+            with open_source(str(path)) as (stream, validators):
+                self.assertEqual(list(iter_countries(stream, chunk_size=16)), self.countries)
+            self.assertTrue(validators['etag'] and validators['last_modified'])
+
+    def test_malformed_object_fails_fast(self):
+        data = b'[{"cca2": "DE",}, ' + json.dumps(self.countries * 500).encode('utf-8')[1:]
+        stream = io.BytesIO(data)
+        with self.assertRaisesMessage(SourceError, 'Malformed country object at character 15'):
+            list(iter_countries(stream, chunk_size=64))
+        self.assertLess(stream.tell(), 1024)
+
+    def test_unterminated_object(self):
+        with self.assertRaisesMessage(SourceError, 'Unterminated country object at character 1'):
+            self.parse(b'[{"cca2": "DE"')
+        stream = io.BytesIO(b'[{"cca2": "' + b'x' * 100_000)
+        with self.assertRaisesMessage(SourceError, 'still unterminated after 1000 characters'):
+            list(iter_countries(stream, chunk_size=256, max_object_size=1000))
+        self.assertLess(stream.tell(), 2000)
+
+    def test_unexpected_values(self):
+        with self.assertRaisesMessage(SourceError, "Expected a country object at character 1, got '1'"):
+            self.parse(b'[1]')
+        with self.assertRaisesMessage(SourceError, 'Unterminated JSON array'):
+            self.parse(b'[{"cca2": "DE"}')
+
+
+def write_queries(queries):
+    return [query['sql'] for query in queries if query['sql'].split(None, 1)[0] in ('INSERT', 'UPDATE', 'DELETE')]
+
+
+class FetchCountriesTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'countries.json'
+        self.path.write_text(json.dumps([raw_country('DE', 'DEU', 'Germany'), raw_country('FR', 'FRA', 'France')]))
+
+    def fetch(self, *args, source=None):
+        stdout = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('fetch_countries', '--source', source or str(self.path), *args, stdout=stdout)
+        return stdout.getvalue(), write_queries(queries.captured_queries)
+
+    def test_unchanged_file_is_not_read_again(self):
+        for args in ((), ('--bulk',)):
+            with self.subTest(args=args):
+                SourceState.objects.all().delete()
+                output, writes = self.fetch(*args)
+                self.assertIn('Fetched 2 countries', output)
+                state = SourceState.objects.get(source=str(self.path))
+                stat = self.path.stat()
+                self.assertEqual(state.etag, f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"')
+
+                output, writes = self.fetch(*args)
+                self.assertIn('Source not modified', output)
+                self.assertEqual(writes, [])
+
+    def test_touched_file_skips_unchanged_countries(self):
+        self.fetch('--bulk')
+        os.utime(self.path, ns=(time.time_ns(), time.time_ns() + 10**9))
+        output, writes = self.fetch('--bulk')
+        self.assertIn('Fetched 2 countries', output)
+        self.assertRegex(output, r'Country +0 +0 +0 +2')
+        # Only the new validators are stored
+        self.assertTrue(writes)
+        self.assertTrue(all('countries_sourcestate' in sql for sql in writes), writes)
+        self.assertEqual(SourceState.objects.get().etag.split('-')[1], f'{self.path.stat().st_mtime_ns:x}"')
+
+    def test_force_rewrites_every_country(self):
+        self.fetch('--bulk')
+        output, writes = self.fetch('--bulk', '--force')
+        self.assertIn('Fetched 2 countries', output)
+        self.assertRegex(output, r'Country +0 +0 +0 +2')
+        self.assertRegex(output, r'Translation +0 +0 +0 +2')
+
+    def test_url_not_modified(self):
+        body = self.path.read_bytes()
+        responses = [
+            mock.Mock(status_code=200, raw=io.BytesIO(body), headers={'ETag': '"v1"', 'Last-Modified': 'Sun'}),
+            mock.Mock(status_code=304),
+            mock.Mock(status_code=200, raw=io.BytesIO(body), headers={'ETag': '"v1"', 'Last-Modified': 'Sun'}),
+        ]
+        url = 'https://countries.example/all'
+        with mock.patch('countries.sources.requests.get', side_effect=responses) as get:
+            self.fetch('--bulk', source=url)
+            output, writes = self.fetch('--bulk', source=url)
+            self.assertIn('Source not modified', output)
+            self.assertEqual(writes, [])
+            output, writes = self.fetch('--bulk', '--force', source=url)
+            self.assertRegex(output, r'Country +0 +0 +0 +2')
+        self.assertEqual(get.call_args_list[0].kwargs['headers'], {})
+        self.assertEqual(
+            get.call_args_list[1].kwargs['headers'], {'If-None-Match': '"v1"', 'If-Modified-Since': 'Sun'}
+        )
+        # --force ignores the stored validators
+        self.assertEqual(get.call_args_list[2].kwargs['headers'], {})
+
+
+class IngestPipelineTests(TestCase):
+    def stored_rows(self):
+        return [
+            (row['cca2'], row['population'], [t['common'] for t in row['translations']])
+            for row in CountrySerializer(Country.objects.with_related(), many=True).data
+        ]
+
+    def test_workers(self):
+        countries = [raw_country(f'A{i}', f'AA{i}', f'Country {i}', population=i) for i in range(6)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'countries.json'
+            path.write_text(json.dumps(countries))
+            results = []
+            for args in (('--workers', '2'), ('--workers', '2', '--bulk'), ()):
+                Country.objects.all().delete()
+                stdout = io.StringIO()
+                call_command('fetch_countries', '--source', str(path), '--force', *args, stdout=stdout)
+                self.assertIn('Fetched 6 countries', stdout.getvalue())
+                self.assertRegex(stdout.getvalue(), r'Country +6 +0 +0 +0')
+                results.append(self.stored_rows())
+        self.assertEqual(len(results[0]), 6)
+        self.assertEqual(results[1], results[0])
+        self.assertEqual(results[2], results[0])
+
+    def test_flush_per_batch(self):
+        germany = raw_country('DE', 'DEU', 'Germany')
+        updated = raw_country('DE', 'DEU', 'Germany', population=2000)
+        updated['translations']['spa'] = {'common': 'Alemania', 'official': 'Alemania'}
+        ingest = BulkIngest()
+        pipeline = IngestPipeline(ingest.add, batch_size=2, flush=ingest.flush)
+        # The later copy of DE, in the second batch, diffs against the first one
+        pipeline.run([germany, raw_country('FR', 'FRA', 'France'), updated])
+        stats = ingest.apply()
+        self.assertEqual(stats['Country'], {'inserted': 2, 'updated': 1, 'deleted': 0, 'unchanged': 0})
+        self.assertEqual(stats['Translation'], {'inserted': 3, 'updated': 0, 'deleted': 0, 'unchanged': 1})
+        self.assertEqual(Country.objects.get(cca2='DE').population, 2000)
+
+
+class FailedFetchTests(TransactionTestCase):
+    def test_committed_batches_bump_the_version(self):
+        countries = [raw_country(f'A{i}', f'AA{i}', f'Country {i}') for i in range(120)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'countries.json'
+            path.write_text(json.dumps(countries)[:-1] + ', {"cca2": "XX",}]')
+            for args, stored in ((('--bulk',), 0), ((), 100)):
+                with self.subTest(args=args):
+                    versioning.forget()
+                    version = versioning.current_version()[0]
+                    stdout = io.StringIO()
+                    call_command('fetch_countries', '--source', str(path), *args, stdout=stdout)
+                    self.assertIn('Malformed country object', stdout.getvalue())
+                    self.assertEqual(Country.objects.count(), stored)
+                    versioning.forget()
+                    # Two batches of 50 were committed without --bulk, each with its bump
+                    self.assertEqual(versioning.current_version()[0], version + (2 if stored else 0))
+
+
+@override_settings(COUNTRIES_VERSION_TTL=None)
+class QueryBudgetTests(TestCase):
+    """Every read endpoint has a fixed query budget, independent of the number of countries"""
+
+    # path -> queries allowed when reading straight from the database
+    BUDGETS = {
+        '/api/countries/': 5,
+        '/api/countries/DE/': 5,
+        '/api/countries/DE/regional/': 6,
+        '/api/countries/by_language/?language=deu': 5,
+        '/api/countries/search/?q=an': 5,
+        '/api/countries/batch/?codes=DE,aut,XX,fr': 6,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        make_country('DE', 'DEU', 'Germany', 'Europe', 'deu')
+        make_country('AT', 'AUT', 'Austria', 'Europe', 'deu')
+        make_country('FR', 'FRA', 'France', 'Europe', 'fra')
+        make_country('JP', 'JPN', 'Japan', 'Asia', 'jpn')
+
+    def setUp(self):
+        snapshot.invalidate()
+        # Read the dataset version up front, it is then cached for the whole test
+        versioning.forget()
+        versioning.current_version()
+
+    def assertQueryBudget(self, budget, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, path)
+        self.assertLessEqual(
+            len(queries), budget,
+            f'{path} ran {len(queries)} queries (budget {budget}):\n'
+            + '\n'.join(query['sql'] for query in queries)
+        )
+        return len(queries)
+
+    @override_settings(COUNTRIES_SNAPSHOT=False)
+    def test_database_budget(self):
+        for path, budget in self.BUDGETS.items():
+            with self.subTest(path=path):
+                self.assertQueryBudget(budget, path)
+
+    @override_settings(COUNTRIES_SNAPSHOT=False)
+    def test_database_budget_does_not_grow_with_countries(self):
+        before = {path: self.assertQueryBudget(budget, path) for path, budget in self.BUDGETS.items()}
+        for i in range(5):
+            make_country(f'X{i}', f'XX{i}', f'Extraland {i}', 'Europe', 'deu')
+        for path, budget in self.BUDGETS.items():
+            with self.subTest(path=path):
+                self.assertEqual(self.assertQueryBudget(budget, path), before[path])
+
+    def test_snapshot_budget(self):
+        # Building the snapshot costs one prefetching query set plus the native
+        # names, serving it costs nothing
+        self.assertQueryBudget(6, '/api/countries/')
+        for path in self.BUDGETS:
+            with self.subTest(path=path):
+                self.assertQueryBudget(0, path)
+
+    def test_not_modified_budget(self):
+        for path in self.BUDGETS:
+            with self.subTest(path=path):
+                etag = self.client.get(path)['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(len(queries), 0)
+
+
+class ListShapeTests(TestCase):
+    """Pagination and field selection, identical from the snapshot and the database"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for cca2, cca3, name in (
+            ('AT', 'AUT', 'Austria'), ('BE', 'BEL', 'Belgium'), ('DE', 'DEU', 'Germany'),
+            ('LI', 'LIE', 'Liechtenstein'), ('LU', 'LUX', 'Luxembourg'),
+        ):
+            make_country(cca2, cca3, name, 'Europe', 'deu')
+
+    def setUp(self):
+        snapshot.invalidate()
+        versioning.forget()
+        versioning.current_version()
+
+    def get(self, path, status=200):
+        """The JSON of ``path`` from the snapshot, checked against the database path"""
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, status, path)
+        with override_settings(COUNTRIES_SNAPSHOT=False):
+            self.assertEqual(self.client.get(path).json(), response.json(), path)
+        return response.json()
+
+    def test_pagination(self):
+        for path, expected in (
+            ('/api/countries/?limit=2&offset=1', ['BE', 'DE']),
+            ('/api/countries/DE/regional/?limit=2&offset=2', ['LI', 'LU']),
+            ('/api/countries/by_language/?language=deu&limit=1&offset=4', ['LU']),
+            ('/api/countries/search/?q=stein&limit=5', ['LI']),
+        ):
+            with self.subTest(path=path):
+                page = self.get(path)
+                self.assertEqual([row['cca2'] for row in page['results']], expected)
+                self.assertIn('currencies', page['results'][0])
+        page = self.get('/api/countries/?limit=2&offset=2')
+        self.assertEqual(page['count'], 5)
+        self.assertIn('limit=2&offset=4', page['next'])
+        self.assertIn('limit=2', page['previous'])
+        self.assertEqual(len(self.get('/api/countries/?limit=10000')['results']), 5)
+        # No limit, no envelope
+        self.assertEqual(len(self.get('/api/countries/?offset=2')), 5)
+
+    def test_field_selection(self):
+        rows = self.get('/api/countries/?fields=cca2,common_name')
+        self.assertEqual(rows[0], {'cca2': 'AT', 'common_name': 'Austria'})
+        row = self.get('/api/countries/DE/?exclude=gini,population')
+        self.assertNotIn('gini', row)
+        self.assertNotIn('population', row)
+        for name in CountrySerializer.nested_fields:
+            self.assertNotIn(name, row)
+        row = self.get('/api/countries/DE/?fields=cca2&expand=languages')
+        self.assertEqual(set(row), {'cca2', 'languages'})
+        self.assertEqual(row['languages'][0]['code'], 'deu')
+        row = self.get('/api/countries/DE/regional/?fields=cca2,currencies&limit=1')['results'][0]
+        self.assertEqual(set(row), {'cca2', 'currencies'})
+
+    @override_settings(COUNTRIES_SNAPSHOT=False)
+    def test_field_selection_skips_relation_queries(self):
+        for path, queries in (
+            ('/api/countries/', 5),
+            ('/api/countries/?fields=cca2,common_name', 1),
+            ('/api/countries/?exclude=gini', 1),
+            ('/api/countries/?fields=cca2&expand=languages', 2),
+            ('/api/countries/?fields=cca2,languages,currencies', 3),
+            ('/api/countries/?fields=cca2&limit=2', 2),
+        ):
+            with self.subTest(path=path):
+                with CaptureQueriesContext(connection) as captured:
+                    self.assertEqual(self.client.get(path).status_code, 200)
+                self.assertEqual(len(captured), queries, '\n'.join(query['sql'] for query in captured))
+                prefetched = [query['sql'] for query in captured if 'countries_country' not in query['sql']]
+                self.assertEqual(len(prefetched), queries - (2 if 'limit' in path else 1))
+
+    def test_unknown_fields(self):
+        for path in (
+            '/api/countries/?fields=cca2,capitol',
+            '/api/countries/DE/?exclude=nope',
+            '/api/countries/?expand=gini',
+            '/api/countries/search/?q=a&expand=borders',
+        ):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(all(
+                    message.startswith('Unknown field: ') for message in response.json()['fields']
+                ))
+
+
+class FastJsonTests(TestCase):
+    """The serializer-free path renders exactly the bytes of CountrySerializer + JSONRenderer"""
+
+    PATHS = (
+        '/api/countries/',
+        '/api/countries/CI/',
+        '/api/countries/CI/regional/',
+        '/api/countries/by_language/?language=fra',
+        '/api/countries/?fields=cca2,gini,area,currencies',
+        '/api/countries/CI/?exclude=gini&expand=languages',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        make_country('FR', 'FRA', 'France', 'Europe', 'fra')
+        country = make_country('CI', 'CIV', 'Côte d\'Ivoire', 'Africa', 'fra')
+        # Floats, JSON, nulls, non-ASCII and the separators JSONRenderer escapes
+        Country.objects.filter(cca2='CI').update(
+            area=322463.0, lat=8.0, lng=-5.5, gini={'2015': 41.5}, subregion=None,
+            flag_emoji='🇨🇮', flag_alt='Line\u2028and paragraph\u2029separators',
+        )
+        Currency.objects.create(country=country, code='XOF', name='West African CFA franc', symbol='Fr')
+
+    def setUp(self):
+        snapshot.invalidate()
+
+    def assertRendersLikeSerializer(self, fields=None):
+        queryset = Country.objects.with_related()
+        expected = JSONRenderer().render(CountrySerializer(queryset, many=True, fields=fields).data)
+        self.assertEqual(fastjson.dumps(fastjson.country_rows(Country.objects.all(), fields)), expected)
+
+    def test_rows_match_serializer(self):
+        self.assertRendersLikeSerializer()
+        self.assertRendersLikeSerializer(fields=('cca2', 'common_name', 'gini', 'languages'))
+
+    def test_stdlib_encoder_matches(self):
+        with mock.patch.object(fastjson, 'orjson', None):
+            self.assertRendersLikeSerializer()
+
+    @override_settings(COUNTRIES_SNAPSHOT=False)
+    def test_api_responses_match(self):
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                with override_settings(COUNTRIES_FAST_JSON=False):
+                    expected = self.client.get(path).content
+                with override_settings(COUNTRIES_FAST_JSON=True):
+                    self.assertEqual(self.client.get(path).content, expected)
+
+    @override_settings(COUNTRIES_FAST_JSON=True)
+    def test_snapshot_matches(self):
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                with override_settings(COUNTRIES_SNAPSHOT=False, COUNTRIES_FAST_JSON=False):
+                    expected = self.client.get(path).content
+                snapshot.invalidate()
+                self.assertEqual(self.client.get(path).content, expected)
+
+
+def asgi_get(path):
+    """Status, headers and body of a GET through the project ASGI application"""
+    from contries_info.asgi import application
+    path_info, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path_info, 'raw_path': path_info.encode(),
+        'query_string': query.encode(), 'root_path': '', 'headers': [(b'host', b'testserver')],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async_to_sync(application)(scope, receive, send)
+    headers = {name.decode(): value.decode() for name, value in messages[0]['headers']}
+    return messages[0]['status'], headers, b''.join(message.get('body', b'') for message in messages[1:])
+
+
+def async_request(client, method, path):
+    async def request():
+        return await getattr(client, method)(path)
+    return async_to_sync(request)()
+
+
+class AsyncViewTests(TestCase):
+    PATHS = (
+        '/api/countries/',
+        '/api/countries/FR/',
+        '/api/countries/FR/regional/',
+        '/api/countries/by_language/?language=deu',
+        '/api/countries/search/?q=germ',
+        '/api/countries/FR/?lang=es',
+        # Not found and missing parameters
+        '/api/countries/XX/',
+        '/api/countries/by_language/',
+        '/api/countries/search/',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        make_country('FR', 'FRA', 'France', 'Europe', 'fra')
+        make_country('DE', 'DEU', 'Germany', 'Europe', 'deu')
+        Translation.objects.filter(country='FR', language_code='spa').update(common='Francia')
+
+    def setUp(self):
+        snapshot.invalidate()
+
+    def test_responses_match_sync_api(self):
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                expected = self.client.get(path)
+                response = async_request(self.async_client, 'get', f'/async{path}')
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.content, expected.content)
+
+    def test_async_api_handler(self):
+        middleware = list(settings.MIDDLEWARE)
+        status, headers, body = asgi_get('/async/api/countries/FR/')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, self.client.get('/api/countries/FR/').content)
+        # Set by DatasetCacheMiddleware, the only middleware of the async API
+        self.assertIn('ETag', headers)
+        self.assertEqual(settings.MIDDLEWARE, middleware)
+
+    def test_only_get(self):
+        for method in ('post', 'put', 'delete'):
+            with self.subTest(method=method):
+                response = async_request(self.async_client, method, '/async/api/countries/FR/')
+                self.assertEqual(response.status_code, 405)
+
+    def test_pages_need_login(self):
+        for path in ('/async/web/', '/async/web/countries/FR/'):
+            with self.subTest(path=path):
+                response = async_request(self.async_client, 'get', path)
+                self.assertRedirects(response, f'{settings.LOGIN_URL}?next={path}', fetch_redirect_response=False)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_country('CI', 'CIV', 'Côte d\'Ivoire', 'Africa', 'fra')
+        make_country('DE', 'DEU', 'Germany', 'Europe', 'deu')
+        make_country('NE', 'NER', 'Niger', 'Africa', 'fra')
+        make_country('NG', 'NGA', 'Nigeria', 'Africa', 'eng')
+        NativeName.objects.create(
+            country_id='DE', language_code='deu', common='Deutschland', official='Bundesrepublik Deutschland'
+        )
+        Translation.objects.filter(country='CI', language_code='jpn').update(common='コートジボワール')
+
+    def setUp(self):
+        snapshot.invalidate()
+
+    def search(self, query):
+        return list(get_search_index(snapshot.get_snapshot()).search(query))
+
+    def test_accent_folding(self):
+        self.assertEqual(self.search('cote divoire')[:1], ['CI'])
+        self.assertEqual(self.search('CÔTE')[:1], ['CI'])
+
+    def test_typos(self):
+        self.assertEqual(self.search('germny')[:1], ['DE'])
+
+    def test_translated_and_native_names(self):
+        self.assertEqual(self.search('Deutschland'), ['DE'])
+        self.assertEqual(self.search('bundesrepublik'), ['DE'])
+        self.assertEqual(self.search('コートジボワール'), ['CI'])
+
+    def test_ranking(self):
+        # Exact name, then prefix, then substring
+        self.assertEqual(self.search('niger'), ['NE', 'NG'])
+        self.assertEqual(self.search('ger')[:1], ['DE'])
+        self.assertEqual(set(self.search('ger')), {'DE', 'NE', 'NG'})
+
+    def test_short_queries(self):
+        index = get_search_index(snapshot.get_snapshot())
+        for query in ('g', 'ge', 'vo', 'xq'):
+            with self.subTest(query=query):
+                expected = {
+                    code for code in snapshot.get_snapshot().order
+                    if any(query in term for term, postings in zip(index.terms, index.postings)
+                           for posting_code, _ in postings if posting_code == code)
+                }
+                self.assertEqual(set(self.search(query)), expected)
+        self.assertEqual(self.search('ni')[:2], ['NE', 'NG'])
+
+    @override_settings(COUNTRIES_SNAPSHOT=False)
+    def test_database_fallback(self):
+        for query, expected in (('côte', ['CI']), ('IVOIRE', ['CI']), ('niger', ['NE', 'NG'])):
+            with self.subTest(query=query):
+                response = self.client.get('/api/countries/search/', {'q': query, 'fields': 'cca2'})
+                self.assertEqual(sorted(row['cca2'] for row in response.json()), expected)
+
+
+class BorderGraphTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bulk_ingest([
+            raw_country('DE', 'DEU', 'Germany', borders=['FRA']),
+            raw_country('FR', 'FRA', 'France', borders=['DEU', 'ESP']),
+            raw_country('ES', 'ESP', 'Spain', borders=['FRA']),
+            raw_country('HT', 'HTI', 'Haiti', borders=['DOM']),
+            raw_country('DO', 'DOM', 'Dominican Republic', borders=['HTI']),
+            raw_country('JP', 'JPN', 'Japan'),
+        ])
+        # Only the Border rows count, not the CSV column
+        Country.objects.filter(cca2='JP').update(borders='KOR')
+        Border.objects.filter(country='ES').delete()
+
+    def setUp(self):
+        snapshot.invalidate()
+
+    def test_neighbors(self):
+        response = self.client.get('/api/countries/DE/neighbors/?depth=2')
+        self.assertEqual(
+            [(row['cca2'], row['hops']) for row in response.json()['neighbors']], [('FR', 1), ('ES', 2)]
+        )
+        response = self.client.get('/api/countries/fra/neighbors/')
+        self.assertEqual([row['cca2'] for row in response.json()['neighbors']], ['DE', 'ES'])
+        self.assertEqual(self.client.get('/api/countries/JP/neighbors/').json()['neighbors'], [])
+        self.assertEqual(self.client.get('/api/countries/DE/neighbors/?depth=0').status_code, 400)
+
+    def test_route(self):
+        response = self.client.get('/api/countries/route/?from=ESP&to=de')
+        self.assertEqual(response.json()['hops'], 2)
+        self.assertEqual([row['cca2'] for row in response.json()['path']], ['ES', 'FR', 'DE'])
+        self.assertEqual(self.client.get('/api/countries/route/?from=HT&to=DE').status_code, 404)
+        self.assertEqual(self.client.get('/api/countries/route/?from=JP&to=JP').json()['hops'], 0)
+        self.assertEqual(self.client.get('/api/countries/route/?from=DE').status_code, 400)
+
+    def test_components(self):
+        response = self.client.get('/api/countries/components/')
+        self.assertEqual(
+            [(row['size'], sorted(row['countries'])) for row in response.json()],
+            [(3, ['DE', 'ES', 'FR']), (2, ['DO', 'HT']), (1, ['JP'])],
+        )
+
+    def test_unknown_code(self):
+        for path in ('/api/countries/XX/neighbors/', '/api/countries/route/?from=DE&to=XXX'):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, 404)
+
+
+class CodeLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bulk_ingest([
+            raw_country('DE', 'DEU', 'Germany', tld=['.de', '.eu'], idd={'root': '+4', 'suffixes': ['9']}),
+            raw_country('GB', 'GBR', 'United Kingdom', tld=['.uk'], idd={'root': '+4', 'suffixes': ['4']}),
+            raw_country('CA', 'CAN', 'Canada', tld=['.ca'], idd={'root': '+1', 'suffixes': ['']}),
+            raw_country('US', 'USA', 'United States', tld=['.us'], idd={'root': '+1', 'suffixes': ['201', '202']}),
+        ])
+
+    def setUp(self):
+        snapshot.invalidate()
+
+    def lookup(self, path):
+        codes = [row['cca2'] for row in self.client.get(path).json()]
+        with override_settings(COUNTRIES_SNAPSHOT=False):
+            self.assertEqual([row['cca2'] for row in self.client.get(path).json()], codes)
+        return codes
+
+    def test_by_tld(self):
+        self.assertEqual(self.lookup('/api/countries/by_tld/?tld=.de'), ['DE'])
+        self.assertEqual(self.lookup('/api/countries/by_tld/?tld=EU'), ['DE'])
+        self.assertEqual(self.lookup('/api/countries/by_tld/?tld=.fr'), [])
+        self.assertEqual(self.client.get('/api/countries/by_tld/').status_code, 400)
+
+    def test_by_calling_code(self):
+        for code, expected in (
+            ('+49', ['DE']),
+            ('49', ['DE']),
+            ('+1 (201)', ['US']),
+            # Not a full code: every country with the root
+            ('+4', ['DE', 'GB']),
+            # Canada's full code is the root shared with the US
+            ('+1', ['CA', 'US']),
+            ('+999', []),
+        ):
+            with self.subTest(code=code):
+                path = f'/api/countries/by_calling_code/?{urlencode({"code": code})}'
+                self.assertEqual(sorted(self.lookup(path)), expected)
+        self.assertEqual(self.client.get('/api/countries/by_calling_code/?code=+').status_code, 400)
+
+
+class CodeTablesMigrationTests(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('countries', target)])
+        return executor.loader.project_state(('countries', target)).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_populates_code_tables(self):
+        apps = self.migrate('0003_border_tld_calling_code')
+        Country, IDD = apps.get_model('countries', 'Country'), apps.get_model('countries', 'IDD')
+        for cca2, cca3, borders, tld, root, suffixes in (
+            ('DE', 'DEU', 'FRA,FRA,POL', '.de,.eu', '+4', '9'),
+            ('CA', 'CAN', None, '.ca', '+1', ''),
+            ('AQ', 'ATA', None, None, '', None),
+        ):
+            country = Country.objects.create(
+                cca2=cca2, cca3=cca3, common_name=cca3, official_name=cca3, status='', region='',
+                continent='', timezone='', population=0, flag_emoji='', flag_png='', flag_svg='',
+                borders=borders, tld=tld,
+            )
+            IDD.objects.create(country=country, root=root, suffixes=suffixes)
+
+        apps = self.migrate('0004_populate_border_tld_calling_code')
+        def values(name, *fields):
+            return sorted(apps.get_model('countries', name).objects.values_list(*fields))
+
+        self.assertEqual(values('Border', 'country_id', 'neighbour_cca3'), [('DE', 'FRA'), ('DE', 'POL')])
+        self.assertEqual(values('TopLevelDomain', 'country_id', 'tld'), [('CA', '.ca'), ('DE', '.de'), ('DE', '.eu')])
+        self.assertEqual(values('CallingCode', 'country_id', 'root', 'code'), [('CA', '+1', '+1'), ('DE', '+4', '+49')])
+
+        apps = self.migrate('0003_border_tld_calling_code')
+        self.assertFalse(apps.get_model('countries', 'Border').objects.exists())
+
+
+class SpatialTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bulk_ingest([
+            raw_country('DE', 'DEU', 'Germany', latlng=[51.0, 9.0], capitalInfo={'latlng': [52.52, 13.4]}),
+            raw_country('FR', 'FRA', 'France', latlng=[46.0, 2.0], capitalInfo={'latlng': [48.86, 2.35]}),
+            raw_country('JP', 'JPN', 'Japan', latlng=[36.0, 138.0], capitalInfo={'latlng': [35.68, 139.69]}),
+        ])
+
+    def setUp(self):
+        snapshot.invalidate()
+
+    def codes(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [row['cca2'] for row in response.json()]
+
+    def assertBadRequest(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 400, path)
+        self.assertIsInstance(response.json()['error'], str)
+
+    def test_nearest(self):
+        self.assertEqual(self.codes('/api/countries/nearest/?lat=50&lng=5&k=2'), ['DE', 'FR'])
+        self.assertEqual(self.codes('/api/countries/nearest/?of=fr&k=5'), ['FR', 'DE', 'JP'])
+        response = self.client.get('/api/countries/nearest/?of=DE&point=capital&k=2')
+        self.assertEqual([row['cca2'] for row in response.json()], ['DE', 'FR'])
+        self.assertAlmostEqual(response.json()[1]['distance_km'], 878, delta=5)
+        self.assertEqual(self.client.get('/api/countries/nearest/?of=XX').status_code, 404)
+
+    def test_within(self):
+        self.assertEqual(self.codes('/api/countries/within/?of=DE&radius_km=1000'), ['DE', 'FR'])
+        self.assertEqual(self.codes('/api/countries/within/?of=DE&radius_km=0'), ['DE'])
+        self.assertEqual(self.codes('/api/countries/within/?lat=0&lng=-150&radius_km=100'), [])
+
+    def test_distances(self):
+        data = self.client.get('/api/countries/distances/?codes=DE,fr,XX').json()
+        self.assertEqual((data['point'], data['codes']), ('capital', ['DE', 'FR']))
+        self.assertEqual(data['matrix'][0][0], 0)
+        self.assertAlmostEqual(data['matrix'][0][1], 878, delta=5)
+        data = self.client.get('/api/countries/distances/?point=country').json()
+        self.assertEqual(len(data['matrix']), 3)
+        self.assertEqual(data['matrix'], [list(row) for row in zip(*data['matrix'])])
+
+    def test_bad_parameters(self):
+        for path in (
+            '/api/countries/nearest/?lat=abc&lng=5',
+            '/api/countries/nearest/?lat=50',
+            '/api/countries/nearest/?lat=91&lng=5',
+            '/api/countries/nearest/?lat=50&lng=181',
+            '/api/countries/nearest/?lat=nan&lng=5',
+            '/api/countries/nearest/?of=DE&k=0',
+            '/api/countries/nearest/?of=DE&k=x',
+            '/api/countries/nearest/?of=DE&point=city',
+            '/api/countries/within/?of=DE',
+            '/api/countries/within/?of=DE&radius_km=-1',
+            '/api/countries/within/?of=DE&radius_km=nan',
+            '/api/countries/within/?lat=-91&lng=0&radius_km=10',
+            '/api/countries/distances/?point=city',
+        ):
+            with self.subTest(path=path):
+                self.assertBadRequest(path)
+
+
+class StatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bulk_ingest([
+            raw_country('DE', 'DEU', 'Germany', population=80, area=40.0, gini={'2016': 31.9, '2010': 30.0}),
+            raw_country('FR', 'FRA', 'France', population=60, area=60.0, gini={'2018': 32.4, 'note': 'est.'}),
+            raw_country('JP', 'JPN', 'Japan', region='Asia', population=120, area=None, gini={'n/a': 1}),
+        ])
+
+    def setUp(self):
+        snapshot.invalidate()
+
+    def stats(self, query):
+        response = self.client.get(f'/api/countries/stats/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_latest_gini(self):
+        self.assertEqual(latest_gini({'2010': 30, '2016': 31.9}), (2016, 31.9))
+        self.assertEqual(latest_gini({'2018': 32.4, 'note': 'est.', '': 1}), (2018, 32.4))
+        self.assertEqual(latest_gini({'n/a': 1}), (None, None))
+        self.assertEqual(latest_gini(None), (None, None))
+
+    def test_parse_metrics(self):
+        self.assertEqual(parse_metrics(None), (('population', 'sum'),))
+        self.assertEqual(
+            parse_metrics(' area.mean,gini.max,area.mean'), (('area', 'mean'), ('gini', 'max'))
+        )
+        for text in ('area', 'area.total', 'capital.sum', 'area.sum,'):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                parse_metrics(text)
+
+    def test_totals(self):
+        self.assertEqual(
+            self.stats('metrics=population.sum,area.sum,density.mean,gini.mean'),
+            [{'count': 3, 'population.sum': 260, 'area.sum': 100, 'density.mean': 1.5, 'gini.mean': 32.15}],
+        )
+
+    def test_group_by(self):
+        self.assertEqual(self.stats('group_by=region&metrics=population.sum,area.max,gini.min'), [
+            {'region': 'Asia', 'count': 1, 'population.sum': 120, 'area.max': None, 'gini.min': None},
+            {'region': 'Europe', 'count': 2, 'population.sum': 140, 'area.max': 60, 'gini.min': 31.9},
+        ])
+
+    def test_order_by(self):
+        rows = self.stats('group_by=region&metrics=population.sum,area.sum&order_by=-population.sum')
+        self.assertEqual([row['region'] for row in rows], ['Europe', 'Asia'])
+        # Missing values go last in either direction
+        for order_by in ('area.sum', '-area.sum'):
+            rows = self.stats(f'group_by=region&metrics=area.sum&order_by={order_by}')
+            self.assertEqual([row['region'] for row in rows], ['Europe', 'Asia'])
+        rows = self.stats('group_by=region&order_by=region')
+        self.assertEqual([row['region'] for row in rows], ['Asia', 'Europe'])
+
+    def test_bad_parameters(self):
+        for query in ('group_by=capital', 'metrics=area.total', 'order_by=area.sum'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/countries/stats/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIsInstance(response.json()['error'], str)
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bulk_ingest([
+            raw_country('US', 'USA', 'United States', population=300, flag='🇺🇸'),
+            raw_country('GB', 'GBR', 'United Kingdom', population=60),
+            raw_country('AE', 'ARE', 'United Arab Emirates', population=10),
+            raw_country('DE', 'DEU', 'Germany', population=80,
+                        translations={'fra': {'common': 'Allemagne', 'official': 'Allemagne'}}),
+            raw_country('AW', 'ABW', 'Allentown', population=1),
+            *(raw_country(f'Q{chr(65 + i)}', f'QQ{chr(65 + i)}', f'Uni{i}land', population=i) for i in range(22)),
+        ])
+
+    def setUp(self):
+        snapshot.invalidate()
+
+    def complete(self, query, **params):
+        response = self.client.get('/api/countries/autocomplete/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['cca2'] for row in response.json()]
+
+    def test_prefixes(self):
+        # Names, most populous first, whatever the prefix length
+        self.assertEqual(self.complete('Unit'), ['US', 'GB', 'AE'])
+        self.assertEqual(self.complete('united k'), ['GB'])
+        self.assertEqual(self.complete('UNITED ARAB EMIRATES'), ['AE'])
+        # Translations and codes
+        self.assertEqual(self.complete('allemag'), ['DE'])
+        self.assertEqual(self.complete('deu'), ['DE'])
+        self.assertEqual(self.complete('gb'), ['GB'])
+        self.assertEqual(self.complete('xyz'), [])
+
+    def test_ranking(self):
+        # A common name outranks a translation of a bigger country
+        self.assertEqual(self.complete('alle'), ['AW', 'DE'])
+        # A complete code outranks names
+        self.assertEqual(self.complete('us')[0], 'US')
+        self.assertEqual(self.complete('usa'), ['US'])
+        self.assertEqual(self.complete('qqa'), ['QA'])
+
+    def test_limit(self):
+        self.assertEqual(len(self.complete('uni')), 10)
+        self.assertEqual(len(self.complete('uni', limit=50)), Autocomplete.MAX_RESULTS)
+        self.assertEqual(self.complete('uni', limit=2), ['US', 'GB'])
+        self.assertEqual(self.complete('uni', limit=0), ['US'])
+        self.assertEqual(len(self.complete('uni', limit='many')), 10)
+        self.assertEqual(self.client.get('/api/countries/autocomplete/?q=+').status_code, 400)
+
+    def test_shape(self):
+        response = self.client.get('/api/countries/autocomplete/?q=united+s&lang=fr')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json(), [{'cca2': 'US', 'name': 'United States', 'flag_emoji': '🇺🇸'}])
+
+    @override_settings(COUNTRIES_AUTOCOMPLETE_MAX_AGE=60)
+    def test_http_caching(self):
+        response = self.client.get('/api/countries/autocomplete/?q=ger')
+        self.assertEqual(
+            set(response['Cache-Control'].split(', ')), {'public', 'max-age=60'}
+        )
+        etag = response['ETag']
+        response = self.client.get('/api/countries/autocomplete/?q=ger', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        response = self.client.get('/api/countries/autocomplete/?q=unit', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class BatchLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_country('DE', 'DEU', 'Germany', 'Europe', 'deu')
+        Country.objects.filter(cca2='DE').update(ccn3='276', cioc='GER')
+        make_country('FR', 'FRA', 'France', 'Europe', 'fra')
+
+    def setUp(self):
+        snapshot.invalidate()
+
+    def test_request_order_and_misses(self):
+        path = '/api/countries/batch/?codes=fra,XX,276,GER,de,XX'
+        for enabled in (True, False):
+            with self.subTest(snapshot=enabled), override_settings(COUNTRIES_SNAPSHOT=enabled):
+                snapshot.invalidate()
+                data = self.client.get(path).json()
+                self.assertEqual(
+                    [country and country['cca2'] for country in data['results']],
+                    ['FR', None, 'DE', 'DE', 'DE', None],
+                )
+                self.assertEqual(data['missing'], ['XX'])
+
+    def test_post_with_projection(self):
+        response = self.client.post(
+            '/api/countries/batch/?fields=cca2,common_name', {'codes': ['DEU', 'FR']}, content_type='application/json'
+        )
+        self.assertEqual(response.json(), {
+            'results': [{'cca2': 'DE', 'common_name': 'Germany'}, {'cca2': 'FR', 'common_name': 'France'}],
+            'missing': [],
+        })
+
+
+@override_settings(COUNTRIES_VERSION_TTL=None)
+class LocaleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_country('FR', 'FRA', 'France', 'Europe', 'fra')
+        make_country('DE', 'DEU', 'Germany', 'Europe', 'deu')
+        Translation.objects.filter(country='FR', language_code='fra').update(
+            common='France', official='République française'
+        )
+        Translation.objects.filter(country='DE', language_code='spa').update(
+            common='Alemania', official='República Federal de Alemania'
+        )
+
+    def names(self, path, **headers):
+        response = self.client.get(path, **headers)
+        data = response.json()
+        rows = data if isinstance(data, list) else [data]
+        return response, [(row['common_name'], row['official_name']) for row in rows]
+
+    def test_lang_and_accept_language(self):
+        for enabled, fast in ((True, True), (False, True), (False, False)):
+            with self.subTest(snapshot=enabled, fast_json=fast), override_settings(
+                COUNTRIES_SNAPSHOT=enabled, COUNTRIES_FAST_JSON=fast
+            ):
+                snapshot.invalidate()
+                response, names = self.names('/api/countries/FR/?lang=fr')
+                self.assertEqual(names, [('France', 'République française')])
+                self.assertEqual(response['Content-Language'], 'fr')
+                self.assertIn('Accept-Language', response['Vary'])
+
+                response, names = self.names('/api/countries/', HTTP_ACCEPT_LANGUAGE='es-ES,es;q=0.9')
+                self.assertEqual(names[1], ('Alemania', 'República Federal de Alemania'))
+                self.assertEqual(response['Content-Language'], 'es')
+
+                response, names = self.names('/api/countries/DE/', HTTP_ACCEPT_LANGUAGE='xx, en;q=0.5')
+                self.assertEqual(names, [('Germany', 'Republic of Germany')])
+                self.assertFalse(response.has_header('Content-Language'))
+
+    def test_projection_without_cca2(self):
+        response = self.client.get('/api/countries/DE/?fields=common_name&lang=es')
+        self.assertEqual(response.json(), {'common_name': 'Alemania'})
+
+    def test_etag_varies_by_language(self):
+        path = '/api/countries/DE/'
+        self.assertNotEqual(
+            self.client.get(path, HTTP_ACCEPT_LANGUAGE='es')['ETag'],
+            self.client.get(path, HTTP_ACCEPT_LANGUAGE='de')['ETag'],
+        )
+
+    @override_settings(COUNTRIES_SNAPSHOT=False)
+    def test_no_extra_queries(self):
+        path = '/api/countries/?fields=cca2,common_name'
+        self.client.get(path, HTTP_ACCEPT_LANGUAGE='es')
+        with CaptureQueriesContext(connection) as plain:
+            self.client.get(path)
+        with CaptureQueriesContext(connection) as localized:
+            self.assertEqual(self.client.get(path, HTTP_ACCEPT_LANGUAGE='es').json()[1]['common_name'], 'Alemania')
+        self.assertEqual(len(localized), len(plain))
+
+
+@override_settings(COUNTRIES_VERSION_TTL=None, COUNTRIES_SNAPSHOT=False, CACHES=tiered_caches('pages'))
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_country('DE', 'DEU', 'Germany', 'Europe', 'deu')
+        make_country('AT', 'AUT', 'Austria', 'Europe', 'deu')
+        Country.objects.filter(cca2='DE').update(capital='Berlin')
+        cls.user = User.objects.create_user('viewer')
+
+    def setUp(self):
+        cache.clear()
+        snapshot.invalidate()
+        versioning.forget()
+        self.client.force_login(self.user)
+
+    def test_cached_pages_skip_country_queries(self):
+        for path in ('/web/', '/web/?q=germ', '/web/countries/DE/'):
+            with self.subTest(path=path):
+                first = self.client.get(path)
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(path).content, first.content)
+                # The session and the user
+                self.assertEqual(len(queries), 2, [query['sql'] for query in queries])
+        self.assertContains(first, 'Austria')
+        self.assertContains(self.client.get('/web/'), '<td>Berlin</td>', html=True)
+
+    def test_fragments_are_shared_between_users(self):
+        self.client.get('/web/countries/DE/')
+        self.client.force_login(User.objects.create_user('other'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/web/countries/DE/')
+        self.assertContains(response, 'Welcome, other')
+        # The country is still read for the 404 check; regional countries and languages are not
+        self.assertFalse([query for query in queries if 'countries_language' in query['sql']])
+
+    def test_ingest_retires_cached_pages(self):
+        self.assertContains(self.client.get('/web/'), 'Germany')
+        # What an ingest commits: the change and a new dataset version
+        Country.objects.filter(cca2='DE').update(common_name='Deutschland')
+        versioning.bump()
+        versioning.forget()
+        response = self.client.get('/web/')
+        self.assertContains(response, 'Deutschland')
+        self.assertNotContains(response, 'Germany')
+
+
+@override_settings(CACHES=tiered_caches('tiered', MAX_ENTRIES=2, LOCK_TIMEOUT=5))
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        cache.reset_stats()
+
+    def test_lru_in_front_of_shared(self):
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key.upper())
+        self.assertEqual(cache.get('c'), 'C')
+        # Evicted from the LRU, still in the shared cache
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual(
+            cache.stats(),
+            {'local_hits': 1, 'shared_hits': 1, 'misses': 1, 'evictions': 2, 'entries': 2},
+        )
+
+    @override_settings(CACHES=tiered_caches('expiring', LOCAL_TIMEOUT=0))
+    def test_local_timeout(self):
+        cache.set('a', 'A')
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertEqual(cache.stats()['shared_hits'], 1)
+
+    def test_get_or_set_builds_once_across_threads(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            time.sleep(0.05)
+            return 'page'
+
+        threads = [threading.Thread(target=cache.get_or_set, args=('page', build)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(cache.get('page'), 'page')
+
+    def test_get_or_set_waits_for_another_process(self):
+        # Another process is building the entry
+        caches['shared'].add('page:building', 1)
+
+        def finish():
+            time.sleep(0.1)
+            caches['shared'].set('page', 'built elsewhere')
+            caches['shared'].delete('page:building')
+
+        thread = threading.Thread(target=finish)
+        thread.start()
+        self.assertEqual(cache.get_or_set('page', lambda: 'built here'), 'built elsewhere')
+        thread.join()
+        self.assertEqual(cache.stats()['waits'], 1)
+        self.assertNotIn('builds', cache.stats())
+
+    def test_wait_does_not_block_other_keys(self):
+        caches['shared'].add('page:building', 1)
+        stripe = hash(cache.make_and_validate_key('page')) % _FLIGHT_LOCKS
+        other = next(
+            key for key in (f'other-{i}' for i in range(10000))
+            if hash(cache.make_and_validate_key(key)) % _FLIGHT_LOCKS == stripe
+        )
+        waiting = threading.Thread(target=cache.get_or_set, args=('page', lambda: 'built here'))
+        waiting.start()
+        time.sleep(0.1)
+        # Same lock stripe as the key another process is building
+        started = time.monotonic()
+        self.assertEqual(cache.get_or_set(other, lambda: 'other'), 'other')
+        self.assertLess(time.monotonic() - started, 0.1)
+        caches['shared'].set('page', 'built elsewhere')
+        caches['shared'].delete('page:building')
+        waiting.join()
+        self.assertEqual(cache.get('page'), 'built elsewhere')
+
+    def test_dataset_key(self):
+        self.assertEqual(dataset_key('page', 'list', version=7), 'countries:7:page:list')
+
+
+@override_settings(COUNTRIES_EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for cca2, cca3, name in (('DE', 'DEU', 'Germany'), ('FR', 'FRA', 'France'), ('JP', 'JPN', 'Japan')):
+            make_country(cca2, cca3, name, 'Europe', cca3.lower())
+
+    def setUp(self):
+        snapshot.invalidate()
+
+    def export(self, export_format):
+        response = self.client.get(f'/api/countries/export/?format={export_format}')
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson_lines_match_detail(self):
+        lines = self.export('ndjson').splitlines()
+        self.assertEqual(lines, [self.client.get(f'/api/countries/{cca2}/').content for cca2 in ('DE', 'FR', 'JP')])
+        with override_settings(COUNTRIES_SNAPSHOT=False):
+            self.assertEqual(self.export('ndjson').splitlines(), lines)
+
+    def test_csv_is_flat(self):
+        body = self.export('csv')
+        with override_settings(COUNTRIES_SNAPSHOT=False):
+            self.assertEqual(self.export('csv'), body)
+        columns, *rows = csv.reader(io.StringIO(body.decode('utf-8')))
+        self.assertEqual(len(rows), 3)
+        self.assertIn('translation_spa', columns)
+        self.assertEqual(rows[0][columns.index('currencies')], 'EUR')
+
+
+class ExportStaticTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bulk_ingest([
+            raw_country('DE', 'DEU', 'Germany', languages={'deu': 'German'}),
+            raw_country('AT', 'AUT', 'Austria', languages={'deu': 'German'}),
+            raw_country('JP', 'JPN', 'Japan', region='Asia', languages={'jpn': 'Japanese'}),
+        ])
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+
+    def export(self):
+        # A new dataset version each time, so every run is a new release
+        versioning.bump()
+        versioning.forget()
+        snapshot.invalidate()
+        call_command('export_static', '--output', str(self.root), '--keep', '2', stdout=io.StringIO())
+        return versioning.current_version()[0]
+
+    def test_releases(self):
+        versions = [self.export() for _ in range(3)]
+        current = self.root / 'current'
+        self.assertTrue(current.is_symlink())
+        self.assertFalse(Path(os.readlink(current)).is_absolute())
+        self.assertEqual(current.resolve().parent, (self.root / 'releases').resolve())
+        self.assertEqual(int(current.resolve().name.split('-')[0]), versions[-1])
+        # The oldest release is pruned, --keep 2 counts the new one
+        kept = sorted(int(path.name.split('-')[0]) for path in (self.root / 'releases').iterdir())
+        self.assertEqual(kept, versions[1:])
+
+    def test_release_named_after_the_snapshot_version(self):
+        get_snapshot = snapshot.get_snapshot
+
+        def ingest_after_snapshot():
+            exported = get_snapshot()
+            # An ingest commits right after the export took its snapshot
+            versioning.bump()
+            versioning.forget()
+            return exported
+
+        versioning.bump()
+        versioning.forget()
+        snapshot.invalidate()
+        version = versioning.current_version()[0]
+        with mock.patch.object(snapshot, 'get_snapshot', side_effect=ingest_after_snapshot):
+            call_command('export_static', '--output', str(self.root), stdout=io.StringIO())
+        self.assertEqual(versioning.current_version()[0], version + 1)
+        self.assertTrue((self.root / 'current').resolve().name.startswith(f'{version}-'))
+
+    def test_api_files_match_responses(self):
+        self.export()
+        api = self.root / 'current' / 'api' / 'countries'
+        for path, url in (
+            ('index.json', '/api/countries/'),
+            ('DE/index.json', '/api/countries/DE/'),
+            ('DE/regional/index.json', '/api/countries/DE/regional/'),
+            ('by_language/deu.json', '/api/countries/by_language/?language=deu'),
+            ('by_language/jpn.json', '/api/countries/by_language/?language=jpn'),
+        ):
+            with self.subTest(path=path):
+                content = (api / path).read_bytes()
+                self.assertEqual(content, self.client.get(url).content)
+                gzipped = api / f'{path}.gz'
+                if gzipped.exists():
+                    self.assertEqual(gzip.decompress(gzipped.read_bytes()), content)
+        self.assertIn('Austria', (self.root / 'current' / 'web' / 'index.html').read_text())
+        self.assertIn('Japan', (self.root / 'current' / 'web' / 'countries' / 'JP' / 'index.html').read_text())
+
+
+class DatasetVersionTests(TransactionTestCase):
+    def version(self):
+        return versioning.DatasetVersion.objects.using('default').get(pk=1).version
+
+    def test_one_bump_per_transaction(self):
+        make_country('FR', 'FRA', 'France', 'Europe', 'fra')
+        before = self.version()
+        with transaction.atomic():
+            make_country('DE', 'DEU', 'Germany', 'Europe', 'deu')
+            Country.objects.filter(cca2='FR').get().save()
+        self.assertEqual(self.version(), before + 1)
+
+    def test_rollback_does_not_bump(self):
+        make_country('FR', 'FRA', 'France', 'Europe', 'fra')
+        before = self.version()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            make_country('DE', 'DEU', 'Germany', 'Europe', 'deu')
+            raise RuntimeError
+        self.assertEqual(self.version(), before)
+        # The rolled back bump is no longer pending: the next transaction bumps again
+        with transaction.atomic():
+            make_country('JP', 'JPN', 'Japan', 'Asia', 'jpn')
+        self.assertEqual(self.version(), before + 1)
+
+
+class SnapshotRefreshTests(TransactionTestCase):
+    def setUp(self):
+        snapshot.invalidate()
+        versioning.forget()
+
+    def get(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return int(response['X-Snapshot-Generation']), response.json()
+
+    def test_saves_rebuild_the_snapshot(self):
+        country = make_country('DE', 'DEU', 'Germany', 'Europe', 'deu')
+        generation, data = self.get('/api/countries/DE/')
+        self.assertEqual(data['common_name'], 'Germany')
+        self.assertEqual(self.get('/api/countries/')[0], generation)
+        self.assertEqual(self.get('/api/countries/DE/')[0], generation)
+        # Rows outside the dataset leave the snapshot alone
+        User.objects.create_user('reader')
+        self.assertEqual(self.get('/api/countries/DE/')[0], generation)
+
+        country.common_name = 'Deutschland'
+        country.save()
+        new_generation, data = self.get('/api/countries/DE/')
+        self.assertEqual(new_generation, generation + 1)
+        self.assertEqual(data['common_name'], 'Deutschland')
+        self.assertEqual(self.get('/api/countries/')[1][0]['common_name'], 'Deutschland')
+
+        translation = Translation.objects.get(country=country, language_code='spa')
+        translation.common = 'Alemania'
+        translation.save()
+        generation, data = self.get('/api/countries/DE/')
+        self.assertEqual(generation, new_generation + 1)
+        self.assertEqual(
+            {row['language_code']: row['common'] for row in data['translations']}['spa'], 'Alemania'
+        )
+
+        Currency.objects.filter(country=country).delete()
+        self.assertEqual(self.get('/api/countries/DE/'), (generation + 1, {**data, 'currencies': []}))
+
+
+class ReadReplicaTests(TransactionTestCase):
+    def test_publish_snapshot(self):
+        make_country('FR', 'FRA', 'France', 'Europe', 'fra')
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / 'replica.sqlite3'
+            call_command('publish_snapshot', output=str(output), stdout=mock.Mock())
+            replica = sqlite3.connect(f'{output.as_uri()}?mode=ro&immutable=1', uri=True)
+            try:
+                self.assertEqual(replica.execute('SELECT cca2 FROM countries_country').fetchall(), [('FR',)])
+                version = replica.execute('SELECT version FROM countries_datasetversion').fetchone()[0]
+            finally:
+                replica.close()
+            self.assertEqual(version, versioning.DatasetVersion.objects.using('default').get(pk=1).version)
+            self.assertEqual([path.name for path in Path(directory).iterdir()], ['replica.sqlite3'])
+
+    @override_settings(
+        COUNTRIES_SQLITE_PRAGMAS={'journal_mode': 'wal', 'synchronous': 'normal', 'temp_store': 'memory'},
+        COUNTRIES_REPLICA_PRAGMAS={'mmap_size': 268435456},
+    )
+    def test_replica_pragmas(self):
+        executed = {}
+        for alias in ('default', routers.REPLICA):
+            connection = mock.MagicMock(vendor='sqlite', alias=alias)
+            apply_pragmas(None, connection)
+            cursor = connection.cursor.return_value.__enter__.return_value
+            executed[alias] = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertEqual(executed['default'], [
+            'PRAGMA journal_mode = wal', 'PRAGMA synchronous = normal', 'PRAGMA temp_store = memory',
+        ])
+        # The immutable replica gets no journal or durability settings
+        self.assertEqual(executed[routers.REPLICA], ['PRAGMA temp_store = memory', 'PRAGMA mmap_size = 268435456'])
+
+    @mock.patch('countries.routers.replica_file', return_value=(1, 2, 3))
+    def test_routing(self, replica_file):
+        router = routers.ReadReplicaRouter()
+        self.assertEqual(router.db_for_read(Country), routers.REPLICA)
+        self.assertIsNone(router.db_for_read(User))
+        self.assertEqual(router.db_for_write(Country), 'default')
+        with routers.use_primary():
+            self.assertEqual(router.db_for_read(Country), 'default')
+        self.assertFalse(router.allow_migrate(routers.REPLICA, 'countries'))
+
+    def test_reads_use_default_until_published(self):
+        router = routers.ReadReplicaRouter()
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'replica.sqlite3'
+            replica = {**settings.DATABASES['default'], 'NAME': f'{path.as_uri()}?mode=ro&immutable=1'}
+            with mock.patch.object(routers, '_published', None), \
+                    mock.patch.dict(settings.DATABASES, {routers.REPLICA: replica}), \
+                    override_settings(COUNTRIES_READ_REPLICA=str(path)):
+                self.assertEqual(router.db_for_read(Country), 'default')
+                path.write_bytes(b'')
+                self.assertEqual(router.db_for_read(Country), routers.REPLICA)
@@ -1,12 +1,18 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CountryViewSet, country_list, country_detail, CustomLoginView, get_auth_token
+from .views import (
+    CountryViewSet, country_autocomplete, country_export, country_list, country_detail, CustomLoginView, get_auth_token
+)
 from django.contrib.auth.views import LogoutView 
+from . import async_views
 router = DefaultRouter()
 router.register(r'countries', CountryViewSet, basename='country')
 
 # API endpoints
 urlpatterns = [
+    # Plain Django views, registered ahead of the router's countries/{cca2}/ route
+    path('api/countries/autocomplete/', country_autocomplete, name='country-autocomplete'),
+    path('api/countries/export/', country_export, name='country-export'),
     path('api/', include(router.urls)),
     path('api-auth/', include('rest_framework.urls')),
 ]
@@ -21,3 +27,14 @@ urlpatterns += [
     path('accounts/logout/', LogoutView.as_view(), name='logout'),
     path('accounts/token/', get_auth_token, name='get-token'),
 ]
+
+# Native async read path for ASGI servers, same responses as the sync routes above
+urlpatterns += [
+    path('async/api/countries/', async_views.country_list_api, name='async-country-list'),
+    path('async/api/countries/by_language/', async_views.by_language_api, name='async-country-by-language'),
+    path('async/api/countries/search/', async_views.search_api, name='async-country-search'),
+    path('async/api/countries/<str:cca2>/', async_views.country_retrieve_api, name='async-country-detail'),
+    path('async/api/countries/<str:cca2>/regional/', async_views.regional_api, name='async-country-regional'),
+    path('async/web/', async_views.country_list, name='async-web-country-list'),
+    path('async/web/countries/<str:cca2>/', async_views.country_detail, name='async-web-country-detail'),
+]
@@ -0,0 +1,62 @@
+"""
+Dataset version shared by every process serving the country data.
+
+``DatasetVersion`` is bumped in the same transaction as every change to a
+country or its related rows, ingests included. Processes cache the
+version for ``COUNTRIES_VERSION_TTL`` seconds, so HTTP validators and the
+snapshot freshness check cost at most one indexed read per interval.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DatasetVersion
+
+_lock = threading.Lock()
+_current = None
+_checked_at = 0.0
+
+
+def bump():
+    """Record a change to the dataset; runs inside the writing transaction"""
+    updated = DatasetVersion.objects.filter(pk=1).update(
+        version=F('version') + 1, changed_at=timezone.now()
+    )
+    if not updated:
+        DatasetVersion.objects.create(pk=1, version=1)
+
+
+def _expired(checked_at):
+    ttl = getattr(settings, 'COUNTRIES_VERSION_TTL', 5)
+    return ttl is not None and time.monotonic() - checked_at >= ttl
+
+
+def current_version():
+    """``(version, changed_at)`` of the dataset, re-read at most every COUNTRIES_VERSION_TTL seconds"""
+    global _current, _checked_at
+    current = _current
+    if current is not None and not _expired(_checked_at):
+        return current
+    with _lock:
+        if _current is None or _expired(_checked_at):
+            row = DatasetVersion.objects.filter(pk=1).values_list('version', 'changed_at').first()
+            _current = row or (0, None)
+            _checked_at = time.monotonic()
+        return _current
+
+
+def cached_version():
+    """The cached ``(version, changed_at)`` while it is fresh, else None; never queries"""
+    current = _current
+    if current is None or _expired(_checked_at):
+        return None
+    return current
+
+
+def forget():
+    """Drop the cached version so the next call reads it again"""
+    global _current
+    _current = None
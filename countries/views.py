@@ -1,12 +1,33 @@
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse 
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
 from django.contrib.auth.decorators import login_required
-from .models import Country, Language
-from .serializers import CountrySerializer
+from . import export
+from .cache import dataset_key
+from .codes import get_code_index, query_code_index
+from .models import Country, Language, TopLevelDomain, CallingCode
+from .normalize import normalize_name
+from .pagination import CountryPagination
+from .serializers import CountrySerializer, select_fields
+from . import fastjson, snapshot as country_snapshot
+from .fastjson import country_rows
+from .graph import get_border_graph
+from .locales import content_language, request_locale
+from .search import Autocomplete, get_autocomplete, get_search_index
+from .spatial import POINTS, get_spatial_index
+from .stats import GROUP_BY, get_country_stats, parse_metrics
+from .versioning import current_version
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAuthenticatedOrReadOnly
 
 from django.db.models import Q
 
@@ -25,21 +46,159 @@ def get_auth_token(request):
     return JsonResponse({'token': token.key})
 
 class CountryViewSet(viewsets.ModelViewSet):
-    queryset = Country.objects.all()
+    queryset = Country.objects.with_related()
     serializer_class = CountrySerializer
     permission_classes = [IsAuthenticatedOrReadOnly] 
+    pagination_class = CountryPagination
     lookup_field = 'cca2'
-    
+
+    def get_field_selection(self):
+        """Field names requested through ``fields``/``exclude``/``expand``, or None for all"""
+        if not hasattr(self, '_field_selection'):
+            self._field_selection = (
+                select_fields(self.request.query_params)
+                # A batch POST is a read too
+                if self.request.method in ('GET', 'HEAD') or self.action == 'batch' else None
+            )
+        return self._field_selection
+
+    def get_locale(self):
+        """``(LocaleNames, language)`` for ?lang= / Accept-Language reads, else None"""
+        if not hasattr(self, '_locale'):
+            self._locale = (
+                request_locale(self.request, self.get_snapshot())
+                if self.request.method in ('GET', 'HEAD') or self.action == 'batch' else None
+            )
+        return self._locale
+
+    def localize(self, item):
+        locale = self.get_locale()
+        return item if locale is None else locale[0].localize(item, locale[1])
+
+    def get_queryset(self):
+        selection = self.get_field_selection()
+        if selection is None:
+            return super().get_queryset()
+        # Only load the requested columns and relations
+        nested = [name for name in selection if name in CountrySerializer.nested_fields]
+        columns = [name for name in selection if name not in CountrySerializer.nested_fields]
+        return Country.objects.only('cca2', *columns).prefetch_related(*nested)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_field_selection())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['locale'] = self.get_locale()
+        return context
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        patch_vary_headers(response, ('Accept-Language',))
+        locale = getattr(self, '_locale', None)
+        if locale is not None:
+            response['Content-Language'] = content_language(locale[1])
+        return response
+
+    def list_response(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        if self.use_fast_json():
+            return self.fast_json_response(country_rows(queryset, self.get_field_selection(), self.get_locale()))
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    def use_fast_json(self):
+        return fastjson.is_enabled() and self.request.accepted_renderer.format == 'json'
+
+    def fast_json_response(self, data):
+        """Rows from ``country_rows()`` encoded without the serializer and renderer"""
+        return HttpResponse(fastjson.dumps(data), content_type='application/json')
+
+    def codes_response(self, codes):
+        """List the countries whose cca2 is in ``codes`` (an indexed values_list query)"""
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            return self.snapshot_response(snapshot, snapshot.ordered(codes))
+        return self.list_response(self.get_queryset().filter(cca2__in=codes))
+
+    def project(self, item):
+        item = self.localize(item)
+        selection = self.get_field_selection()
+        if selection is None:
+            return item
+        return {name: item[name] for name in selection}
+
+    def snapshot_json(self, snapshot):
+        """``cca2 -> JSON`` of the snapshot, in the requested language"""
+        locale = self.get_locale()
+        return snapshot.json if locale is None else locale[0].json(snapshot, locale[1])
+
+    def snapshot_response(self, snapshot, codes=None, cca2=None):
+        """Serve pre-serialized countries, as raw JSON bytes when nothing needs reshaping"""
+        raw = self.get_field_selection() is None and self.request.accepted_renderer.format == 'json'
+        if cca2 is not None:
+            response = (
+                HttpResponse(self.snapshot_json(snapshot)[cca2], content_type='application/json') if raw
+                else Response(self.project(snapshot.data[cca2]))
+            )
+        else:
+            page = self.paginate_queryset(snapshot.order if codes is None else codes)
+            if page is not None:
+                response = self.get_paginated_response([self.project(snapshot.data[code]) for code in page])
+            elif raw:
+                locale = self.get_locale()
+                if locale is not None:
+                    body = locale[0].render(snapshot, locale[1], snapshot.order if codes is None else codes)
+                else:
+                    body = snapshot.list_json if codes is None else snapshot.render(codes)
+                response = HttpResponse(body, content_type='application/json')
+            else:
+                codes = snapshot.order if codes is None else codes
+                response = Response([self.project(snapshot.data[code]) for code in codes])
+        response['X-Snapshot-Generation'] = str(snapshot.generation)
+        return response
+
+    def get_snapshot(self, cca2=None):
+        if not country_snapshot.is_enabled():
+            return None
+        snapshot = country_snapshot.get_snapshot()
+        if cca2 is not None and cca2 not in snapshot.data:
+            raise Http404
+        return snapshot
+
+    def list(self, request, *args, **kwargs):
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return super().list(request, *args, **kwargs)
+        return self.snapshot_response(snapshot)
+
+    def retrieve(self, request, *args, **kwargs):
+        snapshot = self.get_snapshot(cca2=kwargs['cca2'])
+        if snapshot is None:
+            if self.use_fast_json():
+                rows = country_rows(
+                    self.get_queryset().filter(cca2=kwargs['cca2']), self.get_field_selection(), self.get_locale()
+                )
+                if not rows:
+                    raise Http404
+                return self.fast_json_response(rows[0])
+            return super().retrieve(request, *args, **kwargs)
+        return self.snapshot_response(snapshot, cca2=kwargs['cca2'])
 
     @action(detail=True, methods=['get'], url_path='regional')
     def regional(self, request, cca2=None):
         """List same regional countries of a specific country"""
-        country = self.get_object()
-        regional_countries = Country.objects.filter(
+        snapshot = self.get_snapshot(cca2=cca2)
+        if snapshot is not None:
+            return self.snapshot_response(snapshot, snapshot.regional(cca2))
+
+        country = get_object_or_404(Country.objects.only('region'), cca2=cca2)
+        regional_countries = self.get_queryset().filter(
             region=country.region
         ).exclude(cca2=cca2)
-        serializer = self.get_serializer(regional_countries, many=True)
-        return Response(serializer.data)
+        return self.list_response(regional_countries)
 
     @action(detail=False, methods=['get'])
     def by_language(self, request):
@@ -51,9 +210,12 @@ class CountryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        countries = Country.objects.filter(languages__code=language_code)
-        serializer = self.get_serializer(countries, many=True)
-        return Response(serializer.data)
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            return self.snapshot_response(snapshot, snapshot.by_language.get(language_code, ()))
+
+        countries = self.get_queryset().filter(languages__code=language_code)
+        return self.list_response(countries)
 
     @action(detail=False, methods=['get'])
     def search(self, request):
@@ -65,28 +227,432 @@ class CountryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        countries = Country.objects.filter(
-            Q(common_name__icontains=query) |
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            return self.snapshot_response(snapshot, get_search_index(snapshot).search(query))
+
+        countries = self.get_queryset().filter(
+            Q(search_name__contains=normalize_name(query)) |
             Q(official_name__icontains=query) |
             Q(alt_spellings__icontains=query)
         )
-        serializer = self.get_serializer(countries, many=True)
-        return Response(serializer.data)
+        return self.list_response(countries)
+
+    @action(detail=False, methods=['get'])
+    def by_tld(self, request):
+        """List countries using a top-level domain"""
+        tld = request.query_params.get('tld', '').strip().lower()
+        if not tld:
+            return Response(
+                {"error": "Top-level domain parameter 'tld' is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not tld.startswith('.'):
+            tld = f'.{tld}'
+        return self.codes_response(
+            TopLevelDomain.objects.filter(tld=tld).values_list('country_id', flat=True)
+        )
+
+    @action(detail=False, methods=['get'])
+    def by_calling_code(self, request):
+        """List countries by full dialing code (+49), or by shared root (+1) when it is one"""
+        digits = re.sub(r'\D', '', request.query_params.get('code', ''))
+        if not digits:
+            return Response(
+                {"error": "Calling code parameter 'code' is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        code = f'+{digits}'
+        matches = list(CallingCode.objects.filter(code=code).values_list('country_id', 'root'))
+        # A full code (+49) stays exact unless it is also a shared root (+1); others (+4) match roots
+        if matches and all(root != code for _, root in matches):
+            return self.codes_response([cca2 for cca2, _ in matches])
+        return self.codes_response(
+            CallingCode.objects.filter(Q(code=code) | Q(root=code)).values_list('country_id', flat=True)
+        )
+
+    @action(detail=False, methods=['get', 'post'], permission_classes=[AllowAny])
+    def batch(self, request):
+        """Look up many cca2/cca3/ccn3/cioc codes at once; results follow the request order"""
+        codes = request.data.get('codes') if request.method == 'POST' else request.query_params.get('codes')
+        if isinstance(codes, str):
+            codes = codes.split(',')
+        if codes is not None and (
+            not isinstance(codes, list) or not all(isinstance(code, str) for code in codes)
+        ):
+            return Response(
+                {"error": "Parameter 'codes' must be a comma-separated string or a list of codes"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        codes = [code.strip() for code in codes or () if code.strip()]
+        if not codes:
+            return Response(
+                {"error": "Parameter 'codes' is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = getattr(settings, 'COUNTRIES_BATCH_MAX_CODES', 1000)
+        if len(codes) > limit:
+            return Response(
+                {"error": f"At most {limit} codes can be looked up at once"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        snapshot = self.get_snapshot()
+        resolved = (get_code_index(snapshot) if snapshot is not None else query_code_index(codes)).resolve(codes)
+        # Unknown codes are null in the results and listed once under missing
+        missing = list(dict.fromkeys(code for code, cca2 in zip(codes, resolved) if cca2 is None))
+
+        if snapshot is not None:
+            if self.get_field_selection() is None and request.accepted_renderer.format == 'json':
+                rendered = self.snapshot_json(snapshot)
+                results = b','.join(b'null' if cca2 is None else rendered[cca2] for cca2 in resolved)
+                body = b'{"results":[' + results + b'],"missing":' + fastjson.dumps(missing) + b'}'
+                response = HttpResponse(body, content_type='application/json')
+            else:
+                response = Response({
+                    'results': [None if cca2 is None else self.project(snapshot.data[cca2]) for cca2 in resolved],
+                    'missing': missing,
+                })
+            response['X-Snapshot-Generation'] = str(snapshot.generation)
+            return response
+
+        found = sorted({cca2 for cca2 in resolved if cca2 is not None})
+        queryset = self.get_queryset().filter(cca2__in=found).order_by('cca2')
+        if self.use_fast_json():
+            rows = country_rows(queryset, self.get_field_selection(), self.get_locale())
+        else:
+            rows = self.get_serializer(queryset, many=True).data
+        by_code = dict(zip(found, rows))
+        data = {'results': [by_code.get(cca2) for cca2 in resolved], 'missing': missing}
+        return self.fast_json_response(data) if self.use_fast_json() else Response(data)
+
+    def graph_country(self, graph, code):
+        cca2 = graph.resolve(code)
+        if cca2 is None:
+            raise Http404
+        return cca2
+
+    @action(detail=True, methods=['get'])
+    def neighbors(self, request, cca2=None):
+        """List countries within ``depth`` land border crossings (default 1)"""
+        graph = get_border_graph(country_snapshot.get_snapshot())
+        cca2 = self.graph_country(graph, cca2)
+        try:
+            depth = int(request.query_params.get('depth', 1))
+        except ValueError:
+            depth = 0
+        if not 1 <= depth <= 20:
+            return Response(
+                {"error": "Parameter 'depth' must be an integer between 1 and 20"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({
+            'country': cca2,
+            'depth': depth,
+            'neighbors': [
+                {'cca2': code, 'cca3': graph.cca3[code], 'common_name': graph.names[code], 'hops': hops}
+                for code, hops in graph.within(cca2, depth)
+            ],
+        })
+
+    @action(detail=False, methods=['get'])
+    def route(self, request):
+        """Shortest land route between two countries (cca2 or cca3 codes)"""
+        source, target = request.query_params.get('from'), request.query_params.get('to')
+        if not source or not target:
+            return Response(
+                {"error": "Parameters 'from' and 'to' are required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        graph = get_border_graph(country_snapshot.get_snapshot())
+        source, target = self.graph_country(graph, source), self.graph_country(graph, target)
+        path = graph.route(source, target)
+        if path is None:
+            return Response(
+                {"error": f"No land route between {source} and {target}"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response({
+            'from': source,
+            'to': target,
+            'hops': len(path) - 1,
+            'path': [{'cca2': code, 'common_name': graph.names[code]} for code in path],
+        })
+
+    @action(detail=False, methods=['get'])
+    def components(self, request):
+        """Groups of countries connected by land, largest first (islands have size 1)"""
+        graph = get_border_graph(country_snapshot.get_snapshot())
+        return Response([
+            {'size': len(members), 'countries': list(members)} for members in graph.components
+        ])
+
+    def spatial_params(self, request, index):
+        """Parse ``point`` and the ``lat``/``lng`` (or ``of=cca2``) centre; ValueError when invalid"""
+        kind = request.query_params.get('point', 'country')
+        if kind not in POINTS:
+            raise ValueError(f"Parameter 'point' must be one of: {', '.join(POINTS)}")
+        of = request.query_params.get('of')
+        if of:
+            centre = index.coordinates(kind, of.upper())
+            if centre is None:
+                raise Http404
+            return kind, centre
+        try:
+            lat, lng = float(request.query_params['lat']), float(request.query_params['lng'])
+        except (KeyError, ValueError):
+            raise ValueError("Numeric parameters 'lat' and 'lng' (or 'of') are required")
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError("Parameters 'lat' and 'lng' are out of range")
+        return kind, (lat, lng)
+
+    def spatial_response(self, index, results):
+        return Response([
+            {'cca2': code, 'common_name': index.names[code], 'distance_km': round(km, 1)}
+            for code, km in results
+        ])
+
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        """The ``k`` countries (or capitals with point=capital) nearest to a point"""
+        index = get_spatial_index(country_snapshot.get_snapshot())
+        try:
+            kind, (lat, lng) = self.spatial_params(request, index)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            k = int(request.query_params.get('k', 5))
+        except ValueError:
+            k = 0
+        if not 1 <= k <= 250:
+            return Response(
+                {"error": "Parameter 'k' must be an integer between 1 and 250"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return self.spatial_response(index, index.nearest(lat, lng, k, kind))
+
+    @action(detail=False, methods=['get'])
+    def within(self, request):
+        """Countries (or capitals with point=capital) within ``radius_km`` of a point"""
+        index = get_spatial_index(country_snapshot.get_snapshot())
+        try:
+            kind, (lat, lng) = self.spatial_params(request, index)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            radius_km = float(request.query_params['radius_km'])
+        except (KeyError, ValueError):
+            radius_km = -1
+        if not radius_km >= 0:
+            return Response(
+                {"error": "Parameter 'radius_km' must be a non-negative number"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return self.spatial_response(index, index.within(lat, lng, radius_km, kind))
+
+    @action(detail=False, methods=['get'])
+    def distances(self, request):
+        """Pairwise great-circle distances in km, between capitals unless point=country"""
+        kind = request.query_params.get('point', 'capital')
+        if kind not in POINTS:
+            return Response(
+                {"error": f"Parameter 'point' must be one of: {', '.join(POINTS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        codes = request.query_params.get('codes')
+        codes = [code.strip().upper() for code in codes.split(',') if code.strip()] if codes else None
+        index = get_spatial_index(country_snapshot.get_snapshot())
+        codes, rows = index.matrix(kind, codes)
+        return Response({
+            'point': kind,
+            'unit': 'km',
+            'codes': codes,
+            'matrix': [[round(km, 1) for km in row] for row in rows],
+        })
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """Aggregate numeric fields, optionally per region, subregion or continent"""
+        group_by = request.query_params.get('group_by') or None
+        if group_by is not None and group_by not in GROUP_BY:
+            return Response(
+                {"error": f"Parameter 'group_by' must be one of: {', '.join(GROUP_BY)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            metrics = parse_metrics(request.query_params.get('metrics'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = get_country_stats(country_snapshot.get_snapshot()).aggregate(metrics, group_by)
+        order_by = request.query_params.get('order_by')
+        if order_by:
+            key = order_by.lstrip('-')
+            if not rows or key not in rows[0]:
+                return Response(
+                    {"error": f"Cannot order by '{key}', it is not part of the result"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            # Missing values go last in either direction
+            present = [row for row in rows if row[key] is not None]
+            present.sort(key=lambda row: row[key], reverse=order_by.startswith('-'))
+            rows = present + [row for row in rows if row[key] is None]
+        return Response({
+            'group_by': group_by,
+            'metrics': [f'{column}.{function}' for column, function in metrics],
+            'results': rows,
+        })
+
+
+@require_GET
+def country_autocomplete(request):
+    """Top-N completions for a name or code prefix, kept off the DRF stack for keystroke traffic"""
+    query = request.GET.get('q', '')
+    if not query.strip():
+        return JsonResponse({"error": "Search query parameter 'q' is required"}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), Autocomplete.MAX_RESULTS)
+    except ValueError:
+        limit = 10
+
+    autocomplete = get_autocomplete(country_snapshot.get_snapshot())
+    body = autocomplete.render(autocomplete.complete(query, limit))
+    # Content-based so every worker agrees on it whatever its snapshot generation
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(
+        response, public=True, max_age=getattr(settings, 'COUNTRIES_AUTOCOMPLETE_MAX_AGE', 300)
+    )
+    return response
+
+@require_GET
+def country_export(request):
+    """Every country as an NDJSON, CSV or Arrow download, streamed chunk by chunk"""
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in export.FORMATS:
+        return JsonResponse(
+            {"error": f"Parameter 'format' must be one of: {', '.join(export.FORMATS)}"}, status=400
+        )
+    if export_format == 'arrow' and export.pyarrow is None:
+        return JsonResponse({"error": "format=arrow needs the pyarrow package on the server"}, status=400)
+
+    snapshot = country_snapshot.get_snapshot() if country_snapshot.is_enabled() else None
+    content_type, extension = export.FORMATS[export_format]
+    response = StreamingHttpResponse(export.STREAMS[export_format](snapshot), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="countries-{current_version()[0]}.{extension}"'
+    return response
+
+def localized(snapshot, codes, locale=None):
+    """Snapshot dicts of ``codes``, with their names in the language of ``locale``"""
+    if locale is None:
+        return [snapshot.data[code] for code in codes]
+    names, language = locale
+    return [names.localize(snapshot.data[code], language) for code in codes]
+
+
+def fragment_context(version, locale=None):
+    """Context the ``{% cache %}`` fragments of the page templates are keyed on"""
+    return {
+        'cache_timeout': getattr(settings, 'COUNTRIES_PAGE_CACHE_TIMEOUT', 300),
+        'cache_version': version,
+        'language': locale[1] if locale else '',
+    }
+
+
+def list_page_context(snapshot, query='', locale=None):
+    """Template context of the country list page, from the snapshot"""
+    codes = get_search_index(snapshot).search(query) if query else snapshot.order
+    return {
+        'countries': localized(snapshot, codes, locale),
+        'query': query,
+        **fragment_context(snapshot.version, locale),
+    }
+
+
+def detail_page_context(snapshot, cca2, locale=None):
+    """Template context of the country detail page, from the snapshot"""
+    country = localized(snapshot, [cca2], locale)[0]
+    return {
+        'country': country,
+        'regional_countries': localized(snapshot, snapshot.regional(cca2), locale),
+        'languages': country['languages'],
+        **fragment_context(snapshot.version, locale),
+    }
+
+
+def localize_instance(country, locale):
+    """Swap the names of a Country instance for those of the language of ``locale``"""
+    localized_names = locale[0].lookup(country.cca2, locale[1]) if locale else None
+    if localized_names is not None:
+        country.common_name, country.official_name = localized_names
+    return country
+
+
+def localize_instances(countries, locale):
+    """Lazily localized Country instances: a queryset behind a cached fragment is never run"""
+    if locale is None:
+        return countries
+    return (localize_instance(country, locale) for country in countries)
+
+
+def cached_page(request, name, locale, render_page):
+    """
+    Full-page cache of a web page for ``COUNTRIES_PAGE_CACHE_TIMEOUT`` seconds.
+
+    Pages greet the user, so entries are per user; the dataset version in
+    the key retires them once an ingest changes the data. Other users still
+    share the page's ``{% cache %}`` fragments.
+    """
+    timeout = getattr(settings, 'COUNTRIES_PAGE_CACHE_TIMEOUT', 300)
+    if not timeout:
+        return render_page()
+    digest = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    key = dataset_key('page', name, request.user.pk, locale[1] if locale else '', digest)
+    # Built once when many clients miss together, e.g. right after an ingest
+    return HttpResponse(cache.get_or_set(key, lambda: render_page().content, timeout))
+
 
 @login_required
 def country_list(request):
     query = request.GET.get('q', '').strip()
-    countries = Country.objects.filter(common_name__icontains=query) if query else Country.objects.all()
-    return render(request, 'countries/country_list.html', {'countries': countries})
+    snapshot = country_snapshot.get_snapshot() if country_snapshot.is_enabled() else None
+    locale = request_locale(request, snapshot)
+
+    def render_page():
+        if snapshot is not None:
+            return render(request, 'countries/country_list.html', list_page_context(snapshot, query, locale))
+        countries = Country.objects.filter(search_name__contains=normalize_name(query)) if query else Country.objects.all()
+        return render(request, 'countries/country_list.html', {
+            'countries': localize_instances(countries, locale),
+            'query': query,
+            **fragment_context(current_version()[0], locale),
+        })
+
+    return cached_page(request, 'list', locale, render_page)
 
 @login_required
 def country_detail(request, cca2):
-    country = get_object_or_404(Country, cca2=cca2)
-    regional_countries = Country.objects.filter(region=country.region).exclude(cca2=cca2)
-    languages = Language.objects.filter(country=country)
-    return render(request, 'countries/country_detail.html', {
-        'country': country,
-        'regional_countries': regional_countries,
-        'languages': languages
-    })
+    snapshot = country_snapshot.get_snapshot() if country_snapshot.is_enabled() else None
+    if snapshot is not None and cca2 not in snapshot.data:
+        raise Http404
+    locale = request_locale(request, snapshot)
+
+    def render_page():
+        if snapshot is not None:
+            return render(request, 'countries/country_detail.html', detail_page_context(snapshot, cca2, locale))
+        country = get_object_or_404(Country, cca2=cca2)
+        regional_countries = Country.objects.filter(region=country.region).exclude(cca2=cca2)
+        languages = Language.objects.filter(country=country)
+        return render(request, 'countries/country_detail.html', {
+            'country': localize_instance(country, locale),
+            'regional_countries': localize_instances(regional_countries, locale),
+            'languages': languages,
+            **fragment_context(current_version()[0], locale),
+        })
+
+    return cached_page(request, 'detail', locale, render_page)
     